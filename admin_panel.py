@@ -1,18 +1,36 @@
-from flask import redirect, url_for
-from flask_admin import Admin, AdminIndexView
+import time
+from datetime import datetime
+
+from flask import abort, flash, redirect, request, send_file, url_for
+from flask_admin import Admin, AdminIndexView, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user, login_required
+from sqlalchemy.orm import defer, with_expression
 
 from app import app, db
-from models import Horoscope, User, UserNatalChart
+from models import DataAccess, Horoscope, User, UserNatalChart
+from ops_dashboard import dashboard
+from profiler import flame_tree, request_profiler
+from search import SEARCH_SOURCES, search_index
+
+dataAccess = DataAccess()
 
 
 class MyAdminIndexView(AdminIndexView):
     """
     Переопределение AdminIndexView для контроля доступа к главной странице
-    админ-панели.
+    админ-панели. Главная страница показывает панель эксплуатации
+    (модуль ops_dashboard).
     """
 
+    @expose('/')
+    def index(self):
+        """
+        Панель эксплуатации: текущие показатели процесса и история всех
+        процессов по минутам.
+        """
+        return self.render('admin/ops_dashboard.html', **dashboard())
+
     @login_required
     def is_accessible(self):
         """
@@ -49,13 +67,414 @@ class MyModelView(ModelView):
         return redirect(url_for('index'))
 
 
+class KeysetModelView(MyModelView):
+    """
+    Представление больших таблиц, список которого не замедляется с ростом
+    таблицы:
+        - большие столбцы (list_deferred) не загружаются в списке, а вместо
+          текста показывается его начало из таблицы поиска (preview_kind);
+        - количество записей не подсчитывается;
+        - при сортировке по id или created_at страницы выбираются по
+          курсору (значению ключа последней показанной записи) вместо
+          OFFSET, поэтому дальние страницы загружаются так же быстро, как
+          первая. При сортировке по другим столбцам используется обычный
+          постраничный вывод.
+
+    Атрибуты:
+        keyset_columns (tuple): Столбцы сортировки с выборкой по курсору.
+        list_deferred (tuple): Столбцы, не загружаемые в списке.
+        preview_kind (str): Вид текстов search.SEARCH_SOURCES для столбца
+                            preview или None.
+        preview_length (int): Длина начала текста в символах.
+    """
+
+    list_template = 'admin/keyset_list.html'
+    simple_list_pager = True
+    column_display_pk = True
+    column_default_sort = ('id', True)
+    column_labels = {'preview': 'Начало текста'}
+    form_excluded_columns = ('preview',)
+
+    keyset_columns = ('id', 'created_at')
+    list_deferred = ()
+    preview_kind = None
+    preview_length = 120
+
+    def get_query(self):
+        """
+        Запрос списка без больших столбцов и с началом текста.
+        """
+        query = super().get_query().options(
+            *(defer(getattr(self.model, name)) for name in self.list_deferred))
+        if self.preview_kind:
+            # Лишний символ показывает, что текст длиннее начала
+            query = query.options(with_expression(
+                self.model.preview,
+                search_index.preview(self.preview_kind,
+                                     self.preview_length + 1)))
+        return query
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        """
+        Возвращает страницу записей. Страница перед курсором выбирается в
+        обратном порядке и переворачивается.
+        """
+        count, data = super().get_list(page, sort_column, sort_desc, search,
+                                       filters, execute, page_size)
+        keyset = self._keyset()
+        if execute and keyset and keyset[2] and keyset[2][0] == 'before':
+            data = data[::-1]
+        return count, data
+
+    def keyset_links(self, data: list, page_size: int) -> dict | None:
+        """
+        Возвращает ссылки на первую, более новую и более старую страницы
+        для шаблона списка.
+
+        Args:
+            data (list): Записи текущей страницы.
+            page_size (int): Размер страницы.
+
+        Returns:
+            Словарь со ссылками first, newer и older (None, если страницы
+            нет) или None, если сортировка не поддерживает курсоры.
+        """
+        keyset = self._keyset()
+        if keyset is None:
+            return None
+        name, _, cursor = keyset
+        direction = cursor[0] if cursor else None
+        full = len(data) == page_size
+        first = self._keyset_url(None) if cursor else None
+        if not data:
+            return {'first': first, 'newer': None, 'older': None}
+        newer = direction == 'after' or (direction == 'before' and full)
+        older = direction == 'before' or full
+        return {
+            'first': first,
+            'newer': newer and self._keyset_url('before', data[0], name),
+            'older': older and self._keyset_url('after', data[-1], name),
+        }
+
+    def _keyset(self):
+        # Столбец и направление сортировки текущего запроса и курсор
+        # (направление, значение столбца, id) или None для сортировки без
+        # курсоров
+        sort = self._get_column_by_idx(request.args.get('sort', type=int))
+        if sort is None:
+            name, descending = self.column_default_sort
+        else:
+            name = sort[0]
+            descending = bool(request.args.get('desc', type=int))
+        if name not in self.keyset_columns:
+            return None
+        return name, descending, self._cursor()
+
+    @staticmethod
+    def _cursor():
+        for direction in ('after', 'before'):
+            raw = request.args.get(direction)
+            if raw:
+                value, _, row_id = raw.rpartition(',')
+                try:
+                    return (direction,
+                            datetime.fromisoformat(value) if value else None,
+                            int(row_id))
+                except ValueError:
+                    return None
+        return None
+
+    def _keyset_url(self, direction, model=None, name=None) -> str:
+        args = request.args.to_dict()
+        for key in ('after', 'before', 'page'):
+            args.pop(key, None)
+        if direction:
+            value = getattr(model, name) if name != 'id' else None
+            args[direction] = (f'{value.isoformat() if value else ""},'
+                               f'{model.id}')
+        return self.get_url('.index_view', **args)
+
+    def _keyset_condition(self, name, value, row_id, descending):
+        # NULL считается меньше любого значения, как в SQLite и MySQL
+        key = self.model.id
+        if name == 'id':
+            return key < row_id if descending else key > row_id
+        column = getattr(self.model, name)
+        if descending:
+            if value is None:
+                return db.and_(column.is_(None), key < row_id)
+            return db.or_(column < value,
+                          db.and_(column == value, key < row_id),
+                          column.is_(None))
+        if value is None:
+            return db.or_(column.is_not(None), key > row_id)
+        return db.or_(column > value, db.and_(column == value, key > row_id))
+
+    def _apply_sorting(self, query, joins, sort_column, sort_desc):
+        keyset = self._keyset()
+        if keyset is None:
+            return super()._apply_sorting(query, joins, sort_column,
+                                          sort_desc)
+        name, descending, cursor = keyset
+        if cursor:
+            descending ^= cursor[0] == 'before'
+            query = query.filter(self._keyset_condition(
+                name, cursor[1], cursor[2], descending))
+        columns = [getattr(self.model, name)]
+        if name != 'id':
+            # id различает записи с одинаковым значением столбца сортировки
+            columns.append(self.model.id)
+        query = query.order_by(*(column.desc() if descending else column.asc()
+                                 for column in columns))
+        return query, joins
+
+    def _apply_pagination(self, query, page, page_size):
+        keyset = self._keyset()
+        if keyset and keyset[2]:
+            page = 0
+        return super()._apply_pagination(query, page, page_size)
+
+    def _get_list_extra_args(self):
+        # Курсор не переносится в ссылки сортировки, поиска и фильтров:
+        # они открывают первую страницу
+        view_args = super()._get_list_extra_args()
+        view_args.extra_args.pop('after', None)
+        view_args.extra_args.pop('before', None)
+        return view_args
+
+
+def format_preview(view, context, model, name):
+    """
+    Форматирует начало текста для списка, отмечая сокращённый текст.
+    """
+    if model.preview is None:
+        return ''
+    if len(model.preview) > view.preview_length:
+        return model.preview[:view.preview_length] + '…'
+    return model.preview
+
+
+class HoroscopeView(KeysetModelView):
+    """
+    Представление гороскопов, сбрасывающее кэш гороскопа при его изменении
+    или удалении администратором.
+    """
+
+    column_list = ('id', 'period', 'zodiac_sign', 'date', 'created_at',
+                   'preview')
+    column_sortable_list = ('id', 'date', 'created_at')
+    column_formatters = {'preview': format_preview}
+    list_deferred = ('horoscope',)
+    preview_kind = 'horoscope'
+
+    @staticmethod
+    def previous(model, name):
+        """
+        Возвращает значение поля модели до его изменения в форме.
+        """
+        history = db.inspect(model).attrs[name].history
+        return history.deleted[0] if history.deleted else getattr(model, name)
+
+    @staticmethod
+    def invalidate(period, date, zodiac_sign):
+        """
+        Сбрасывает кэш гороскопа и предупреждает администратора, если
+        гороскоп не удалось удалить из общего кэша.
+        """
+        if not dataAccess.invalidate_horoscope(period, date, zodiac_sign):
+            flash('Общий кэш недоступен: до конца периода гороскопа '
+                  'пользователи могут видеть прежний текст', 'warning')
+
+    def on_model_change(self, form, model, is_created):
+        """
+        Сбрасывает кэш для прежних значений ключа гороскопа до сохранения.
+        """
+        if not is_created:
+            self.invalidate(
+                self.previous(model, 'period'),
+                self.previous(model, 'date'),
+                self.previous(model, 'zodiac_sign'),
+            )
+
+    def after_model_change(self, form, model, is_created):
+        """
+        Сбрасывает кэш для сохранённого гороскопа.
+        """
+        self.invalidate(model.period, model.date, model.zodiac_sign)
+
+    def after_model_delete(self, model):
+        """
+        Сбрасывает кэш для удалённого гороскопа.
+        """
+        self.invalidate(model.period, model.date, model.zodiac_sign)
+
+
+class UserNatalChartView(KeysetModelView):
+    """
+    Представление натальных карт пользователей.
+    """
+
+    column_list = ('id', 'user_id', 'created_at', 'preview')
+    column_sortable_list = ('id', 'user_id', 'created_at')
+    column_formatters = {'preview': format_preview}
+    list_deferred = ('natal_chart',)
+    preview_kind = 'natal_chart'
+
+
+class UserView(KeysetModelView):
+    """
+    Представление пользователей, сбрасывающее кэш load_user при изменении
+    или удалении пользователя администратором.
+    """
+
+    column_exclude_list = ('password',)
+    column_sortable_list = ('id', 'login', 'email', 'created_at')
+    list_deferred = ('password',)
+
+    def after_model_change(self, form, model, is_created):
+        """
+        Сбрасывает кэш изменённого пользователя.
+        """
+        dataAccess.invalidate_user(model.id)
+
+    def after_model_delete(self, model):
+        """
+        Сбрасывает кэш удалённого пользователя.
+        """
+        dataAccess.invalidate_user(model.id)
+
+
+class SearchView(BaseView):
+    """
+    Полнотекстовый поиск фразы в гороскопах и натальных картах с
+    результатами по убыванию релевантности и ссылками на редактирование.
+    """
+
+    # Названия видов текстов и представлений для их редактирования
+    kinds = {'horoscope': 'Гороскоп', 'natal_chart': 'Натальная карта'}
+    endpoints = {'horoscope': 'horoscope', 'natal_chart': 'usernatalchart'}
+
+    @login_required
+    def is_accessible(self):
+        """
+        Проверка доступа текущего пользователя к поиску.
+        """
+        return current_user.is_authenticated and current_user.login == 'Admin'
+
+    def inaccessible_callback(self, name, **kwargs):
+        """
+        Перенаправление на страницу входа, если пользователь не авторизован
+        или не является администратором.
+        """
+        return redirect(url_for('authorization'))
+
+    @expose('/')
+    def index(self):
+        """
+        Страница поиска: форма и результаты для фразы из параметра q.
+        """
+        query = request.args.get('q', '').strip()
+        kind = request.args.get('kind')
+        kind = kind if kind in SEARCH_SOURCES else None
+        started = time.perf_counter()
+        results = search_index.search(query, kind) if query else []
+        elapsed = (time.perf_counter() - started) * 1000
+        return self.render('admin/search.html', query=query, kind=kind,
+                           kinds=self.kinds, endpoints=self.endpoints,
+                           results=results, elapsed=elapsed)
+
+
+class ProfilerView(BaseView):
+    """
+    Профилирование запросов: включение выборочного профилировщика для
+    следующих запросов к маршруту и просмотр сохранённых результатов
+    (модуль profiler).
+    """
+
+    @login_required
+    def is_accessible(self):
+        """
+        Проверка доступа текущего пользователя к профилированию.
+        """
+        return current_user.is_authenticated and current_user.login == 'Admin'
+
+    def inaccessible_callback(self, name, **kwargs):
+        """
+        Перенаправление на страницу входа, если пользователь не авторизован
+        или не является администратором.
+        """
+        return redirect(url_for('authorization'))
+
+    @expose('/')
+    def index(self):
+        """
+        Задание профилирования и список сохранённых результатов.
+        """
+        routes = sorted({rule.rule for rule in app.url_map.iter_rules()
+                         if rule.endpoint != 'static'})
+        return self.render('admin/profiler.html',
+                           armed=request_profiler.armed(),
+                           header=request_profiler.header, routes=routes,
+                           profiles=request_profiler.profiles())
+
+    @expose('/arm', methods=('POST',))
+    def arm(self):
+        """
+        Включает выборочный профилировщик для следующих запросов к
+        маршруту.
+        """
+        route = request.form.get('route', '').strip()
+        count = request.form.get('count', type=int)
+        if not route or not count or count < 1:
+            flash('Укажите маршрут и количество запросов', 'error')
+        else:
+            request_profiler.arm(route, count)
+            flash(f'Профилируются следующие {count} запросов к {route}')
+        return redirect(url_for('.index'))
+
+    @expose('/disarm', methods=('POST',))
+    def disarm(self):
+        """
+        Выключает выборочный профилировщик.
+        """
+        request_profiler.disarm()
+        return redirect(url_for('.index'))
+
+    @expose('/view/<filename>')
+    def view(self, filename):
+        """
+        Результат профилирования: flame graph стеков или таблица cProfile.
+        """
+        if request_profiler.result_path(filename) is None:
+            abort(404)
+        if filename.endswith('.prof'):
+            return self.render('admin/profile.html', name=filename, tree=None,
+                               stats=request_profiler.read_stats(filename))
+        tree = flame_tree(request_profiler.read_stacks(filename))
+        return self.render('admin/profile.html', name=filename, stats=None,
+                           tree=tree)
+
+    @expose('/download/<filename>')
+    def download(self, filename):
+        """
+        Отдаёт файл результата для flamegraph.pl, speedscope или pstats.
+        """
+        path = request_profiler.result_path(filename)
+        if path is None:
+            abort(404)
+        return send_file(path, as_attachment=True)
+
+
 admin = Admin(app, name='Административная панель', template_mode='bootstrap3',
               index_view=MyAdminIndexView())
 
-admin.add_view(MyModelView(User, db.session, name='Пользователи'))
-admin.add_view(MyModelView(UserNatalChart, db.session,
-                           name='Натальные карты пользователей'))
-admin.add_view(MyModelView(Horoscope, db.session, name='Гороскопы'))
+admin.add_view(UserView(User, db.session, name='Пользователи'))
+admin.add_view(UserNatalChartView(UserNatalChart, db.session,
+                                  name='Натальные карты пользователей'))
+admin.add_view(HoroscopeView(Horoscope, db.session, name='Гороскопы'))
+admin.add_view(SearchView(name='Поиск по текстам', endpoint='search'))
+admin.add_view(ProfilerView(name='Профилирование', endpoint='profiler'))
 
 
 @app.route('/admin')
@@ -15,7 +15,53 @@
     TOASTR_SHOW_METHOD (str): Метод отображения всплывающих уведомлений Toastr.
     TOASTR_TIMEOUT (int): Время отображения уведомлений в миллисекундах.
     UPLOAD_FOLDER (str): Конфигурация директории для загружаемых файлов.
+    DB_PROFILE (str): Профиль подключения к базе данных: 'dev' (SQLite) или
+    'prod' (MySQL), по умолчанию по диалекту SQLALCHEMY_DATABASE_URI.
+    SQLALCHEMY_ENGINE_OPTIONS (dict): Параметры пула соединений профиля.
+    SQLALCHEMY_BINDS (dict): Реплики базы данных для запросов на чтение.
+    DB_STICKY_SECONDS (int): Время после изменения данных пользователем, в
+    течение которого его запросы на чтение идут на основную базу.
     MAX_CONTENT_LENGTH (int): Максимальный размер загружаемого файла в байтах.
+    GAZETTEER_PATH (str): Путь к офлайн-справочнику городов.
+    HOROSCOPE_CACHE_SIZE (int): Максимальное число гороскопов в кэше процесса.
+    CACHE_L2_BACKEND (str): Общий для процессов кэш: 'sqlite', 'redis' или 'none'.
+    CACHE_L2_URL (str): Путь к файлу SQLite или адрес Redis для общего кэша.
+    CACHE_L1_TTL (int): Максимальное время жизни записи в кэше процесса, сек.
+    HOROSCOPE_REFRESH_WORKERS (int): Потоки фонового создания гороскопов.
+    COMPRESSION_ENABLED (bool): Сжимать новые длинные тексты в БД. Включается
+    после перевода столбцов на двоичный тип командой compress-texts.
+    COMPRESSION_METHOD (str): Сжатие длинных текстов в БД: 'zstd' или 'zlib'.
+    COMPRESSION_LEVEL (int): Уровень сжатия длинных текстов.
+    COMPRESSION_DICT_PATH (str): Путь к общему словарю сжатия текстов.
+    HOROSCOPE_RETENTION_DAYS (int): Срок хранения гороскопов в основной
+    таблице в днях, после которого они переносятся в архив.
+    HOROSCOPE_ARCHIVE (str): Хранилище архива гороскопов: 'table' или 'jsonl'.
+    HOROSCOPE_ARCHIVE_PATH (str): Каталог файлов архива гороскопов.
+    PASSWORD_HASH_METHOD (str): Способ и параметры хеширования паролей в
+    формате werkzeug.security, например 'scrypt:32768:8:1'.
+    PASSWORD_WORKERS (int): Количество одновременных проверок паролей.
+    PASSWORD_QUEUE_SIZE (int): Количество проверок паролей в очереди.
+    PASSWORD_QUEUE_TIMEOUT (float): Время ожидания места в очереди проверки
+    паролей, сек.
+    USER_CACHE_SIZE (int): Максимальное число пользователей в кэше процесса.
+    USER_CACHE_TTL (int): Время жизни пользователя в кэше процесса, сек.
+    OPS_BUFFER_SIZE (int): Количество последних замеров каждого вида в
+    памяти процесса для панели эксплуатации.
+    OPS_WINDOW_SECONDS (int): Скользящее окно текущих показателей панели
+    эксплуатации, сек.
+    OPS_FLUSH_SECONDS (int): Период сохранения показателей процесса в базу
+    данных, сек.
+    OPS_HISTORY_HOURS (int): Срок хранения сохранённых показателей, ч.
+    METRICS_TOKEN (str): Токен доступа к метрикам /metrics. Пока токен не
+    задан, /metrics закрыт (код 403).
+    PROFILE_PATH (str): Каталог результатов профилирования запросов.
+    PROFILE_INTERVAL (float): Промежуток между снимками стека выборочного
+    профилировщика, сек.
+    PROFILE_HEADER (str): Заголовок запроса администратора, включающий
+    cProfile для этого запроса.
+    PROFILE_KEEP (int): Количество хранимых результатов профилирования.
+    ARTIFACTS_REBUILD (bool): Пересоздавать в фоне натальную карту и прогнозы
+    пользователя после изменения его данных рождения.
 
 Атрибуты:
     app (Flask): Экземпляр приложения Flask.
@@ -33,24 +79,109 @@ from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_toastr import Toastr
 
+from db_engines import configure_engines, default_profile, engine_options
+from db_routing import RoutingSession, replica_binds
+
 # Инициализация объекта приложения Flask
 app = Flask(__name__)
 
 # Конфигурация приложения
 app.config["SECRET_KEY"] = str(uuid.uuid4())
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DB")
+# Профиль пула соединений и настроек базы данных
+app.config["DB_PROFILE"] = os.getenv(
+    "DB_PROFILE", default_profile(app.config["SQLALCHEMY_DATABASE_URI"]))
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+    app.config["DB_PROFILE"], app.config["SQLALCHEMY_DATABASE_URI"], {
+        option: int(os.environ[name]) for option, name in (
+            ("pool_size", "DB_POOL_SIZE"),
+            ("max_overflow", "DB_MAX_OVERFLOW"),
+            ("pool_timeout", "DB_POOL_TIMEOUT"),
+            ("pool_recycle", "DB_POOL_RECYCLE"),
+        ) if os.getenv(name)
+    })
+# Реплики для запросов на чтение (адреса через запятую)
+app.config["SQLALCHEMY_BINDS"] = replica_binds(os.getenv("DB_REPLICAS"))
+app.config["DB_STICKY_SECONDS"] = int(os.getenv("DB_STICKY_SECONDS", 5))
 
 # Инициализация расширений Flask
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+configure_engines(app, db)
 manager = LoginManager(app)
 toastr = Toastr(app)
 app.config["TOASTR_SHOW_METHOD"] = "show"
 app.config["TOASTR_TIMEOUT"] = 4000
 
-toolbar = DebugToolbarExtension(app)
+# Панель отладки подключается только в режиме отладки, чтобы не замедлять
+# обработку запросов в рабочем окружении
+toolbar = DebugToolbarExtension(app) if app.debug else None
 
 # Конфигурация загрузки файлов
 UPLOAD_FOLDER = "static/uploads"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif",}
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 3 * 1024 * 1024
+
+# Офлайн-справочник городов для автодополнения места рождения
+app.config["GAZETTEER_PATH"] = os.getenv(
+    "GAZETTEER_PATH", os.path.join(app.root_path, "data", "cities.tsv"))
+
+# Кэш гороскопов в памяти процесса
+app.config["HOROSCOPE_CACHE_SIZE"] = int(os.getenv("HOROSCOPE_CACHE_SIZE", 1024))
+
+# Общий для всех процессов кэш второго уровня
+app.config["CACHE_L2_BACKEND"] = os.getenv("CACHE_L2_BACKEND", "sqlite")
+app.config["CACHE_L2_URL"] = os.getenv(
+    "CACHE_L2_URL",
+    os.path.join(app.root_path, "data", "starpower_cache.db"))
+app.config["CACHE_L1_TTL"] = int(os.getenv("CACHE_L1_TTL", 60))
+
+# Фоновое создание гороскопов при смене периода
+app.config["HOROSCOPE_REFRESH_WORKERS"] = int(
+    os.getenv("HOROSCOPE_REFRESH_WORKERS", 4))
+
+# Срок хранения и архив гороскопов
+app.config["HOROSCOPE_RETENTION_DAYS"] = int(
+    os.getenv("HOROSCOPE_RETENTION_DAYS", 90))
+app.config["HOROSCOPE_ARCHIVE"] = os.getenv("HOROSCOPE_ARCHIVE", "table")
+app.config["HOROSCOPE_ARCHIVE_PATH"] = os.getenv(
+    "HOROSCOPE_ARCHIVE_PATH", os.path.join(app.root_path, "data", "archive"))
+
+# Фоновое пересоздание производных данных пользователя
+app.config["ARTIFACTS_REBUILD"] = os.getenv("ARTIFACTS_REBUILD", "0") == "1"
+
+# Сжатие длинных текстов (натальные карты, гороскопы, прогнозы) в БД
+app.config["COMPRESSION_ENABLED"] = os.getenv("COMPRESSION_ENABLED",
+                                              "0") == "1"
+app.config["COMPRESSION_METHOD"] = os.getenv("COMPRESSION_METHOD", "zstd")
+app.config["COMPRESSION_LEVEL"] = int(os.getenv("COMPRESSION_LEVEL", 9))
+app.config["COMPRESSION_DICT_PATH"] = os.getenv(
+    "COMPRESSION_DICT_PATH", os.path.join(app.root_path, "data", "texts.dict"))
+
+# Хеширование паролей
+app.config["PASSWORD_HASH_METHOD"] = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+app.config["PASSWORD_WORKERS"] = int(
+    os.getenv("PASSWORD_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+app.config["PASSWORD_QUEUE_SIZE"] = int(os.getenv("PASSWORD_QUEUE_SIZE", 32))
+app.config["PASSWORD_QUEUE_TIMEOUT"] = float(
+    os.getenv("PASSWORD_QUEUE_TIMEOUT", 5))
+
+# Кэш пользователей для load_user
+app.config["USER_CACHE_SIZE"] = int(os.getenv("USER_CACHE_SIZE", 4096))
+app.config["USER_CACHE_TTL"] = int(os.getenv("USER_CACHE_TTL", 30))
+
+# Показатели панели эксплуатации
+app.config["OPS_BUFFER_SIZE"] = int(os.getenv("OPS_BUFFER_SIZE", 10000))
+app.config["OPS_WINDOW_SECONDS"] = int(os.getenv("OPS_WINDOW_SECONDS", 900))
+app.config["OPS_FLUSH_SECONDS"] = int(os.getenv("OPS_FLUSH_SECONDS", 60))
+app.config["OPS_HISTORY_HOURS"] = int(os.getenv("OPS_HISTORY_HOURS", 24))
+
+# Метрики Prometheus
+app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+
+# Профилирование запросов из админ-панели
+app.config["PROFILE_PATH"] = os.getenv(
+    "PROFILE_PATH", os.path.join(app.root_path, "data", "profiles"))
+app.config["PROFILE_INTERVAL"] = float(os.getenv("PROFILE_INTERVAL", 0.005))
+app.config["PROFILE_HEADER"] = os.getenv("PROFILE_HEADER", "X-Profile")
+app.config["PROFILE_KEEP"] = int(os.getenv("PROFILE_KEEP", 200))
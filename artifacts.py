@@ -0,0 +1,246 @@
+"""
+Модуль реестра производных данных пользователя.
+
+Натальная карта, прогнозы и рассчитанные транзиты пользователя зависят от
+отдельных полей его профиля (даты и времени рождения, места рождения).
+Каждый вид производных данных регистрируется в реестре вместе со списком
+полей, от которых он зависит, функцией удаления и, если возможно, функцией
+пересоздания. После сохранения профиля удаляются только те данные, входные
+поля которых действительно изменились, поэтому смена телефона или аватара
+не приводит к повторному дорогому созданию натальной карты.
+
+Классы:
+    DerivedArtifact: Вид производных данных и его входные поля.
+    ArtifactRegistry: Реестр производных данных пользователя.
+
+Функции:
+    rebuild_natal_chart(user) -> None: Пересоздаёт натальную карту.
+    rebuild_tranzit(user) -> None: Пересоздаёт прогноз транзитов на месяц.
+    rebuild_tranzit_alerts(user) -> None: Пересчитывает точные транзиты.
+
+Атрибуты:
+    BIRTH_DATA (tuple): Поля даты и времени рождения.
+    BIRTH_PLACE (tuple): Поля места рождения.
+    artifacts (ArtifactRegistry): Реестр производных данных приложения.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from threading import Lock
+from typing import Callable
+
+from app import app
+from horoscope_logic_pro import GetNatalChart2, TranzitMonth
+from models import DataAccess, User
+from natal_snapshot import rebuild_snapshot
+from tranzit_alerts import build_user_tranzit_alerts
+
+BIRTH_DATA = ('birthday', 'birth_time')
+BIRTH_PLACE = ('city', 'latitude', 'longitude')
+
+dataAccess = DataAccess()
+
+
+class DerivedArtifact:
+    """
+    Вид производных данных пользователя.
+
+    Args:
+        name (str): Название вида данных.
+        fields (tuple): Поля пользователя, от которых зависят данные.
+        invalidate (Callable): Функция удаления данных по идентификатору
+                               пользователя.
+        rebuild (Callable): Функция пересоздания данных по пользователю или
+                            None, если данные создаются только по запросу.
+    """
+
+    def __init__(self, name: str, fields: tuple,
+                 invalidate: Callable[[int], None],
+                 rebuild: Callable[[User], None] | None = None) -> None:
+        self.name = name
+        self.fields = frozenset(fields)
+        self.invalidate = invalidate
+        self.rebuild = rebuild
+
+
+class ArtifactRegistry:
+    """
+    Реестр производных данных пользователя.
+
+    Args:
+        workers (int): Количество потоков фонового пересоздания.
+
+    Методы:
+        register(self, name, fields, invalidate, rebuild=None) -> None:
+            Регистрирует вид производных данных.
+
+        inputs(self, user) -> dict:
+            Возвращает значения всех входных полей пользователя.
+
+        changed(self, before, user) -> set:
+            Возвращает изменившиеся входные поля.
+
+        invalidate(self, user, before, rebuild=False) -> list[str]:
+            Удаляет производные данные, зависящие от изменившихся полей, и
+            при необходимости пересоздаёт их в фоне.
+
+        rebuild(self, user_id, names) -> None:
+            Пересоздаёт производные данные пользователя.
+    """
+
+    def __init__(self, workers: int = 2) -> None:
+        self._artifacts = []
+        self._workers = workers
+        self._executor = None
+        self._lock = Lock()
+
+    def register(self, name: str, fields: tuple,
+                 invalidate: Callable[[int], None],
+                 rebuild: Callable[[User], None] | None = None) -> None:
+        """
+        Регистрирует вид производных данных.
+
+        Args:
+            name (str): Название вида данных.
+            fields (tuple): Поля пользователя, от которых зависят данные.
+            invalidate (Callable): Функция удаления данных.
+            rebuild (Callable): Функция пересоздания данных.
+        """
+        self._artifacts.append(DerivedArtifact(name, fields, invalidate,
+                                               rebuild))
+
+    @property
+    def fields(self) -> set:
+        """
+        Все поля пользователя, от которых зависят производные данные.
+        """
+        return set().union(*(artifact.fields for artifact in self._artifacts))
+
+    def inputs(self, user: User) -> dict:
+        """
+        Запоминает значения входных полей пользователя до изменения профиля.
+
+        Args:
+            user (User): Пользователь.
+
+        Returns:
+            Словарь {поле: значение}.
+        """
+        return {field: getattr(user, field) for field in self.fields}
+
+    def changed(self, before: dict, user: User) -> set:
+        """
+        Сравнивает сохранённые значения входных полей с текущими. Значения
+        сравниваются после преобразования формы в типы модели, поэтому
+        неизменённые дата и время рождения не считаются изменившимися.
+
+        Args:
+            before (dict): Результат inputs до изменения профиля.
+            user (User): Пользователь после изменения профиля.
+
+        Returns:
+            Множество изменившихся полей.
+        """
+        return {field for field, value in before.items()
+                if getattr(user, field) != value}
+
+    def invalidate(self, user: User, before: dict,
+                   rebuild: bool = False) -> list:
+        """
+        Удаляет производные данные, входные поля которых изменились.
+
+        Args:
+            user (User): Пользователь после изменения профиля.
+            before (dict): Результат inputs до изменения профиля.
+            rebuild (bool): Пересоздать удалённые данные в фоне.
+
+        Returns:
+            Названия удалённых видов данных.
+        """
+        changed = self.changed(before, user)
+        affected = [artifact for artifact in self._artifacts
+                    if artifact.fields & changed]
+        for artifact in affected:
+            artifact.invalidate(user.id)
+        rebuilt = [artifact.name for artifact in affected if artifact.rebuild]
+        if rebuild and rebuilt and user.birthday and user.birth_time:
+            self.executor.submit(self.rebuild, user.id, rebuilt)
+        return [artifact.name for artifact in affected]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Пул потоков фонового пересоздания, создаётся при первом обращении.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._workers, thread_name_prefix='artifacts')
+            return self._executor
+
+    def rebuild(self, user_id: int, names: list) -> None:
+        """
+        Пересоздаёт производные данные пользователя. Выполняется в фоновом
+        потоке, поэтому пользователь загружается заново в своём контексте
+        приложения.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            names (list): Названия видов данных.
+        """
+        with app.app_context():
+            user = dataAccess.get_user_by_id(user_id)
+            for artifact in self._artifacts:
+                if artifact.name not in names:
+                    continue
+                try:
+                    artifact.rebuild(user)
+                except Exception:
+                    app.logger.exception('Не удалось пересоздать %s для %s',
+                                         artifact.name, user_id)
+
+
+def birth_moment(user: User) -> datetime:
+    """
+    Возвращает дату и время рождения пользователя.
+    """
+    return datetime.combine(user.birthday, user.birth_time)
+
+
+def rebuild_natal_chart(user: User) -> None:
+    """
+    Создаёт и сохраняет натальную карту пользователя.
+    """
+    text = GetNatalChart2(birth_moment(user), user.birth_place).natal_chart()
+    dataAccess.add_new_natal_cart(user.id, text)
+
+
+def rebuild_tranzit(user: User) -> None:
+    """
+    Создаёт и сохраняет прогноз транзитов пользователя на текущий месяц.
+    """
+    tranzit = TranzitMonth(birth_moment(user), user.birth_place)
+    dataAccess.add_tranzit(user.id, tranzit.period, tranzit.get_response())
+
+
+def rebuild_tranzit_alerts(user: User) -> None:
+    """
+    Пересчитывает точные транзиты пользователя на месяц вперёд.
+    """
+    build_user_tranzit_alerts(user, date.today())
+
+
+artifacts = ArtifactRegistry()
+artifacts.register('natal_chart', BIRTH_DATA + BIRTH_PLACE,
+                   dataAccess.del_natal_chart, rebuild_natal_chart)
+artifacts.register('tranzit', BIRTH_DATA + BIRTH_PLACE,
+                   dataAccess.del_tranzits, rebuild_tranzit)
+# Прогноз по соляру создаётся только по запросу премиум-пользователя
+artifacts.register('solar_return', BIRTH_DATA + BIRTH_PLACE,
+                   dataAccess.del_solar_returns)
+# Положения планет не зависят от места рождения
+artifacts.register('tranzit_alerts', BIRTH_DATA,
+                   dataAccess.del_user_tranzit_alerts, rebuild_tranzit_alerts)
+# Куспиды домов в записи зависят от места рождения
+artifacts.register('natal_snapshot', BIRTH_DATA + BIRTH_PLACE,
+                   dataAccess.del_natal_snapshot, rebuild_snapshot)
@@ -0,0 +1,217 @@
+"""
+Модуль календаря астрологических событий.
+
+Находит станции планет (смену прямого движения на ретроградное и обратно) и
+ингрессии (переходы планет из знака в знак) за заданный период. Используются
+скорости планет, которые Swiss Ephemeris возвращает вместе с долготой:
+события сначала локализуются проходом по периоду с шагом в сутки, а затем
+момент события уточняется поиском корня.
+
+Классы:
+    EphemerisCalendar: Поиск станций и ингрессий планет за период.
+
+Константы:
+    STATION_RETROGRADE (str): Событие - планета становится ретроградной.
+    STATION_DIRECT (str): Событие - планета становится директной.
+    INGRESS (str): Событие - планета переходит в новый знак зодиака.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+import swisseph as swe
+
+from horoscope_logic import GetAstralData, GetSpecialHoroscope
+
+STATION_RETROGRADE = 'station_retrograde'
+STATION_DIRECT = 'station_direct'
+INGRESS = 'ingress'
+
+
+class EphemerisCalendar:
+    """
+    Поиск станций и ингрессий планет за период.
+
+    Args:
+        planets: Список планет и их идентификаторов в Swiss Ephemeris.
+        step: Шаг прохода по периоду в сутках.
+        precision: Точность определения момента события в сутках (~1 минута).
+
+    Методы:
+        motion(jd: float, planet: int) -> tuple[float, float]
+        Возвращает долготу и скорость планеты в момент jd.
+
+        find_station(self, planet: int, start: float, end: float) -> float
+        Уточняет момент смены знака скорости планеты.
+
+        find_ingress(self, planet: int, start: float, end: float,
+                     boundary: float) -> float
+        Уточняет момент пересечения планетой границы знака.
+
+        events(self, start: datetime, end: datetime) -> list[dict]
+        Возвращает все станции и ингрессии планет за период.
+    """
+
+    planets = GetAstralData.planets
+    step = 1.0
+    precision = 1 / 1440
+
+    @staticmethod
+    def motion(jd: float, planet: int) -> tuple:
+        """
+        Рассчитывает долготу и скорость планеты.
+
+        Args:
+            jd (float): Юлианская дата (UT).
+            planet (int): Идентификатор планеты в Swiss Ephemeris.
+
+        Returns:
+            Кортеж из долготы в градусах и скорости в градусах в сутки.
+        """
+        position = swe.calc_ut(jd, planet, swe.FLG_SWIEPH | swe.FLG_SPEED)[0]
+        return position[0], position[3]
+
+    @staticmethod
+    def to_datetime(jd: float) -> datetime:
+        """
+        Переводит юлианскую дату в дату и время UTC.
+
+        Args:
+            jd (float): Юлианская дата (UT).
+
+        Returns:
+            Дата и время UTC без часового пояса.
+        """
+        year, month, day, hours = swe.revjul(jd)
+        moment = datetime(year, month, day) + timedelta(hours=hours)
+        return moment.replace(microsecond=0)
+
+    @staticmethod
+    def to_julian(date: datetime) -> float:
+        """
+        Переводит дату и время UTC в юлианскую дату.
+
+        Args:
+            date (datetime): Дата и время UTC.
+
+        Returns:
+            Юлианская дата (UT).
+        """
+        return swe.julday(date.year, date.month, date.day,
+                          date.hour + date.minute / 60.0)
+
+    def find_station(self, planet: int, start: float, end: float) -> float:
+        """
+        Уточняет момент станции методом бисекции: на концах отрезка скорость
+        планеты имеет разные знаки.
+
+        Args:
+            planet (int): Идентификатор планеты в Swiss Ephemeris.
+            start (float): Начало отрезка (юлианская дата).
+            end (float): Конец отрезка (юлианская дата).
+
+        Returns:
+            Юлианская дата станции.
+        """
+        start_speed = self.motion(start, planet)[1]
+        while end - start > self.precision:
+            middle = (start + end) / 2
+            speed = self.motion(middle, planet)[1]
+            if (speed < 0) == (start_speed < 0):
+                start, start_speed = middle, speed
+            else:
+                end = middle
+        return (start + end) / 2
+
+    def find_ingress(self, planet: int, start: float, end: float,
+                     boundary: float) -> float:
+        """
+        Уточняет момент пересечения границы знака методом Ньютона, используя
+        скорость планеты как производную долготы. Если шаг Ньютона выходит за
+        отрезок (например, рядом со станцией), выполняется шаг бисекции.
+
+        Args:
+            planet (int): Идентификатор планеты в Swiss Ephemeris.
+            start (float): Начало отрезка (юлианская дата).
+            end (float): Конец отрезка (юлианская дата).
+            boundary (float): Долгота границы знака в градусах.
+
+        Returns:
+            Юлианская дата ингрессии.
+        """
+        jd = (start + end) / 2
+        for _ in range(50):
+            longitude, speed = self.motion(jd, planet)
+            difference = (longitude - boundary + 180) % 360 - 180
+            if abs(difference) < 1e-6:
+                break
+            if (difference < 0) == (speed > 0):
+                start = jd
+            else:
+                end = jd
+            next_jd = jd - difference / speed if speed else start - 1
+            if not start < next_jd < end:
+                next_jd = (start + end) / 2
+            if abs(next_jd - jd) < self.precision / 60:
+                jd = next_jd
+                break
+            jd = next_jd
+        return jd
+
+    def events(self, start: datetime, end: datetime) -> list:
+        """
+        Находит все станции и ингрессии планет за период.
+
+        Args:
+            start (datetime): Начало периода (UTC).
+            end (datetime): Конец периода (UTC).
+
+        Returns:
+            Список словарей с ключами "planet", "event", "moment" и "sign",
+            упорядоченный по времени события.
+        """
+        result = []
+        first, last = self.to_julian(start), self.to_julian(end)
+        steps = math.ceil((last - first) / self.step)
+        for name, planet in self.planets:
+            jd = first
+            longitude, speed = self.motion(jd, planet)
+            for _ in range(steps):
+                next_jd = min(jd + self.step, last)
+                next_longitude, next_speed = self.motion(next_jd, planet)
+                if (speed < 0) != (next_speed < 0):
+                    moment = self.find_station(planet, jd, next_jd)
+                    event = STATION_RETROGRADE if speed > 0 else STATION_DIRECT
+                    result.append(self.event(name, event, moment, planet))
+                sign = int(longitude // 30)
+                next_sign = int(next_longitude // 30)
+                if sign != next_sign:
+                    forward = (next_longitude - longitude) % 360 < 180
+                    boundary = (next_sign if forward else sign) * 30.0
+                    moment = self.find_ingress(planet, jd, next_jd, boundary)
+                    result.append(self.event(name, INGRESS, moment, planet))
+                jd, longitude, speed = next_jd, next_longitude, next_speed
+        result.sort(key=lambda event: event['moment'])
+        return result
+
+    def event(self, name: str, event: str, jd: float, planet: int) -> dict:
+        """
+        Формирует описание события с учётом знака, в котором находится планета
+        сразу после события.
+
+        Args:
+            name (str): Название планеты.
+            event (str): Тип события.
+            jd (float): Юлианская дата события.
+            planet (int): Идентификатор планеты в Swiss Ephemeris.
+
+        Returns:
+            Словарь с ключами "planet", "event", "moment" и "sign".
+        """
+        longitude = self.motion(jd + self.precision, planet)[0]
+        return {
+            'planet': name,
+            'event': event,
+            'moment': self.to_datetime(jd),
+            'sign': GetSpecialHoroscope.zodiac_signs[int(longitude // 30) % 12],
+        }
@@ -15,6 +15,10 @@
         Возвращает строковое представление начальной даты для заданного периода прогноза
         гороскопа.
 
+    period_end(period: str, date: str) -> datetime | None:
+        Возвращает момент окончания периода гороскопа, начинающегося с
+        даты, полученной от date_horoscope.
+
     delete_file(file_path: str) -> None:
         Удаляет файл по заданному пути. Используется для очистки временных
         или не нужных более файлов.
@@ -98,6 +102,38 @@ def date_horoscope(period: str) -> str:
     return date
 
 
+def period_end(period: str, date: str) -> datetime | None:
+    """
+    Определяет момент окончания периода гороскопа - начало следующего периода.
+
+    Параметры:
+        period (str): Период гороскопа: 'today', 'week', 'month' или 'year'.
+        date (str): Начальная дата периода в формате 'YYYY-MM-DD', как её
+        возвращает date_horoscope.
+
+    Возвращает:
+        datetime | None: Начало следующего периода (местное время) или None
+        для периодов без границы (например, 'special').
+
+    Примеры использования:
+        >>> period_end("week", "2023-03-27")
+        datetime.datetime(2023, 4, 3, 0, 0)
+        >>> period_end("month", "2023-04-01")
+        datetime.datetime(2023, 5, 1, 0, 0)
+    """
+    start = datetime.strptime(str(date)[:10], '%Y-%m-%d')
+
+    if period == 'today':
+        return start + timedelta(days=1)
+    elif period == 'week':
+        return start + timedelta(days=7)
+    elif period == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    elif period == 'year':
+        return start.replace(year=start.year + 1)
+    return None
+
+
 def delete_file(file_path: str) -> None:
     """
     Удаляет файл по заданному пути, если файл существует.
@@ -0,0 +1,444 @@
+"""
+Модуль кэширования данных.
+
+Содержит двухуровневый кэш: первый уровень (L1) - ограниченный по размеру
+кэш в памяти процесса, второй уровень (L2) - общее для всех процессов
+хранилище, благодаря которому результат, рассчитанный одним воркером
+gunicorn, используется остальными. L2 может храниться в файле SQLite на
+локальном диске (внешние сервисы не нужны) или в Redis (либо в любом
+локальном объекте с тем же протоколом get/set/delete).
+
+Ошибка L2 (недоступный Redis, заблокированный файл SQLite) не прерывает
+запрос: чтение считается промахом, запись и удаление выполняются только в
+L1, а ошибка записывается в журнал не чаще раза в L2_ERROR_LOG_SECONDS
+секунд для каждого кэша.
+
+Классы:
+    TTLCache: Потокобезопасный LRU-кэш с временем истечения записей и
+    счётчиками попаданий и промахов.
+    SQLiteBackend: Хранилище L2 в файле SQLite, общем для процессов.
+    RedisBackend: Хранилище L2 в Redis.
+    TwoTierCache: Двухуровневый кэш L1 + L2.
+
+Функции:
+    make_l2_backend() -> SQLiteBackend | RedisBackend | None:
+        Создаёт хранилище L2 по конфигурации приложения.
+
+Атрибуты:
+    horoscope_cache (TwoTierCache): Кэш текстов гороскопов по ключу
+    (период, дата, знак зодиака).
+    natal_section_cache (TwoTierCache): Кэш разделов натальной карты по
+    запросу к модели.
+    geocode_cache (TwoTierCache): Кэш координат городов.
+    moon_cache (TwoTierCache): Кэш положения Луны и лунного дня по дате.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from app import app
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Отличает отсутствие записи в L1 от сохранённого значения
+_MISSING = object()
+
+# Как часто кэш записывает в журнал ошибки L2, сек
+L2_ERROR_LOG_SECONDS = 60
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с временем истечения записей.
+
+    Каждая запись хранится до указанного момента времени. При превышении
+    максимального размера вытесняются давно не использовавшиеся записи.
+
+    Args:
+        name (str): Название кэша для статистики.
+        maxsize (int): Максимальное количество записей.
+        ttl (float): Время жизни записи в секундах, если момент истечения не
+                     указан явно.
+
+    Методы:
+        get(self, key, default=None) -> Any:
+            Возвращает значение по ключу или default, если записи нет или
+            она истекла.
+
+        set(self, key, value, expires_at=None) -> None:
+            Сохраняет значение до момента expires_at (Unix time).
+
+        get_or_load(self, key, loader, expires_at=None) -> Any:
+            Возвращает значение из кэша или загружает его функцией loader.
+
+        invalidate(self, key) -> bool:
+            Удаляет запись по ключу и сообщает, удалось ли это.
+
+        clear(self) -> None:
+            Удаляет все записи.
+
+        stats(self) -> dict:
+            Возвращает счётчики попаданий и промахов и размер кэша.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024,
+                 ttl: float = 3600) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Возвращает значение по ключу.
+
+        Args:
+            key (Hashable): Ключ записи.
+            default (Any): Значение, возвращаемое при отсутствии записи.
+
+        Returns:
+            Сохранённое значение или default.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any,
+            expires_at: float | None = None) -> None:
+        """
+        Сохраняет значение в кэше.
+
+        Args:
+            key (Hashable): Ключ записи.
+            value (Any): Значение.
+            expires_at (float): Момент истечения записи (Unix time). По
+                                умолчанию текущее время плюс ttl.
+        """
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any],
+                    expires_at: float | None = None) -> Any:
+        """
+        Возвращает значение из кэша, а при его отсутствии загружает функцией
+        loader и сохраняет. Результат None не кэшируется.
+
+        Args:
+            key (Hashable): Ключ записи.
+            loader (Callable): Функция загрузки значения.
+            expires_at (float): Момент истечения записи (Unix time).
+
+        Returns:
+            Значение из кэша или результат loader.
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value, expires_at)
+        return value
+
+    def invalidate(self, key: Hashable) -> bool:
+        """
+        Удаляет запись по ключу, если она есть.
+
+        Args:
+            key (Hashable): Ключ записи.
+
+        Returns:
+            True, если запись удалена из всех уровней кэша.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+        return True
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику кэша.
+
+        Returns:
+            Словарь с названием, количеством попаданий и промахов, долей
+            попаданий, текущим и максимальным размером кэша.
+        """
+        total = self.hits + self.misses
+        return {
+            'name': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+class SQLiteBackend:
+    """
+    Хранилище L2 в файле SQLite. Файл на локальном диске открывается всеми
+    процессами приложения, поэтому запись, сделанная одним процессом, сразу
+    доступна остальным.
+
+    Args:
+        path (str): Путь к файлу базы данных кэша.
+
+    Методы:
+        get(self, key) -> tuple[str, float] | None:
+            Возвращает значение и момент истечения записи.
+
+        set(self, key, value, expires_at) -> None:
+            Сохраняет значение до момента expires_at.
+
+        delete(self, key) -> None:
+            Удаляет запись.
+    """
+
+    # Удаление истёкших записей выполняется раз в указанное число записей
+    purge_every = 1000
+
+    # Ошибки хранилища, при которых кэш продолжает работу без L2
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Соединение с файлом кэша, отдельное для каждого потока.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> tuple | None:
+        row = self.connection.execute(
+            'SELECT value, expires_at FROM cache '
+            'WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) '
+            'VALUES (?, ?, ?)', (key, value, expires_at))
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self.connection.execute('DELETE FROM cache WHERE expires_at <= ?',
+                                    (time.time(),))
+
+    def delete(self, key: str) -> None:
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+
+class RedisBackend:
+    """
+    Хранилище L2 в Redis. Принимает любой клиент с методами get, set (с
+    параметром exat) и delete, поэтому в разработке и тестах Redis можно
+    заменить локальным объектом с тем же протоколом.
+
+    Args:
+        client: Клиент Redis.
+
+    Методы:
+        from_url(url) -> RedisBackend:
+            Создаёт хранилище по адресу Redis.
+    """
+
+    # Ошибки хранилища, при которых кэш продолжает работу без L2
+    errors = (redis.RedisError, OSError) if redis is not None else (OSError,)
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisBackend':
+        if redis is None:
+            raise RuntimeError('Для CACHE_L2_BACKEND=redis установите redis')
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    def get(self, key: str) -> tuple | None:
+        value = self.client.get(key)
+        if value is None:
+            return None
+        # Точный момент истечения хранится вместе со значением
+        expires_at, _, value = value.partition(':')
+        return value, float(expires_at)
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        self.client.set(key, f'{expires_at}:{value}', exat=int(expires_at) + 1)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+
+class TwoTierCache(TTLCache):
+    """
+    Двухуровневый кэш: при промахе в памяти процесса (L1) значение ищется в
+    общем хранилище (L2) и копируется в L1. Значения в L2 сериализуются в
+    JSON, поэтому кэшировать можно строки, числа, списки и словари.
+
+    Время жизни записи в L1 ограничено l1_ttl, поэтому сброс записи одним
+    процессом доходит до остальных не позже чем через l1_ttl секунд.
+
+    Ошибки хранилища L2 (атрибут errors хранилища) не передаются
+    вызывающему коду: кэш работает как кэш только в памяти процесса и
+    считает ошибки в l2_errors. Исключение — invalidate: при ошибке удаления
+    из L2 он возвращает False, так как устаревшее значение останется в L2 до
+    истечения срока записи.
+
+    Args:
+        name (str): Название кэша, используется как префикс ключей в L2.
+        maxsize (int): Максимальное количество записей в L1.
+        ttl (float): Время жизни записи по умолчанию в секундах.
+        l2: Хранилище L2 или None для кэша только в памяти процесса.
+        l1_ttl (float): Максимальное время жизни записи в L1.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 3600,
+                 l2=None, l1_ttl: float = 60) -> None:
+        super().__init__(name, maxsize, ttl)
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+        self._l2_logged = 0.0
+        self._l2_suppressed = 0
+
+    def l2_key(self, key: Hashable) -> str:
+        """
+        Формирует строковый ключ записи в L2.
+        """
+        return f'{self.name}:{json.dumps(key, default=str, ensure_ascii=False)}'
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = super().get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.l2 is None:
+            return default
+        try:
+            row = self.l2.get(self.l2_key(key))
+        except self._l2_errors() as error:
+            self._l2_failed('get', error)
+            row = None
+        if row is None:
+            self.l2_misses += 1
+            return default
+        self.l2_hits += 1
+        value, expires_at = json.loads(row[0]), row[1]
+        super().set(key, value, min(expires_at, time.time() + self.l1_ttl))
+        return value
+
+    def set(self, key: Hashable, value: Any,
+            expires_at: float | None = None) -> None:
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        super().set(key, value, min(expires_at, time.time() + self.l1_ttl))
+        if self.l2 is not None:
+            try:
+                self.l2.set(self.l2_key(key),
+                            json.dumps(value, ensure_ascii=False), expires_at)
+            except self._l2_errors() as error:
+                self._l2_failed('set', error)
+
+    def invalidate(self, key: Hashable) -> bool:
+        super().invalidate(key)
+        if self.l2 is not None:
+            try:
+                self.l2.delete(self.l2_key(key))
+            except self._l2_errors() as error:
+                self._l2_failed('delete', error)
+                return False
+        return True
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(l2_hits=self.l2_hits, l2_misses=self.l2_misses,
+                     l2_errors=self.l2_errors)
+        return stats
+
+    def _l2_errors(self) -> tuple:
+        return getattr(self.l2, 'errors', (OSError,))
+
+    def _l2_failed(self, operation: str, error: Exception) -> None:
+        # Пока хранилище недоступно, ошибка возникает на каждом запросе,
+        # поэтому в журнал попадает одна запись за L2_ERROR_LOG_SECONDS
+        self.l2_errors += 1
+        now = time.monotonic()
+        if now - self._l2_logged < L2_ERROR_LOG_SECONDS:
+            self._l2_suppressed += 1
+            return
+        suppressed, self._l2_suppressed = self._l2_suppressed, 0
+        self._l2_logged = now
+        app.logger.warning('Кэш %s: ошибка L2 при %s: %r (пропущено '
+                           'сообщений: %d)', self.name, operation, error,
+                           suppressed)
+
+
+def make_l2_backend() -> SQLiteBackend | RedisBackend | None:
+    """
+    Создаёт хранилище L2 по конфигурации CACHE_L2_BACKEND ('sqlite',
+    'redis' или 'none') и CACHE_L2_URL.
+
+    Returns:
+        Хранилище L2 или None, если общий кэш отключён.
+    """
+    backend = app.config['CACHE_L2_BACKEND']
+    if backend == 'sqlite':
+        return SQLiteBackend(app.config['CACHE_L2_URL'])
+    if backend == 'redis':
+        return RedisBackend.from_url(app.config['CACHE_L2_URL'])
+    return None
+
+
+l2_backend = make_l2_backend()
+l1_ttl = app.config['CACHE_L1_TTL']
+
+horoscope_cache = TwoTierCache('horoscope', app.config['HOROSCOPE_CACHE_SIZE'],
+                               l2=l2_backend, l1_ttl=l1_ttl)
+natal_section_cache = TwoTierCache('natal_section', 1024, ttl=30 * 86400,
+                                   l2=l2_backend, l1_ttl=l1_ttl)
+geocode_cache = TwoTierCache('geocode', 4096, ttl=30 * 86400,
+                             l2=l2_backend, l1_ttl=l1_ttl)
+moon_cache = TwoTierCache('moon', 1024, ttl=30 * 86400,
+                          l2=l2_backend, l1_ttl=l1_ttl)
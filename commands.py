@@ -0,0 +1,311 @@
+"""
+Модуль консольных команд Flask для обслуживания приложения.
+
+Команды запускаются через `flask --app controller <команда>` и выполняют
+тяжёлые расчёты заранее, чтобы они не происходили во время обработки запросов
+пользователей.
+
+Команды:
+    calendar-build: Рассчитывает календарь станций и ингрессий планет.
+    tranzit-alerts: Рассчитывает точные личные транзиты пользователей.
+    natal-snapshots: Рассчитывает недостающие двоичные записи натальных
+    карт.
+    horoscope-dedupe: Удаляет дубликаты гороскопов и создаёт уникальный
+    индекс для их поиска.
+    db-indexes: Добавляет столбцы и индексы, появившиеся в моделях после
+    создания таблиц. Обязательный шаг при каждом обновлении приложения.
+    horoscope-archive: Переносит гороскопы с истёкшим сроком хранения в
+    архив.
+    compress-texts: Переводит натальные карты, гороскопы и прогнозы
+    транзитов на сжатое хранение.
+    texts-export: Выгружает гороскопы, натальные карты или прогнозы
+    транзитов в сжатый файл JSON Lines.
+    texts-import: Загружает гороскопы, натальные карты или прогнозы
+    транзитов из сжатого файла JSON Lines.
+    search-rebuild: Пересоздаёт полнотекстовый индекс гороскопов и
+    натальных карт.
+    users-import: Импортирует пользователей из файла CSV.
+    replica-sync: Копирует основную базу SQLite в реплики для локальной
+    проверки чтения с реплик.
+"""
+
+import os
+from datetime import date, datetime
+
+import click
+
+from app import app, db
+from astro_calendar import EphemerisCalendar
+from compression import codec, train_dictionary
+from db_routing import REPLICA_PREFIX
+from models import DataAccess, Horoscope, UserNatalChart, UserTranzit
+from natal_snapshot import backfill_snapshots
+from retention import horoscope_retention
+from search import SEARCH_SOURCES, search_index
+from text_transfer import TRANSFER_TABLES, export_texts, import_texts
+from tranzit_alerts import build_tranzit_alerts
+from user_import import UserImport
+
+dataAccess = DataAccess()
+
+
+@app.cli.command('calendar-build')
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']),
+              default=lambda: datetime(datetime.now().year, 1, 1),
+              help='Начало периода (по умолчанию начало текущего года).')
+@click.option('--years', type=int, default=2,
+              help='Длительность периода в годах.')
+def calendar_build(start: datetime, years: int) -> None:
+    """
+    Рассчитывает станции и ингрессии планет за период и сохраняет их в
+    таблицу событий календаря, заменяя ранее рассчитанные.
+    """
+    end = start.replace(year=start.year + years)
+    events = EphemerisCalendar().events(start, end)
+    dataAccess.replace_astro_events(start, end, events)
+    click.echo(f'Сохранено событий: {len(events)} '
+               f'({start:%Y-%m-%d} - {end:%Y-%m-%d})')
+
+
+@app.cli.command('tranzit-alerts')
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']),
+              default=lambda: datetime.combine(date.today(), datetime.min.time()),
+              help='Первый день периода (по умолчанию сегодня).')
+@click.option('--days', type=int, default=31, help='Количество дней.')
+@click.option('--chunk-size', type=int, default=500,
+              help='Количество пользователей в одной пачке.')
+@click.option('--workers', type=int, default=None,
+              help='Количество процессов (по умолчанию по числу ядер).')
+def tranzit_alerts(start: datetime, days: int, chunk_size: int,
+                   workers: int | None) -> None:
+    """
+    Рассчитывает точные личные транзиты всех пользователей с заполненными
+    данными рождения. Предназначена для ежедневного запуска по расписанию.
+    """
+    total = build_tranzit_alerts(start.date(), days, chunk_size, workers)
+    click.echo(f'Сохранено транзитов: {total}')
+
+
+@app.cli.command('natal-snapshots')
+def natal_snapshots() -> None:
+    """
+    Рассчитывает и сохраняет двоичные записи натальных карт пользователей,
+    для которых их ещё нет, чтобы подбор совместимости не рассчитывал их
+    при обработке запросов.
+    """
+    click.echo(f'Сохранено записей: {backfill_snapshots()}')
+
+
+@app.cli.command('horoscope-dedupe')
+def horoscope_dedupe() -> None:
+    """
+    Однократная миграция: удаляет дубликаты гороскопов, накопившиеся до
+    появления уникального индекса, и создаёт индекс ix_horoscope_lookup.
+    """
+    removed = dataAccess.remove_duplicate_horoscopes()
+    click.echo(f'Удалено дубликатов: {removed}')
+
+
+@app.cli.command('db-indexes')
+def db_indexes() -> None:
+    """
+    Добавляет столбцы и индексы, появившиеся в моделях после создания
+    таблиц: координаты города пользователя, индексы столбцов сортировки
+    списков админ-панели и т.п. Команда обязательна при обновлении
+    приложения с существующей базой данных и запускается до старта новой
+    версии; повторный запуск ничего не меняет.
+    """
+    added = dataAccess.add_missing_columns()
+    click.echo(f'Добавлено столбцов: {len(added)}')
+    for name in added:
+        click.echo(f'  {name}')
+    created = dataAccess.create_missing_indexes()
+    click.echo(f'Создано индексов: {len(created)}')
+    for name in created:
+        click.echo(f'  {name}')
+
+
+@app.cli.command('horoscope-archive')
+@click.option('--batch-size', type=int, default=1000,
+              help='Количество гороскопов в одной пачке.')
+def horoscope_archive(batch_size: int) -> None:
+    """
+    Переносит гороскопы на даты старше HOROSCOPE_RETENTION_DAYS дней в
+    архив (HOROSCOPE_ARCHIVE). Предназначена для ежедневного запуска по
+    расписанию.
+    """
+    total = 0
+    for count in horoscope_retention.archive(batch_size):
+        total += count
+        click.echo(f'Перенесено в архив: {total}', nl=False)
+        click.echo('\r', nl=False)
+    click.echo(f'Перенесено в архив: {total} '
+               f'(периоды до {horoscope_retention.cutoff():%Y-%m-%d}, '
+               f'хранилище {horoscope_retention.backend})')
+
+
+# Столбцы с длинными текстами, хранящиеся в сжатом виде
+COMPRESSED_TEXTS = (
+    (UserNatalChart, 'natal_chart'),
+    (Horoscope, 'horoscope'),
+    (UserTranzit, 'tranzit'),
+)
+
+
+@app.cli.command('compress-texts')
+@click.option('--batch-size', type=int, default=500,
+              help='Количество записей в одной пачке.')
+@click.option('--train-dict', 'dict_size', type=int, default=0,
+              help='Обучить общий словарь указанного размера в байтах '
+                   'на сохранённых текстах перед сжатием.')
+def compress_texts(batch_size: int, dict_size: int) -> None:
+    """
+    Переводит столбцы с длинными текстами в двоичный тип и сжимает
+    сохранённые в них тексты. Команду можно запускать повторно, например
+    после обучения нового словаря. Словарь сохраняется в
+    COMPRESSION_DICT_PATH, а прежние словари остаются рядом в файлах по
+    контрольной сумме: каталог должен быть доступен всем процессам
+    приложения. После выполнения команды включите COMPRESSION_ENABLED=1,
+    чтобы приложение сжимало новые тексты.
+    """
+    for model, name in COMPRESSED_TEXTS:
+        if dataAccess.binary_text_column(model, name):
+            click.echo(f'{model.__tablename__}.{name}: тип изменён')
+    codec.enabled = True
+    if dict_size:
+        samples = [text for model, name in COMPRESSED_TEXTS
+                   for text in dataAccess.get_text_samples(model, name)]
+        dictionary = train_dictionary(samples, dict_size)
+        codec.save_dictionary(dictionary)
+        click.echo(f'Словарь: {len(dictionary)} байт, '
+                   f'{len(samples)} примеров')
+    for model, name in COMPRESSED_TEXTS:
+        rows = before = after = 0
+        for count, size, compressed in dataAccess.compress_texts(
+                model, name, batch_size):
+            rows += count
+            before += size
+            after += compressed
+            click.echo(f'{model.__tablename__}.{name}: {rows} записей',
+                       nl=False)
+            click.echo('\r', nl=False)
+        ratio = before / after if after else 0
+        click.echo(f'{model.__tablename__}.{name}: {rows} записей, '
+                   f'{before} -> {after} байт (x{ratio:.1f})')
+    if not app.config['COMPRESSION_ENABLED']:
+        click.echo('Включите COMPRESSION_ENABLED=1, чтобы сжимать новые '
+                   'тексты')
+
+
+@app.cli.command('texts-export')
+@click.argument('table', type=click.Choice(list(TRANSFER_TABLES)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--batch-size', type=int, default=1000,
+              help='Количество строк в одной пачке.')
+def texts_export(table: str, path: str, batch_size: int) -> None:
+    """
+    Выгружает таблицу TABLE в файл PATH (JSON Lines, сжатый gzip).
+    """
+    total = 0
+    for count in export_texts(table, path, batch_size):
+        total += count
+        click.echo(f'{table}: {total} записей', nl=False)
+        click.echo('\r', nl=False)
+    click.echo(f'{table}: выгружено {total} записей в {path}')
+
+
+@app.cli.command('texts-import')
+@click.argument('table', type=click.Choice(list(TRANSFER_TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=1000,
+              help='Количество строк в одной пачке.')
+def texts_import(table: str, path: str, batch_size: int) -> None:
+    """
+    Загружает таблицу TABLE из файла PATH, выгруженного командой
+    texts-export. Уже существующие тексты не изменяются.
+    """
+    total = skipped = 0
+    for count, missing in import_texts(table, path, batch_size):
+        total += count
+        skipped += missing
+        click.echo(f'{table}: {total} записей', nl=False)
+        click.echo('\r', nl=False)
+    click.echo(f'{table}: прочитано {total} записей, пропущено без '
+               f'пользователя {skipped}')
+
+
+@app.cli.command('search-rebuild')
+@click.option('--batch-size', type=int, default=1000,
+              help='Количество текстов в одной пачке.')
+def search_rebuild(batch_size: int) -> None:
+    """
+    Пересоздаёт таблицы полнотекстового поиска и индексирует все гороскопы
+    и натальные карты. Выполняется один раз после подключения поиска или
+    для исправления расхождений индекса с таблицами.
+    """
+    for kind in SEARCH_SOURCES:
+        total = 0
+        for count in search_index.rebuild(kind, batch_size):
+            total += count
+            click.echo(f'{kind}: {total} текстов', nl=False)
+            click.echo('\r', nl=False)
+        click.echo(f'{kind}: проиндексировано {total} текстов')
+
+
+@app.cli.command('users-import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False),
+              default=None,
+              help='Отчёт об отклонённых строках (по умолчанию '
+                   '<файл>.rejects.csv).')
+@click.option('--batch-size', type=int, default=1000,
+              help='Количество пользователей в одной пачке.')
+@click.option('--workers', type=int, default=None,
+              help='Количество процессов хеширования паролей '
+                   '(по умолчанию по числу ядер).')
+def users_import(path: str, rejects_path: str | None, batch_size: int,
+                 workers: int | None) -> None:
+    """
+    Импортирует пользователей из файла CSV PATH. Строки с ошибками и уже
+    занятыми логинами или адресами не прерывают импорт и записываются в
+    отчёт об отклонённых строках.
+    """
+    rejects_path = rejects_path or f'{os.path.splitext(path)[0]}.rejects.csv'
+    total = added = 0
+    try:
+        for count, imported in UserImport(batch_size, workers).run(
+                path, rejects_path):
+            total += count
+            added += imported
+            click.echo(f'Прочитано: {total}, добавлено: {added}', nl=False)
+            click.echo('\r', nl=False)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'Прочитано: {total}, добавлено: {added}, '
+               f'отклонено: {total - added} ({rejects_path})')
+
+
+@app.cli.command('replica-sync')
+def replica_sync() -> None:
+    """
+    Копирует основную базу SQLite во все реплики SQLite из DB_REPLICAS.
+    Заменяет репликацию при локальной проверке распределения запросов;
+    реплики MySQL настраиваются средствами MySQL.
+    """
+    primary = db.engines[None]
+    if primary.dialect.name != 'sqlite':
+        raise click.ClickException('Основная база не SQLite')
+    for key, engine in db.engines.items():
+        if not (key and key.startswith(REPLICA_PREFIX)):
+            continue
+        if engine.dialect.name != 'sqlite':
+            click.echo(f'{key}: пропущена ({engine.dialect.name})')
+            continue
+        source = primary.raw_connection()
+        target = engine.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            source.close()
+            target.close()
+        click.echo(f'{key}: {engine.url.database}')
@@ -0,0 +1,316 @@
+"""
+Модуль сжатого хранения длинных текстов в базе данных.
+
+Натальные карты, гороскопы и прогнозы транзитов - это тексты на русском
+языке длиной в несколько килобайт, в UTF-8 каждый символ кириллицы занимает
+два байта. Тексты однотипны, поэтому хорошо сжимаются, особенно с общим
+словарём, обученным на уже сохранённых текстах.
+
+Сжатое значение начинается с байта заголовка, определяющего способ сжатия.
+Для способов со словарём за ним следуют 4 байта контрольной суммы словаря,
+по которой при распаковке выбирается словарь, которым значение было сжато.
+Новые значения сжимаются текущим словарём (COMPRESSION_DICT_PATH), а каждый
+словарь, когда-либо бывший текущим, хранится рядом в файле
+<COMPRESSION_DICT_PATH>.<контрольная сумма>. Процесс, ещё не знающий
+словаря значения (например, после обучения нового словаря другим
+процессом), загружает его из этого файла, поэтому смена словаря не требует
+одновременного перезапуска процессов и повторного сжатия всех значений. Значения,
+записанные до перехода на сжатие, хранятся как обычный текст и читаются без
+изменений, поэтому столбцы можно переводить на сжатие постепенно
+(команда `flask --app controller compress-texts`).
+
+Пока не включена конфигурация COMPRESSION_ENABLED, новые значения
+записываются обычным текстом: в MySQL и PostgreSQL столбцы остаются
+текстовыми до выполнения compress-texts, и сжатые байты в них записывать
+нельзя. Сжатие включается после выполнения команды.
+
+Если установлен пакет zstandard, используется zstd, иначе zlib из
+стандартной библиотеки. Словарь поддерживается обоими способами.
+
+Классы:
+    TextCodec: Сжатие и распаковка текстов.
+    CompressedText: Тип столбца SQLAlchemy, прозрачно сжимающий текст.
+
+Функции:
+    train_dictionary(samples, size) -> bytes:
+        Обучает общий словарь сжатия на примерах текстов.
+
+Атрибуты:
+    codec (TextCodec): Настроенный по конфигурации приложения кодек.
+"""
+
+import os
+import struct
+import zlib
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import TypeDecorator
+
+from app import app
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Байты заголовка сжатого значения
+ZLIB = 1
+ZLIB_DICT = 2
+ZSTD = 3
+ZSTD_DICT = 4
+
+# Размер словаря zlib ограничен окном в 32 КБ
+ZLIB_DICT_SIZE = 32 * 1024
+
+
+def dictionary_id(dictionary: bytes) -> bytes:
+    """
+    Возвращает 4 байта контрольной суммы словаря для заголовка.
+    """
+    return struct.pack('>I', zlib.crc32(dictionary))
+
+
+class TextCodec:
+    """
+    Сжатие и распаковка текстов.
+
+    Args:
+        method (str): Способ сжатия новых значений: 'zstd' или 'zlib'.
+        level (int): Уровень сжатия.
+        dictionary_path (str): Путь к файлу общего словаря или None.
+        enabled (bool): Сжимать ли новые значения столбцов CompressedText.
+
+    Методы:
+        compress(self, text) -> bytes:
+            Сжимает текст.
+
+        decompress(self, value) -> str:
+            Распаковывает значение, записанное любым из способов, или
+            возвращает несжатый текст как есть.
+
+        set_dictionary(self, dictionary) -> None:
+            Заменяет словарь сжатия новых значений.
+
+        save_dictionary(self, dictionary) -> None:
+            Сохраняет новый словарь для всех процессов и применяет его.
+    """
+
+    def __init__(self, method: str = 'zlib', level: int = 9,
+                 dictionary_path: str | None = None,
+                 enabled: bool = True) -> None:
+        if method == 'zstd' and zstandard is None:
+            method = 'zlib'
+        self.method = method
+        self.enabled = enabled
+        self.level = level
+        self.dictionary_path = dictionary_path
+        # Известные словари по контрольной сумме, включая прежние
+        self._dictionaries = {}
+        self._zstd_decompressors = {}
+        dictionary = None
+        if dictionary_path and os.path.exists(dictionary_path):
+            with open(dictionary_path, 'rb') as file:
+                dictionary = file.read()
+        self.set_dictionary(dictionary)
+
+    def set_dictionary(self, dictionary: bytes | None) -> None:
+        """
+        Заменяет словарь сжатия новых значений. Прежний словарь остаётся
+        известным кодеку, и сжатые им значения по-прежнему распаковываются.
+
+        Args:
+            dictionary (bytes): Содержимое словаря или None.
+        """
+        self.dictionary = dictionary
+        self.dictionary_id = dictionary_id(dictionary) if dictionary else None
+        if dictionary:
+            self._dictionaries[self.dictionary_id] = dictionary
+        if zstandard is not None:
+            zstd_dictionary = (zstandard.ZstdCompressionDict(dictionary)
+                               if dictionary else None)
+            self._zstd_compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=zstd_dictionary)
+
+    def save_dictionary(self, dictionary: bytes) -> None:
+        """
+        Сохраняет новый словарь сжатия для всех процессов и применяет его.
+        Сначала текущий и новый словари записываются в файлы по контрольной
+        сумме, чтобы любой процесс мог распаковать сжатые ими значения, и
+        только затем новый словарь заменяет файл текущего словаря.
+
+        Args:
+            dictionary (bytes): Содержимое словаря.
+        """
+        for known in (self.dictionary, dictionary):
+            if known:
+                path = self.dictionary_file(dictionary_id(known))
+                if not os.path.exists(path):
+                    self._write(path, known)
+        self._write(self.dictionary_path, dictionary)
+        self.set_dictionary(dictionary)
+
+    def dictionary_file(self, dict_id: bytes) -> str:
+        """
+        Возвращает путь к файлу словаря с контрольной суммой dict_id.
+        """
+        return f'{self.dictionary_path}.{dict_id.hex()}'
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        # Файл заменяется целиком, чтобы процессы не прочитали его частично
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+    def _dictionary(self, dict_id: bytes) -> bytes:
+        # Словарь значения ищется среди известных, а затем в файле по
+        # контрольной сумме
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None and self.dictionary_path:
+            try:
+                with open(self.dictionary_file(dict_id), 'rb') as file:
+                    dictionary = file.read()
+            except OSError:
+                dictionary = None
+            if dictionary is not None and dictionary_id(dictionary) == dict_id:
+                self._dictionaries[dict_id] = dictionary
+            else:
+                dictionary = None
+        if dictionary is None:
+            raise ValueError('Значение сжато неизвестным словарём')
+        return dictionary
+
+    def _zstd_decompressor(self, dict_id: bytes | None):
+        decompressor = self._zstd_decompressors.get(dict_id)
+        if decompressor is None:
+            zstd_dictionary = (
+                zstandard.ZstdCompressionDict(self._dictionary(dict_id))
+                if dict_id else None)
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dictionary)
+            self._zstd_decompressors[dict_id] = decompressor
+        return decompressor
+
+    def compress(self, text: str) -> bytes:
+        """
+        Сжимает текст.
+
+        Args:
+            text (str): Текст.
+
+        Returns:
+            Байты заголовка и сжатые данные.
+        """
+        data = text.encode('utf-8')
+        if self.method == 'zstd':
+            if self.dictionary:
+                return (bytes([ZSTD_DICT]) + self.dictionary_id
+                        + self._zstd_compressor.compress(data))
+            return bytes([ZSTD]) + self._zstd_compressor.compress(data)
+        if self.dictionary:
+            compressor = zlib.compressobj(self.level,
+                                          zdict=self.dictionary[-ZLIB_DICT_SIZE:])
+            return (bytes([ZLIB_DICT]) + self.dictionary_id
+                    + compressor.compress(data) + compressor.flush())
+        return bytes([ZLIB]) + zlib.compress(data, self.level)
+
+    def decompress(self, value: bytes | memoryview | str) -> str:
+        """
+        Распаковывает значение столбца.
+
+        Args:
+            value: Значение из базы данных. Несжатый текст, записанный до
+                   перехода на сжатие, может прийти строкой или байтами.
+
+        Returns:
+            Текст.
+
+        Raises:
+            ValueError: Если словарь, которым сжато значение, не найден.
+            RuntimeError: Если значение сжато zstd, а пакет zstandard не
+                          установлен.
+        """
+        if isinstance(value, str):
+            return value
+        value = bytes(value)
+        header = value[:1]
+        if not header or header[0] not in (ZLIB, ZLIB_DICT, ZSTD, ZSTD_DICT):
+            return value.decode('utf-8')
+        method, data = header[0], value[1:]
+        dict_id = None
+        if method in (ZLIB_DICT, ZSTD_DICT):
+            dict_id, data = data[:4], data[4:]
+        if method in (ZSTD, ZSTD_DICT):
+            if zstandard is None:
+                raise RuntimeError('Для чтения данных установите zstandard')
+            return self._zstd_decompressor(dict_id).decompress(data).decode(
+                'utf-8')
+        if method == ZLIB_DICT:
+            decompressor = zlib.decompressobj(
+                zdict=self._dictionary(dict_id)[-ZLIB_DICT_SIZE:])
+            return (decompressor.decompress(data)
+                    + decompressor.flush()).decode('utf-8')
+        return zlib.decompress(data).decode('utf-8')
+
+
+def train_dictionary(samples: list, size: int = 64 * 1024) -> bytes:
+    """
+    Обучает общий словарь сжатия на примерах текстов. Для zstd словарь
+    обучается средствами zstandard, для zlib словарём служат последние
+    32 КБ примеров: zlib ищет совпадения в конце словаря эффективнее.
+
+    Args:
+        samples (list): Тексты, на которых обучается словарь.
+        size (int): Размер словаря в байтах.
+
+    Returns:
+        Содержимое словаря.
+    """
+    encoded = [sample.encode('utf-8') for sample in samples]
+    if zstandard is not None and codec.method == 'zstd':
+        return zstandard.train_dictionary(size, encoded).as_bytes()
+    return b''.join(encoded)[-min(size, ZLIB_DICT_SIZE):]
+
+
+class CompressedText(TypeDecorator):
+    """
+    Тип столбца, хранящий текст в сжатом виде. В моделях значение остаётся
+    строкой, сжатие и распаковка выполняются при записи и чтении.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        # BLOB в MySQL ограничен 64 КБ, как и прежний TEXT
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(mysql.MEDIUMBLOB())
+        return dialect.type_descriptor(LargeBinary())
+
+    def bind_processor(self, dialect):
+        # Пока сжатие не включено, текст передаётся строкой без
+        # преобразования LargeBinary: столбец может быть ещё текстовым
+        impl_processor = self.impl_instance.bind_processor(dialect)
+
+        def process(value):
+            if value is None or not codec.enabled:
+                return value
+            value = codec.compress(value)
+            return impl_processor(value) if impl_processor else value
+        return process
+
+    def result_processor(self, dialect, coltype):
+        # Несжатые значения в ещё не переведённых столбцах приходят строкой,
+        # поэтому преобразование LargeBinary к bytes не выполняется.
+        def process(value):
+            if value is None:
+                return None
+            return codec.decompress(value)
+        return process
+
+
+codec = TextCodec(app.config['COMPRESSION_METHOD'],
+                  app.config['COMPRESSION_LEVEL'],
+                  app.config['COMPRESSION_DICT_PATH'],
+                  app.config['COMPRESSION_ENABLED'])
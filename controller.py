@@ -10,11 +10,17 @@
 - register_authorization(): Обрабатывает страницу с формами регистрации и авторизации.
 - register(): Регистрирует нового пользователя в системе.
 - authorization(): Авторизует пользователя в системе.
+- password_busy(): Отвечает на вход или регистрацию при перегрузке хеширования паролей.
 - profile(): Позволяет пользователю просматривать и редактировать свой профиль.
 - upload(): Обрабатывает загрузку и сохранение аватара пользователя.
 - horoscope(): Выводит гороскоп пользователя на определенный период.
 - specialhoroscope(): Выводит специализированный гороскоп на основе дополнительных данных.
+- solar_return(): Выводит премиум-прогноз на год по соляру и прогрессиям.
+- matches(): Подбирает пользователей с наибольшей совместимостью.
+- compatibility(): Возвращает оценку совместимости с выбранным пользователем.
 - natal_chart(): Генерирует и отображает натальную карту пользователя.
+- api_cities(): Возвращает города из офлайн-справочника для автодополнения.
+- api_calendar(): Возвращает календарь станций и ингрессий планет.
 - logout(): Выполняет выход пользователя из системы.
 - redirect_to_sign(): Перенаправляет неавторизованных пользователей на страницу входа.
 
@@ -23,19 +29,27 @@
 """
 
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask import (Response, flash, jsonify, redirect, render_template,
                    request, url_for)
 from flask_login import current_user, login_required, login_user, logout_user
 from werkzeug.utils import secure_filename
 
+import commands
 from admin_panel import admin
 from app import app, db
+from artifacts import artifacts
 from business_logic import allowed_file, date_horoscope, delete_file
-from horoscope_logic import GetHoroscope, GetSpecialHoroscope
-from horoscope_logic_pro import GetNatalChart2, TranzitMonth
+from gazetteer import gazetteer
+from horoscope_logic import GetSpecialHoroscope
+from horoscope_logic_pro import GetNatalChart2, SolarReturn, TranzitMonth
+from horoscope_refresh import STALE_FALLBACK, horoscope_refresher
 from models import DataAccess, UserNatalChart
+from natal_snapshot import load_snapshots
+from passwords import PasswordBusyError
+from retention import horoscope_retention
+from synastry import PLANETS, Synastry, natal_positions
 
 # экземпляр класса для работы с БД
 dataAccess = DataAccess()
@@ -93,11 +107,30 @@ def register() -> Response | str:
         return render_template("register_authorization.html")
     forms.pop("confirm_password", None)
     if dataAccess.check_new_user(**forms):
-        dataAccess.add_user(forms)
+        try:
+            dataAccess.add_user(forms)
+        except PasswordBusyError:
+            return password_busy()
         return redirect(url_for("register_authorization"))
     return render_template("register_authorization.html")
 
 
+def password_busy() -> tuple:
+    """
+    Ответ на вход или регистрацию, когда все слоты хеширования паролей
+    заняты (PasswordBusyError): сообщение об ошибке и код 503.
+    """
+    flash(
+        {
+            "title": "Ошибка!",
+            "message": "Сервер перегружен, повторите вход через "
+            "несколько секунд",
+        },
+        category="error",
+    )
+    return render_template("register_authorization.html"), 503
+
+
 @app.route("/authorization", methods=["GET", "POST"])
 def authorization() -> Response | str:
     """
@@ -123,7 +156,11 @@ def authorization() -> Response | str:
     password = request.form.get("password")
     remember = 'remember_me' in request.form
     # Получение пользователя из БД
-    if dataAccess.get_user(login, password, remember):
+    try:
+        authorized = dataAccess.get_user(login, password, remember)
+    except PasswordBusyError:
+        return password_busy()
+    if authorized:
         # Перенаправление в админ-панель, если пользователь - админ
         if login == "Admin":
             return redirect(url_for("admin.index"))
@@ -150,12 +187,13 @@ def profile() -> Response | str:
 
     GET запрос:
     Отображает страницу профиля пользователя. Если у пользователя указано время рождения,
-    оно также отображается на странице в соответствующем формате.
+    оно также отображается на странице в соответствующем формате. Также выводятся
+    точные личные транзиты на сегодня, заранее рассчитанные ночной командой.
 
     POST запрос:
-    Принимает измененные данные профиля пользователя из формы. Если данные о времени рождения
-    или дате рождения изменены, существующая натальная карта пользователя удаляется из базы данных,
-    предполагая необходимость создания новой. После обновления данных профиля в базе данных,
+    Принимает измененные данные профиля пользователя из формы. Если изменены данные, от которых
+    зависят натальная карта, прогнозы или транзиты (дата, время или место рождения), удаляются
+    только зависящие от них данные (см. artifacts). После обновления данных профиля в базе данных,
     пользователю выводится сообщение об успешном сохранении изменений и происходит перенаправление
     на страницу профиля.
 
@@ -164,17 +202,22 @@ def profile() -> Response | str:
              redirect(url_for('profile')) после обновления данных профиля в случае POST запроса.
     """
     if request.method == "GET":
+        dataAccess.load_profile(current_user._get_current_object())
+        tranzits = dataAccess.get_tranzit_alerts(current_user.id,
+                                                 datetime.utcnow().date())
         if current_user.birth_time:
             birth_time = current_user.birth_time.strftime("%H:%M")
-            return render_template("profile.html", birth_time=birth_time)
-        return render_template("profile.html")
+            return render_template("profile.html", birth_time=birth_time,
+                                   tranzits=tranzits)
+        return render_template("profile.html", tranzits=tranzits)
     user = current_user
     forms = request.form
-    if user.birth_time != forms["birth_time"] or user.birthday != forms["birthday"]:
-        # Удаление не актуальной натальной карты
-        dataAccess.del_natal_chart(user.id)
+    before = artifacts.inputs(user)
     # Добавление данных в профиль текущего пользователя
     dataAccess.add_profile(user, forms)
+    # Удаление натальной карты и прогнозов, данные для которых изменились
+    artifacts.invalidate(user, before,
+                         rebuild=app.config["ARTIFACTS_REBUILD"])
     flash(
         {"title": "Успех!", "message": "Ваши данные успешно сохранены"},
         category="success",
@@ -235,8 +278,8 @@ def horoscope(period) -> Response | str:
     на страницу профиля для дополнения информации.
 
     Если данные пользователя заполнены, осуществляется поиск гороскопа для данного периода и знака зодиака пользователя.
-    В случае отсутствия гороскопа в базе данных, производится запрос к внешнему сервису для получения гороскопа,
-    который затем сохраняется в базе данных для последующего использования.
+    В случае отсутствия гороскопа в базе данных его создание ставится в фоновую очередь, а пользователю сразу
+    отдаётся гороскоп предыдущего периода с признаком stale. Страница повторяет запрос, пока не получит новый гороскоп.
 
     :param period: Строка, указывающая период гороскопа (например, "today", "week").
     :return: render_template('horoscope_chat.html') с гороскопом для заданного периода,
@@ -258,33 +301,36 @@ def horoscope(period) -> Response | str:
     date = date_horoscope(period)
 
     zodiac_sign = current_user.zodiac_sign
-    # Поиск подходящего гороскопа по заданным параметрам в БД
-    horoscope = dataAccess.get_horoscope(period, date, zodiac_sign)
-    if not horoscope:
-        get_horoscope = GetHoroscope(zodiac_sign, period)
-        text = get_horoscope.get_response()
-        # Добавление нового гороскопа в БД
-        dataAccess.add_new_horoscope(period, zodiac_sign, text, date)
+    # Поиск подходящего гороскопа по заданным параметрам в кэше и БД
+    horoscope = dataAccess.get_horoscope_text(period, date, zodiac_sign)
+    if horoscope:
         return jsonify(
             {
                 "success": True,
-                "text": text,
+                "text": horoscope,
+                "stale": False,
             }
         )
+    # Гороскоп на новый период создаётся в фоне, а пока отдаётся
+    # гороскоп предыдущего периода
+    horoscope_refresher.submit(period, date, zodiac_sign)
+    previous = dataAccess.get_previous_horoscope_text(period, date, zodiac_sign)
     return jsonify(
-            {
-                "success": True,
-                "text": horoscope.horoscope,
-            }
-        )
-
+        {
+            "success": True,
+            "text": previous or STALE_FALLBACK,
+            "stale": True,
+        }
+    )
 
 
 @app.route('/tranzit/')
 @login_required
 def tranzit() -> Response | str:
     """
-        Views для отображения транзита
+        Views для отображения транзита. Прогноз на месяц сохраняется в БД и
+        создаётся заново только в новом месяце или после изменения данных
+        рождения.
     """
     # сделать проверку данных и перекинуть для заполнения на profile
     if not (current_user.birthday or current_user.birth_time):
@@ -297,8 +343,58 @@ def tranzit() -> Response | str:
         )
         return redirect(url_for('profile'))
 
+    # Прогноз создаётся один раз на месяц и хранится в БД
+    period = datetime.now().strftime('%Y-%m')
+    tranzit = dataAccess.get_tranzit(current_user.id, period)
+    if tranzit:
+        return render_template('horoscope_chat.html', text=tranzit.tranzit)
+
+    date = datetime.combine(current_user.birthday, current_user.birth_time)
+    text = TranzitMonth(date, current_user.birth_place).get_response()
+    dataAccess.add_tranzit(current_user.id, period, text)
+    return render_template('horoscope_chat.html', text=text)
+
+
+@app.route('/solar_return/')
+@login_required
+def solar_return() -> Response | str:
+    """
+    Views для отображения прогноза на год по соляру и вторичным прогрессиям.
+
+    Доступно только пользователям с премиум-подпиской. Год задаётся
+    параметром 'year', по умолчанию текущий. Прогноз создаётся один раз для
+    пользователя и года и далее берётся из базы данных.
+
+    :return: render_template('horoscope_chat.html') с текстом прогноза,
+             или перенаправление на страницу профиля.
+    """
+    if not current_user.premium:
+        flash(
+            {
+                'title': 'Премиум',
+                'message': 'Прогноз по соляру доступен с премиум-подпиской',
+            },
+            category='error',
+        )
+        return redirect(url_for('profile'))
+    if not (current_user.birthday and current_user.birth_time):
+        flash(
+            {
+                'title': 'Заполните данные',
+                'message': 'Для создания гороскопа заполните данные',
+            },
+            category='error',
+        )
+        return redirect(url_for('profile'))
+
+    year = request.args.get('year', datetime.now().year, type=int)
+    solar_return = dataAccess.get_solar_return(current_user.id, year)
+    if solar_return:
+        return render_template('horoscope_chat.html',
+                               text=solar_return.solar_return)
     date = datetime.combine(current_user.birthday, current_user.birth_time)
-    text = TranzitMonth(date, current_user.city).get_response()
+    text = SolarReturn(date, current_user.birth_place, year).get_response()
+    text = dataAccess.add_solar_return(current_user.id, year, text)
     return render_template('horoscope_chat.html', text=text)
 
 
@@ -339,10 +435,14 @@ def special_horoscope() -> Response | str:
     sp_date = datetime.strptime(sp_date, "%Y-%m-%d")
     period = "special"
     zodiac_sign = current_user.zodiac_sign
-    # Поиск подходящего гороскопа по заданным параметрам в БД
-    horoscope = dataAccess.get_horoscope(period, sp_date, zodiac_sign)
+    # Поиск подходящего гороскопа по заданным параметрам в кэше и БД
+    horoscope = dataAccess.get_horoscope_text(period, sp_date, zodiac_sign)
     if not horoscope:
-        get_horoscope = GetSpecialHoroscope(sp_date, zodiac_sign)
+        # Гороскоп на давнюю дату мог быть перенесён в архив
+        horoscope = horoscope_retention.restore(period, sp_date, zodiac_sign)
+    if not horoscope:
+        retrograde = dataAccess.get_retrograde_planets(sp_date)
+        get_horoscope = GetSpecialHoroscope(sp_date, zodiac_sign, retrograde)
         text = get_horoscope.get_response()
         # Добавление нового гороскопа в БД
         dataAccess.add_new_horoscope(period, zodiac_sign, text, sp_date)
@@ -355,11 +455,69 @@ def special_horoscope() -> Response | str:
     return jsonify(
         {
             "success": True,
-            "text": horoscope.horoscope,
+            "text": horoscope,
         }
     )
 
 
+@app.route('/matches/')
+@login_required
+def matches() -> Response | str:
+    """
+    Views для подбора пользователей с наибольшей совместимостью.
+
+    Положения планет текущего пользователя сравниваются с картами всех
+    пользователей, заполнивших дату и время рождения, за один векторный
+    проход Synastry.score_many. Карты кандидатов загружаются одним массивом
+    из двоичных записей (natal_snapshot).
+
+    :return: render_template('matches.html') со списком лучших совпадений,
+             или перенаправление на страницу профиля.
+    """
+    if not (current_user.birthday and current_user.birth_time):
+        flash(
+            {
+                'title': 'Заполните данные',
+                'message': 'Для подбора совместимости заполните данные',
+            },
+            category='error',
+        )
+        return redirect(url_for('profile'))
+    candidates, snapshots = load_snapshots(exclude_id=current_user.id)
+    if not candidates:
+        return render_template('matches.html', matches=[])
+    positions = natal_positions(current_user.birthday, current_user.birth_time)
+    scores = Synastry.score_many(positions, snapshots['positions'])
+    best = scores.argsort()[::-1][:20]
+    return render_template(
+        'matches.html',
+        matches=[(candidates[i], int(scores[i])) for i in best],
+    )
+
+
+@app.route('/compatibility/<login>')
+@login_required
+def compatibility(login: str) -> Response:
+    """
+    Возвращает оценку совместимости текущего пользователя с пользователем
+    'login'. Матрица аспектов не возвращается: она выдаёт положения планет
+    в момент рождения другого пользователя, то есть его личные данные.
+
+    :param login: Логин пользователя, с которым проверяется совместимость.
+    :return: JSON с оценкой совместимости.
+    """
+    user = dataAccess.get_user_by_login(login)
+    if not (user and user.birthday and user.birth_time
+            and current_user.birthday and current_user.birth_time):
+        return jsonify({'success': False})
+    synastry = Synastry(
+        dict(zip(PLANETS, natal_positions(current_user.birthday,
+                                          current_user.birth_time))),
+        dict(zip(PLANETS, natal_positions(user.birthday, user.birth_time))),
+    )
+    return jsonify({'success': True, 'score': synastry.score()})
+
+
 @app.route("/natal_chart", methods=["GET", "POST"])
 @login_required
 def natal_chart() -> Response | str:
@@ -402,7 +560,7 @@ def natal_chart() -> Response | str:
             }
         )
     date = datetime.combine(current_user.birthday, current_user.birth_time)
-    text = GetNatalChart2(date, current_user.city).natal_chart()
+    text = GetNatalChart2(date, current_user.birth_place).natal_chart()
     # Добавление новой натальной карты в БД
     dataAccess.add_new_natal_cart(current_user.id, text)
     return jsonify(
@@ -413,6 +571,70 @@ def natal_chart() -> Response | str:
     )
 
 
+@app.route("/api/cities")
+@login_required
+def api_cities() -> Response:
+    """
+    Возвращает города из офлайн-справочника, название которых начинается с
+    параметра 'q', для автодополнения места рождения в профиле.
+
+    :return: JSON со списком городов (название, страна, координаты).
+    """
+    query = request.args.get("q", "")
+    limit = min(request.args.get("limit", 10, type=int), 50)
+    return jsonify(
+        {
+            "success": True,
+            "cities": gazetteer.search(query, limit),
+        }
+    )
+
+
+@app.route("/api/calendar")
+@login_required
+def api_calendar() -> Response:
+    """
+    Возвращает заранее рассчитанные станции и ингрессии планет за период,
+    а также планеты, ретроградные в начале периода.
+
+    Параметры запроса 'start' и 'end' задаются в формате 'YYYY-MM-DD'.
+    По умолчанию возвращается период в 30 дней, начиная с сегодняшнего дня.
+    Период ограничен одним годом. Если начало периода не входит в
+    рассчитанный календарь (команда calendar-build), 'has_data' равен
+    false, а 'retrograde' - null.
+
+    :return: JSON со списком событий и ретроградных планет.
+    """
+    try:
+        start = datetime.strptime(
+            request.args.get("start") or datetime.now().strftime("%Y-%m-%d"),
+            "%Y-%m-%d")
+        end = request.args.get("end")
+        end = (datetime.strptime(end, "%Y-%m-%d") if end
+               else start + timedelta(days=30))
+    except ValueError:
+        return jsonify({"success": False, "message": "Неверный формат даты"})
+    end = min(end, start + timedelta(days=366))
+    events = dataAccess.get_astro_events(start, end)
+    retrograde = dataAccess.get_retrograde_planets(start)
+    return jsonify(
+        {
+            "success": True,
+            "has_data": retrograde is not None,
+            "retrograde": retrograde,
+            "events": [
+                {
+                    "planet": event.planet,
+                    "event": event.event,
+                    "moment": event.moment.isoformat(),
+                    "sign": event.sign,
+                }
+                for event in events
+            ],
+        }
+    )
+
+
 @app.route("/logout/")
 @login_required
 def logout() -> Response | str:
@@ -0,0 +1,319 @@
+"""
+Модуль профилей подключения к базе данных.
+
+Профиль задаёт параметры пула соединений и настройки соединения для своего
+диалекта:
+    dev  - SQLite для локальной разработки: журнал WAL, чтобы чтение не
+           блокировалось записью, synchronous=NORMAL и ожидание снятия
+           блокировки вместо немедленной ошибки "database is locked";
+    prod - MySQL (PyMySQL): пул фиксированного размера с ограниченным
+           переполнением и временем ожидания, проверка соединения перед
+           выдачей (pool_pre_ping) и пересоздание соединений раньше, чем их
+           закроет сервер (pool_recycle), - без этого после простоя
+           возникает ошибка "MySQL server has gone away".
+
+Профиль выбирается переменной окружения DB_PROFILE, по умолчанию - по
+диалекту SQLALCHEMY_DATABASE_URI. Размеры пула можно переопределить
+переменными DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT и DB_POOL_RECYCLE.
+
+Время ожидания свободного соединения из пула записывается в статистику пула;
+долгие ожидания записываются в журнал приложения.
+
+Классы:
+    PoolStats: Статистика ожидания соединений из пула.
+    TimedQueuePool: Пул соединений, измеряющий время ожидания соединения.
+
+Функции:
+    default_profile(uri) -> str:
+        Выбирает профиль по адресу базы данных.
+
+    engine_options(profile, uri, overrides) -> dict:
+        Формирует SQLALCHEMY_ENGINE_OPTIONS для профиля.
+
+    configure_engines(app, db) -> None:
+        Применяет настройки соединений профиля к движкам приложения.
+
+    pool_stats(db) -> list[dict]:
+        Возвращает статистику пулов всех движков.
+
+Атрибуты:
+    ENGINE_PROFILES (dict): Профили подключения.
+"""
+
+import threading
+import time
+from collections import deque
+
+import sqlalchemy as sa
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+ENGINE_PROFILES = {
+    'dev': {
+        'dialect': 'sqlite',
+        'engine': {
+            'pool_size': 5,
+            'max_overflow': 10,
+            'pool_timeout': 30,
+            # Ожидание снятия блокировки записи другим процессом, сек.
+            'connect_args': {'timeout': 15},
+        },
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'foreign_keys': 'ON',
+            'busy_timeout': 15000,
+            'temp_store': 'MEMORY',
+            'cache_size': -20000,
+        },
+    },
+    'prod': {
+        'dialect': 'mysql',
+        'engine': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 10,
+            'pool_pre_ping': True,
+            # Меньше wait_timeout сервера и таймаутов прокси перед ним
+            'pool_recycle': 280,
+            'connect_args': {'connect_timeout': 5, 'read_timeout': 30,
+                             'write_timeout': 30},
+        },
+        'session': {
+            'innodb_lock_wait_timeout': 10,
+        },
+    },
+}
+
+# Ожидание соединения из пула дольше этого времени записывается в журнал
+SLOW_WAIT_SECONDS = 0.5
+
+
+class PoolStats:
+    """
+    Статистика ожидания соединений из пула.
+
+    Args:
+        name (str): Название пула (ключ привязки движка).
+        window (int): Количество последних ожиданий для расчёта перцентилей.
+
+    Методы:
+        record(self, seconds) -> None:
+            Записывает время ожидания соединения.
+
+        record_timeout(self) -> None:
+            Записывает отказ в соединении по истечении pool_timeout.
+
+        stats(self) -> dict:
+            Возвращает статистику ожиданий.
+    """
+
+    def __init__(self, name: str = 'primary', window: int = 1024) -> None:
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """
+        Записывает время ожидания соединения.
+
+        Args:
+            seconds (float): Время ожидания в секундах.
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._recent.append(seconds)
+
+    def record_timeout(self) -> None:
+        """
+        Записывает отказ в соединении по истечении pool_timeout.
+        """
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику ожиданий.
+
+        Returns:
+            Словарь с названием пула, количеством выданных соединений и
+            отказов, средним, максимальным, 50-м и 95-м перцентилями времени
+            ожидания в секундах.
+        """
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts = self.checkouts
+            return {
+                'name': self.name,
+                'checkouts': checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg': self.wait_total / checkouts if checkouts else 0.0,
+                'wait_max': self.wait_max,
+                'wait_p50': recent[len(recent) // 2] if recent else 0.0,
+                'wait_p95': (recent[int(len(recent) * 0.95)]
+                             if recent else 0.0),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """
+    Пул соединений QueuePool, измеряющий время ожидания свободного
+    соединения.
+
+    Атрибуты:
+        stats (PoolStats): Статистика ожидания соединений. Сохраняется при
+                           пересоздании пула (engine.dispose()).
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self._timing = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get вызывает себя повторно, когда соединение забрал
+        # другой поток; измеряется только внешний вызов.
+        if getattr(self._timing, 'active', False):
+            return super()._do_get()
+        self._timing.active = True
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        finally:
+            self._timing.active = False
+            waited = time.perf_counter() - started
+            self.stats.record(waited)
+            if waited > SLOW_WAIT_SECONDS:
+                self.logger.warning(
+                    'Ожидание соединения из пула %s: %.3f сек. (%s)',
+                    self.stats.name, waited, self.status())
+
+    def recreate(self) -> 'TimedQueuePool':
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def default_profile(uri: str | None) -> str:
+    """
+    Выбирает профиль по диалекту адреса базы данных.
+
+    Args:
+        uri (str): SQLALCHEMY_DATABASE_URI.
+
+    Returns:
+        'prod' для MySQL, иначе 'dev'.
+    """
+    if uri and sa.engine.make_url(uri).get_backend_name() == 'mysql':
+        return 'prod'
+    return 'dev'
+
+
+def engine_options(profile: str, uri: str | None,
+                   overrides: dict | None = None) -> dict:
+    """
+    Формирует параметры создания движков для профиля.
+
+    Args:
+        profile (str): Название профиля из ENGINE_PROFILES.
+        uri (str): SQLALCHEMY_DATABASE_URI.
+        overrides (dict): Параметры пула, заменяющие параметры профиля;
+                          значения None пропускаются.
+
+    Returns:
+        Словарь для SQLALCHEMY_ENGINE_OPTIONS.
+
+    Raises:
+        ValueError: Если профиль неизвестен.
+    """
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f'Неизвестный профиль базы данных: {profile}')
+    options = dict(ENGINE_PROFILES[profile]['engine'])
+    options.update({key: value for key, value in (overrides or {}).items()
+                    if value is not None})
+    url = sa.engine.make_url(uri) if uri else None
+    if url is not None and url.get_backend_name() == 'sqlite' \
+            and url.database in (None, '', ':memory:'):
+        # Для базы в памяти Flask-SQLAlchemy использует StaticPool с одним
+        # соединением, параметры пула к нему не применяются
+        return {}
+    options['poolclass'] = TimedQueuePool
+    return options
+
+
+def configure_engines(app, db) -> None:
+    """
+    Применяет к соединениям движков приложения настройки профиля: PRAGMA для
+    SQLite и переменные сессии для MySQL. Настройки применяются только к
+    движкам диалекта профиля, так что реплики другого диалекта не
+    затрагиваются. Задаёт названия статистики пулов по ключам привязок.
+
+    Args:
+        app (Flask): Приложение.
+        db (SQLAlchemy): Расширение Flask-SQLAlchemy.
+    """
+    profile = ENGINE_PROFILES[app.config['DB_PROFILE']]
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.stats.name = key or 'primary'
+        if engine.dialect.name != profile['dialect']:
+            continue
+        if engine.dialect.name == 'sqlite' and profile.get('pragmas'):
+            event.listen(engine, 'connect',
+                         _sqlite_pragmas(profile['pragmas']))
+        if engine.dialect.name == 'mysql' and profile.get('session'):
+            event.listen(engine, 'connect',
+                         _mysql_session(profile['session']))
+
+
+def _sqlite_pragmas(pragmas: dict):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_pragmas
+
+
+def _mysql_session(variables: dict):
+    def set_variables(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in variables.items():
+            cursor.execute(f'SET SESSION {name} = %s', (value,))
+        cursor.close()
+    return set_variables
+
+
+def pool_stats(db) -> list:
+    """
+    Возвращает статистику пулов всех движков. Вызывается в контексте
+    приложения.
+
+    Args:
+        db (SQLAlchemy): Расширение Flask-SQLAlchemy.
+
+    Returns:
+        Список словарей PoolStats.stats с текущим числом выданных
+        соединений и переполнением пула.
+    """
+    result = []
+    for engine in db.engines.values():
+        pool = engine.pool
+        if not isinstance(pool, TimedQueuePool):
+            continue
+        stats = pool.stats.stats()
+        stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                     overflow=pool.overflow())
+        result.append(stats)
+    return result
@@ -0,0 +1,113 @@
+"""
+Модуль распределения запросов между основной базой данных и репликами.
+
+Запросы на чтение (SELECT) выполняются на одной из реплик, перечисленных в
+переменной окружения DB_REPLICAS (одной и той же в пределах сессии), а все
+изменения - на основной базе
+(SQLALCHEMY_DATABASE_URI). Чтобы пользователь сразу видел свои изменения,
+несмотря на задержку репликации, после записи все запросы той же сессии, а
+также запросы того же пользователя в течение DB_STICKY_SECONDS секунд
+(отметка хранится в cookie сессии Flask) выполняются на основной базе.
+
+Если реплики не заданы, все запросы выполняются на основной базе.
+
+Для локальной проверки можно указать в качестве реплики второй файл SQLite
+и копировать в него основную базу командой
+`flask --app controller replica-sync`.
+
+Классы:
+    RoutingSession: Сессия Flask-SQLAlchemy, выбирающая базу для запроса.
+
+Функции:
+    replica_binds(urls) -> dict:
+        Формирует SQLALCHEMY_BINDS для реплик.
+
+Атрибуты:
+    REPLICA_PREFIX (str): Префикс ключей привязок реплик.
+"""
+
+import random
+import time
+
+import sqlalchemy as sa
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+REPLICA_PREFIX = 'replica_'
+
+# Ключ отметки времени в cookie сессии Flask, до которой чтение идёт с
+# основной базы
+STICKY_KEY = '_db_primary_until'
+
+
+def replica_binds(urls: str | None) -> dict:
+    """
+    Формирует привязки реплик для SQLALCHEMY_BINDS.
+
+    Args:
+        urls (str): Адреса реплик через запятую или None.
+
+    Returns:
+        Словарь {ключ привязки: адрес реплики}.
+    """
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {f'{REPLICA_PREFIX}{index}': url for index, url in enumerate(urls)}
+
+
+class RoutingSession(Session):
+    """
+    Сессия, направляющая запросы на чтение на реплики, а изменения и
+    запросы после изменений - на основную базу.
+
+    Методы:
+        get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+            Выбирает базу для запроса.
+
+        use_primary(self) -> None:
+            Направляет оставшиеся запросы сессии на основную базу, например
+            перед чтением, которое должно видеть только что сделанные
+            изменения: db.session().use_primary().
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        replicas = [engine for key, engine in self._db.engines.items()
+                    if key and key.startswith(REPLICA_PREFIX)]
+        # Модели с собственной привязкой и служебные запросы без SELECT
+        # выполняются как обычно
+        if not replicas or primary is not self._db.engines.get(None):
+            return primary
+        if self._flushing or isinstance(clause, (sa.Insert, sa.Update,
+                                                 sa.Delete)):
+            self.use_primary()
+            return primary
+        if not isinstance(clause, sa.Select) or self.info.get('primary') \
+                or self.sticky():
+            return primary
+        # Реплика выбирается один раз на сессию: реплики отстают по-разному,
+        # и запросы одной сессии должны видеть одно состояние данных
+        if self.info.get('replica') not in replicas:
+            self.info['replica'] = random.choice(replicas)
+        return self.info['replica']
+
+    def use_primary(self) -> None:
+        """
+        Направляет оставшиеся запросы сессии на основную базу, а запросы
+        текущего пользователя - на DB_STICKY_SECONDS секунд.
+        """
+        self.info['primary'] = True
+        if has_request_context():
+            window = current_app.config['DB_STICKY_SECONDS']
+            session[STICKY_KEY] = time.time() + window
+
+    @staticmethod
+    def sticky() -> bool:
+        """
+        Проверяет, изменял ли текущий пользователь данные в последние
+        DB_STICKY_SECONDS секунд.
+        """
+        return (has_request_context()
+                and session.get(STICKY_KEY, 0) > time.time())
+
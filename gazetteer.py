@@ -0,0 +1,244 @@
+"""
+Модуль офлайн-справочника городов для автодополнения места рождения.
+
+Справочник загружается из файла в формате GeoNames (полная выгрузка
+cities15000.txt или её компактная выжимка, поставляемая вместе с проектом) и
+хранится в виде отсортированного массива нормализованных названий. Поиск по
+префиксу выполняется бинарным поиском, поэтому ответ не зависит от размера
+справочника и не требует обращений к внешним сервисам геокодирования.
+
+Классы:
+    CityGazetteer: Справочник городов с префиксным индексом.
+
+Атрибуты:
+    gazetteer (CityGazetteer): Общий экземпляр справочника, загружаемый при
+    первом обращении.
+
+Зависимости:
+    Путь к файлу справочника задаётся конфигурацией GAZETTEER_PATH в модуле
+    app.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from app import app
+
+# Количество колонок в полной выгрузке GeoNames
+GEONAMES_COLUMNS = 19
+
+
+class CityGazetteer:
+    """
+    Справочник городов с префиксным индексом.
+
+    Каждый город хранится один раз в параллельных массивах (название, страна,
+    координаты, население), а индекс содержит все варианты названия города
+    (основное и альтернативные), отсортированные по нормализованному виду.
+
+    Args:
+        path (str): Путь к файлу справочника.
+
+    Методы:
+        search(self, query: str, limit: int = 10) -> list[dict]:
+            Возвращает города, название которых начинается с query,
+            упорядоченные по убыванию населения.
+
+        resolve(self, city: str) -> dict | None:
+            Возвращает координаты города по точному совпадению названия.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Инициализирует пустой справочник. Данные загружаются лениво при первом
+        поиске.
+
+        Args:
+            path (str): Путь к файлу справочника.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._names = []
+        self._countries = []
+        self._latitude = array('d')
+        self._longitude = array('d')
+        self._population = array('q')
+        self._keys = []
+        self._labels = []
+        self._cities = array('i')
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        """
+        Приводит название к виду, по которому строится индекс: нижний регистр,
+        «ё» заменяется на «е», дефисы и повторяющиеся пробелы убираются.
+
+        Args:
+            name (str): Исходное название.
+
+        Returns:
+            Нормализованное название.
+        """
+        name = name.lower().replace('ё', 'е').replace('-', ' ')
+        return ' '.join(name.split())
+
+    @staticmethod
+    def parse_line(line: str) -> tuple | None:
+        """
+        Разбирает строку справочника в полном или компактном формате GeoNames.
+
+        Args:
+            line (str): Строка файла.
+
+        Returns:
+            Кортеж (название, альтернативные названия, широта, долгота,
+            страна, население) или None для пустых строк и комментариев.
+        """
+        if not line.strip() or line.startswith('#'):
+            return None
+        columns = line.rstrip('\n').split('\t')
+        if len(columns) >= GEONAMES_COLUMNS:
+            name, alternatenames = columns[1], columns[3]
+            latitude, longitude = columns[4], columns[5]
+            country, population = columns[8], columns[14]
+        else:
+            (name, alternatenames, latitude, longitude,
+             country, population) = columns[:6]
+        return (name,
+                [alt for alt in alternatenames.split(',') if alt],
+                float(latitude),
+                float(longitude),
+                country,
+                int(population or 0))
+
+    def load(self) -> None:
+        """
+        Загружает справочник из файла и строит префиксный индекс. Повторные
+        вызовы ничего не делают.
+        """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            entries = []
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    city = self.parse_line(line)
+                    if city is None:
+                        continue
+                    (name, alternatenames, latitude, longitude,
+                     country, population) = city
+                    index = len(self._names)
+                    self._names.append(name)
+                    self._countries.append(country)
+                    self._latitude.append(latitude)
+                    self._longitude.append(longitude)
+                    self._population.append(population)
+                    seen = set()
+                    for label in [name, *alternatenames]:
+                        key = self.normalize(label)
+                        if key and key not in seen:
+                            seen.add(key)
+                            entries.append((key, label, index))
+            entries.sort()
+            self._keys = [entry[0] for entry in entries]
+            self._labels = [entry[1] for entry in entries]
+            self._cities = array('i', (entry[2] for entry in entries))
+            self._loaded = True
+
+    def city(self, index: int, label: str | None = None) -> dict:
+        """
+        Формирует описание города по его номеру в справочнике.
+
+        Args:
+            index (int): Номер города.
+            label (str): Название, под которым город был найден.
+
+        Returns:
+            Словарь с названием, страной и координатами города.
+        """
+        return {
+            'name': label or self._names[index],
+            'country': self._countries[index],
+            'latitude': self._latitude[index],
+            'longitude': self._longitude[index],
+        }
+
+    @lru_cache(maxsize=4096)
+    def _search(self, prefix: str, limit: int) -> tuple:
+        """
+        Ищет города по нормализованному префиксу. Результаты кэшируются, так
+        как короткие префиксы совпадают с большой частью справочника.
+
+        Args:
+            prefix (str): Нормализованный префикс.
+            limit (int): Максимальное количество результатов.
+
+        Returns:
+            Кортеж пар (номер города, найденное название).
+        """
+        found = {}
+        position = bisect_left(self._keys, prefix)
+        while (position < len(self._keys)
+               and self._keys[position].startswith(prefix)):
+            index = self._cities[position]
+            if index not in found:
+                found[index] = self._labels[position]
+            position += 1
+        best = sorted(found, key=lambda i: self._population[i],
+                      reverse=True)[:limit]
+        return tuple((index, found[index]) for index in best)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        Возвращает города, название которых начинается с query.
+
+        Args:
+            query (str): Начало названия города.
+            limit (int): Максимальное количество результатов.
+
+        Returns:
+            Список словарей с названием, страной и координатами городов,
+            упорядоченный по убыванию населения.
+        """
+        prefix = self.normalize(query or '')
+        if not prefix:
+            return []
+        self.load()
+        return [self.city(index, label)
+                for index, label in self._search(prefix, limit)]
+
+    def resolve(self, city: str) -> dict | None:
+        """
+        Определяет координаты города по точному совпадению названия. Из
+        нескольких одноимённых городов выбирается самый населённый.
+
+        Args:
+            city (str): Название города.
+
+        Returns:
+            Словарь с ключами "latitude" и "longitude" или None, если город
+            отсутствует в справочнике.
+        """
+        key = self.normalize(city or '')
+        if not key:
+            return None
+        self.load()
+        best = None
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            index = self._cities[position]
+            if best is None or self._population[index] > self._population[best]:
+                best = index
+            position += 1
+        if best is None:
+            return None
+        return {'latitude': self._latitude[best],
+                'longitude': self._longitude[best]}
+
+
+gazetteer = CityGazetteer(app.config['GAZETTEER_PATH'])
@@ -56,6 +56,11 @@ from dotenv import load_dotenv
 from geopy.geocoders import Nominatim
 from openai import OpenAI
 
+from cache import geocode_cache, moon_cache
+from gazetteer import gazetteer
+from metrics import metrics
+from ops_metrics import ops_metrics
+
 
 class BaseHoroscope:
     """
@@ -73,6 +78,8 @@ class BaseHoroscope:
         __init__(self) -> None: Инициализирует клиента OpenAI.
         get_response(self) -> str: Генерирует гороскоп и возвращает текстовый
         ответ.
+        complete(self, system, user) -> str: Отправляет запрос модели и
+        возвращает текст ответа.
     """
 
     client = None
@@ -94,13 +101,28 @@ class BaseHoroscope:
         Returns:
             Строка с текстом гороскопа, сгенерированного моделью OpenAI.
         """
-        completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
-            messages=[
-                {"role": "system", "content": self.description},
-                {"role": "user", "content": self.user_request()}
-            ]
-            )
+        return self.complete(self.description, self.user_request())
+
+    def complete(self, system: str, user: str) -> str:
+        """
+        Отправляет запрос модели OpenAI. Время ответа записывается в
+        замеры панели эксплуатации.
+
+        Args:
+            system (str): Описание задания для модели.
+            user (str): Запрос пользователя.
+
+        Returns:
+            Строка с текстом ответа модели.
+        """
+        with ops_metrics.llm_call(), metrics.stage('llm'):
+            completion = self.client.chat.completions.create(
+                model="gpt-3.5-turbo-1106",
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user}
+                ]
+                )
         return completion.choices[0].message.content
 
 
@@ -335,7 +357,9 @@ class GetAstralData(GetJulianDate):
     @staticmethod
     def get_coordinates(city: str, user_agent='dec') -> dict:
         """
-        Ищет географические координаты города.
+        Ищет географические координаты города. Сначала город ищется в
+        офлайн-справочнике и в общем кэше геокодирования, и только при их
+        отсутствии выполняется запрос к геолокационному сервису.
 
         Args:
             city (str): Название города.
@@ -346,13 +370,26 @@ class GetAstralData(GetJulianDate):
             Словарь с ключами "latitude" и "longitude", содержащий
             географические координаты города.
         """
+        coordinates = gazetteer.resolve(city)
+        if coordinates:
+            ops_metrics.record_geocode('gazetteer')
+            return coordinates
+        coordinates = geocode_cache.get(city)
+        if coordinates:
+            ops_metrics.record_geocode('cache')
+            return coordinates
         try:
             geolocator = Nominatim(user_agent=user_agent)
-            location = geolocator.geocode(city)
-            return {"latitude": location.latitude,
-                    "longitude": location.longitude}
+            with metrics.stage('geocode'):
+                location = geolocator.geocode(city)
+            coordinates = {"latitude": location.latitude,
+                           "longitude": location.longitude}
+            geocode_cache.set(city, coordinates)
+            ops_metrics.record_geocode('service')
+            return coordinates
         except geopy.exc.GeopyError:
-            GetAstralData.get_coordinates(
+            ops_metrics.record_geocode('error')
+            return GetAstralData.get_coordinates(
                 city, user_agent=GetAstralData.create_random_str())
 
     def __init__(self, date, birth_place) -> None:
@@ -361,11 +398,16 @@ class GetAstralData(GetJulianDate):
 
         Args:
             date (datetime): Дата и время рождения.
-            birth_place (str): Место рождения.
+            birth_place (str | dict): Место рождения: название города или
+            словарь с ключами "latitude" и "longitude".
         """
         super().__init__(date)
-        self.birth_place = GetAstralData.get_coordinates(birth_place)
+        if isinstance(birth_place, dict):
+            self.birth_place = birth_place
+        else:
+            self.birth_place = GetAstralData.get_coordinates(birth_place)
 
+    @metrics.timed('ephemeris')
     def calc_planet_positions(self) -> dict:
         """
         Рассчитывает положения всех зарегистрированных планет на момент
@@ -380,6 +422,7 @@ class GetAstralData(GetJulianDate):
                 self.jd, planet[1])[0][0] for planet in self.planets}
         return planet_positions
 
+    @metrics.timed('ephemeris')
     def calc_planet_position(self, planet: int) -> float:
         """
         Рассчитывает положение указанной планеты на момент рождения.
@@ -393,6 +436,7 @@ class GetAstralData(GetJulianDate):
         planet_position = swe.calc_ut(self.jd, planet)[0][0]
         return planet_position
 
+    @metrics.timed('ephemeris')
     def calc_houses_positions(self) -> list:
         """
         Рассчитывает положения астрологических домов на момент рождения.
@@ -511,11 +555,13 @@ class GetSpecialHoroscope(BaseHoroscope, GetJulianDate):
     Args:
     zodiac_signs: Список названий знаков зодиака.
     zodiac_sign: Знак зодиака, для которого создается гороскоп.
+    retrograde: Планеты, ретроградные на дату гороскопа.
     position_moon: Текущее положение Луны в зодиакальном круге.
     description: Описание для запроса в OpenAI,
     специфичное для данного типа гороскопа.
 
     Методы
+    moon_context(): Положение Луны и лунный день из общего кэша.
     calc_position_moon(): Расчет текущего положения Луны.
     moon_in_sign(): Определение знака зодиака и астрологического дома Луны.
     opposite_zodiac_sign(): Вычисление противоположного знака зодиака и
@@ -531,7 +577,8 @@ class GetSpecialHoroscope(BaseHoroscope, GetJulianDate):
             "Стрелец", "Козерог", "Водолей", "Рыбы"
         ]
 
-    def __init__(self, date: datetime, zodiac_sign: str) -> None:
+    def __init__(self, date: datetime, zodiac_sign: str,
+                 retrograde: list | None = None) -> None:
         """
         Инициализация класса для получения специального гороскопа.
 
@@ -539,13 +586,33 @@ class GetSpecialHoroscope(BaseHoroscope, GetJulianDate):
             date (datetime.datetime): Дата для расчета положения Луны и
             лунных дней.
             zodiac_sign (str): Знак зодиака для гороскопа.
+            retrograde (list): Планеты, ретроградные на эту дату, из
+            календаря астрологических событий.
         """
         BaseHoroscope.__init__(self)
         GetJulianDate.__init__(self, date)
         self.zodiac_sign = zodiac_sign
-        self.position_moon = self.calc_position_moon()
+        self.retrograde = retrograde or []
+        moon = self.moon_context()
+        self.position_moon = moon['position_moon']
+        self.lunar_day = moon['lunar_day']
         self.description = self.description()
 
+    def moon_context(self) -> dict:
+        """
+        Возвращает положение Луны и лунный день на дату гороскопа из общего
+        кэша, рассчитывая их только при отсутствии в кэше.
+
+        Returns:
+            Словарь с ключами "position_moon" и "lunar_day".
+        """
+        return moon_cache.get_or_load(
+            self.date.isoformat(),
+            lambda: {'position_moon': self.calc_position_moon(),
+                     'lunar_day': self.get_lunar_day()},
+        )
+
+    @metrics.timed('ephemeris')
     def calc_position_moon(self) -> str:
         """
         Расчет текущего положения Луны в зодиакальном круге.
@@ -626,7 +693,10 @@ class GetSpecialHoroscope(BaseHoroscope, GetJulianDate):
                f'{self.moon_in_sign()[1]}. Негативное влияние будет оказывать '
                f'{self.opposite_zodiac_sign()[0]}, астрологический '
                f'дом: {self.opposite_zodiac_sign()[1]}'
-               f'Лунный день сейчас {self.get_lunar_day()}. '
+               f'Лунный день сейчас {self.lunar_day}. '
                'Начти без вступления и не разбивай на пункты.'
                )
+        if self.retrograde:
+            res += (' Учти, что в этот день ретроградны: '
+                    f'{", ".join(self.retrograde)}.')
         return res
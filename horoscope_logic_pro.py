@@ -1,10 +1,13 @@
 import calendar
 from copy import copy
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import swisseph as swe
 
+from cache import natal_section_cache
 from horoscope_logic import BaseHoroscope, GetAstralData
+from metrics import metrics
 
 
 class GetNatalChart2(BaseHoroscope):
@@ -153,17 +156,15 @@ class GetNatalChart2(BaseHoroscope):
         planet: Планета, для которой запрашивается ответ.
         aspects: Аспекты планеты.
         Returns:
-        Строку с ответом на запрос.
-        """
-        completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
-            messages=[
-                {"role": "system", "content": self.description},
-                {"role": "user", "content": self.user_request(planet,
-                                                              aspects)}
-            ]
-            )
-        return completion.choices[0].message.content
+        Строку с ответом на запрос. Ответы на одинаковые запросы берутся из
+        общего кэша разделов натальной карты.
+        """
+        request = self.user_request(planet, aspects)
+
+        def create() -> str:
+            return self.complete(self.description, request)
+
+        return natal_section_cache.get_or_load(request, create)
 
     def natal_chart(self) -> str:
         """
@@ -199,6 +200,9 @@ class TranzitMonth(GetNatalChart2):
     user_request(self) -> str
     Формирует запрос пользователя для генерации месячного прогноза.
 
+    get_response(self) -> str
+    Отправляет запрос в OpenAI и возвращает прогноз на месяц.
+
     user_request_con(self) -> str
     Дополнительная функция для формирования запроса, связанного с
     консультацией.
@@ -251,17 +255,15 @@ class TranzitMonth(GetNatalChart2):
         )
 
     def __init__(self, birth_date, birth_place) -> None:
-        super().__init__()
+        super().__init__(birth_date, birth_place)
 
         # Текущий месяц и год
         self.c_month = datetime.now().month
         self.c_year = datetime.now().year
+        # Ключ месяца прогноза для хранения в UserTranzit
+        self.period = f'{self.c_year}-{self.c_month:02d}'
         # Текущее место
         self.c_place = birth_place
-        # Дата рождения
-        self.birth_date = birth_date
-        self.birth_place = birth_place
-        self.astralData = GetAstralData(self.birth_date, self.birth_place)
         self.len_month = calendar.monthrange(self.c_year, self.c_month)[1]
 
     def tranzit(self) -> str:
@@ -306,6 +308,17 @@ class TranzitMonth(GetNatalChart2):
         res = f'{self.tranzit()}'
         return res
 
+    def get_response(self) -> str:
+        """
+        Получает прогноз на месяц от API OpenAI. Запрос к модели формируется
+        методом user_request без аргументов, поэтому используется реализация
+        BaseHoroscope, а не разделов натальной карты.
+
+        Returns:
+        Строку с прогнозом на месяц.
+        """
+        return BaseHoroscope.get_response(self)
+
     def user_request_con(self) -> str:
         """
         Формирует пользовательский запрос.
@@ -323,14 +336,170 @@ class TranzitMonth(GetNatalChart2):
         Returns:
         Строку с ответом API на запрос пользователя.
         """
-        completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
-            messages=[
-                {"role": "system", "content": self.description_con},
-                {"role": "user", "content": self.user_request_con()}
-            ]
-            )
-        return completion.choices[0].message.content
+        return self.complete(self.description_con, self.user_request_con())
+
+
+class SolarReturn(GetNatalChart2):
+    """
+    Прогноз на год по соляру (моменту точного возвращения Солнца в натальную
+    позицию) и вторичным прогрессиям (сутки после рождения соответствуют году
+    жизни).
+
+    Моменты находятся методом Ньютона по долготе Солнца из Swiss Ephemeris,
+    где производной служит скорость Солнца, поэтому перебор по дням не нужен.
+    Найденные моменты кэшируются для пары (натальная дата, год).
+
+    Методы
+    find_longitude(planet: int, longitude: float, jd: float) -> float
+    Находит момент, когда планета проходит заданную долготу, начиная поиск
+    с jd.
+
+    solar_return_jd(self) -> float
+    Возвращает юлианскую дату соляра в заданном году.
+
+    progressed_jd(self) -> float
+    Возвращает юлианскую дату прогрессированной карты на момент соляра.
+
+    user_request(self) -> str
+    Формирует запрос с положениями планет соляра, их аспектами к натальным
+    планетам и прогрессированными знаками.
+
+    get_response(self) -> str
+    Отправляет запрос в OpenAI и возвращает прогноз на год.
+        """
+
+    # Длительность тропического года в сутках
+    tropical_year = 365.24219
+
+    description = (
+        'Ты профессиональный астролог. Сейчас идет сеанс прогноза на год по '
+        'соляру и вторичным прогрессиям. Опиши главные темы года, на что '
+        'стоит направить силы, какие сферы жизни будут в центре внимания и '
+        'чего стоит опасаться. Учитывай аспекты планет соляра к натальным '
+        'планетам и знаки прогрессированных Солнца и Луны. '
+        'Проверь текст, он должен быть только на русском языке.'
+        )
+
+    def __init__(self, birth_date: datetime, birth_place: str | dict,
+                 year: int | None = None) -> None:
+        """
+        Инициализирует прогноз на год.
+
+        Args:
+        birth_date: Дата и время рождения.
+        birth_place: Место рождения: название города или координаты.
+        year: Год соляра, по умолчанию текущий.
+        """
+        super().__init__(birth_date, birth_place)
+        self.year = year or datetime.now().year
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    @metrics.timed('ephemeris')
+    def find_longitude(planet: int, longitude: float, jd: float) -> float:
+        """
+        Находит момент прохождения планетой заданной долготы методом Ньютона.
+
+        Args:
+        planet: Идентификатор планеты в Swiss Ephemeris.
+        longitude: Искомая долгота в градусах.
+        jd: Начальное приближение (юлианская дата).
+        Returns:
+        Юлианская дата прохождения долготы.
+        """
+        for _ in range(20):
+            position = swe.calc_ut(jd, planet, swe.FLG_SWIEPH | swe.FLG_SPEED)
+            difference = (position[0][0] - longitude + 180) % 360 - 180
+            step = difference / position[0][3]
+            jd -= step
+            if abs(step) < 1e-7:
+                break
+        return jd
+
+    def solar_return_jd(self) -> float:
+        """
+        Рассчитывает момент соляра: возвращение Солнца в натальную долготу в
+        заданном году.
+
+        Returns:
+        Юлианская дата соляра.
+        """
+        natal_sun = self.astralData.calc_planet_position(swe.SUN)
+        guess = self.astralData.jd + (
+            self.year - self.birth_date.year) * self.tropical_year
+        return SolarReturn.find_longitude(swe.SUN, natal_sun, guess)
+
+    def progressed_jd(self) -> float:
+        """
+        Рассчитывает дату вторичных прогрессий: после рождения проходит
+        столько суток, сколько лет исполняется в момент соляра.
+
+        Returns:
+        Юлианская дата прогрессированной карты.
+        """
+        age = (self.solar_return_jd() - self.astralData.jd) / self.tropical_year
+        return self.astralData.jd + age
+
+    @metrics.timed('ephemeris')
+    def positions(self, jd: float) -> dict:
+        """
+        Рассчитывает положения планет на заданный момент.
+
+        Args:
+        jd: Юлианская дата.
+        Returns:
+        Словарь с названиями планет и их положениями в градусах.
+        """
+        return {planet[0]: swe.calc_ut(jd, planet[1])[0][0]
+                for planet in self.astralData.planets}
+
+    def sign(self, position: float) -> str:
+        """
+        Определяет знак зодиака по долготе.
+
+        Args:
+        position: Долгота в градусах.
+        Returns:
+        Название знака зодиака.
+        """
+        for bounds, sign in self.astralData.zodiac_range.items():
+            if bounds[0] <= position < bounds[0] + 30:
+                return sign
+
+    def user_request(self) -> str:
+        """
+        Формирует запрос с положениями планет соляра, их аспектами к
+        натальным планетам и знаками прогрессированных Солнца и Луны.
+
+        Returns:
+        Строку с запросом пользователя.
+        """
+        natal = self.astralData.calc_planet_positions()
+        solar = self.positions(self.solar_return_jd())
+        progressed = self.positions(self.progressed_jd())
+        res = f'Соляр на {self.year} год. '
+        for planet, position in solar.items():
+            res += f'{planet} соляра в знаке {self.sign(position)}. '
+        for planet, position in solar.items():
+            for natal_planet in self.personal_planets:
+                aspect = SolarReturn.calculate_aspect(
+                    position, natal[natal_planet], 3)
+                if aspect:
+                    res += (f'{planet} соляра в аспекте {aspect} с '
+                            f'натальным {natal_planet}. ')
+        res += (f'Прогрессированное Солнце в знаке '
+                f'{self.sign(progressed["Солнце"])}, прогрессированная Луна '
+                f'в знаке {self.sign(progressed["Луна"])}.')
+        return res
+
+    def get_response(self) -> str:
+        """
+        Получает прогноз на год от OpenAI.
+
+        Returns:
+        Строку с прогнозом на год.
+        """
+        return BaseHoroscope.get_response(self)
 
 
 class TranzitYear(BaseHoroscope):
@@ -434,14 +603,7 @@ class TranzitYear(BaseHoroscope):
         return res
 
     def get_response_con(self):
-        completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
-            messages=[
-                {"role": "system", "content": self.description_con},
-                {"role": "user", "content": self.user_request_con()}
-            ]
-            )
-        return completion.choices[0].message.content
+        return self.complete(self.description_con, self.user_request_con())
 
 # get = GetNatalChart2(datetime(1988, 1, 29, 17, 45), 'Смоленск')
 # print(get.natal_chart())
@@ -0,0 +1,146 @@
+"""
+Модуль фонового создания гороскопов.
+
+При смене периода гороскоп нового периода ещё не создан, и запрос к модели
+занимает несколько секунд. Чтобы пользователь не ждал ответа модели,
+контроллер сразу отдаёт гороскоп предыдущего периода (или нейтральный текст)
+с признаком устаревания и ставит создание нового гороскопа в фоновую
+очередь. Страница гороскопа периодически повторяет запрос и подменяет текст,
+как только новый гороскоп сохранён в базе данных.
+
+Классы:
+    HoroscopeRefresher: Фоновое создание гороскопов без повторных запросов
+    к модели для одного и того же гороскопа.
+
+Атрибуты:
+    STALE_FALLBACK (str): Текст, отдаваемый до создания первого гороскопа
+    знака на период.
+    horoscope_refresher (HoroscopeRefresher): Очередь создания гороскопов
+    процесса.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from app import app
+from horoscope_logic import GetHoroscope
+from models import DataAccess
+
+STALE_FALLBACK = ('Звёзды готовят для вас новый прогноз. '
+                  'Он появится на этой странице через несколько секунд.')
+
+dataAccess = DataAccess()
+
+
+class HoroscopeRefresher:
+    """
+    Фоновое создание гороскопов в пуле потоков. Для каждого гороскопа
+    (период, дата, знак зодиака) в процессе выполняется не более одного
+    запроса к модели: повторные запросы, пока создание не завершено,
+    получают ту же задачу.
+
+    Args:
+        workers (int): Количество потоков, выполняющих запросы к модели.
+
+    Методы:
+        submit(self, period, date, zodiac_sign) -> Future:
+            Ставит создание гороскопа в очередь, если оно ещё не выполняется.
+
+        refresh(self, period, date, zodiac_sign) -> str:
+            Создаёт гороскоп и сохраняет его в базе данных.
+
+        pending(self) -> int:
+            Возвращает количество задач в очереди и выполняемых задач.
+
+        running(self) -> int:
+            Возвращает количество выполняемых задач.
+    """
+
+    def __init__(self, workers: int = 4) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='horoscope')
+        self._futures = {}
+        self._running = 0
+        self._lock = Lock()
+
+    def submit(self, period: str, date: str, zodiac_sign: str) -> Future:
+        """
+        Ставит создание гороскопа в очередь.
+
+        Args:
+            period (str): Период гороскопа.
+            date (str): Дата начала периода.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            Задача создания гороскопа.
+        """
+        key = dataAccess.horoscope_key(period, date, zodiac_sign)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._executor.submit(self._run, period, date,
+                                               zodiac_sign)
+                self._futures[key] = future
+                future.add_done_callback(lambda _: self._done(key))
+        return future
+
+    def _done(self, key: tuple) -> None:
+        with self._lock:
+            self._futures.pop(key, None)
+
+    def _run(self, period: str, date: str, zodiac_sign: str) -> str:
+        with self._lock:
+            self._running += 1
+        try:
+            return self.refresh(period, date, zodiac_sign)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    @staticmethod
+    def refresh(period: str, date: str, zodiac_sign: str) -> str:
+        """
+        Создаёт гороскоп запросом к модели и сохраняет его в базе данных.
+        Если гороскоп уже создан другим процессом, запрос к модели не
+        выполняется.
+
+        Args:
+            period (str): Период гороскопа.
+            date (str): Дата начала периода.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            Текст гороскопа.
+        """
+        with app.app_context():
+            try:
+                horoscope = dataAccess.get_horoscope(period, date, zodiac_sign)
+                if horoscope:
+                    return horoscope.horoscope
+                text = GetHoroscope(zodiac_sign, period).get_response()
+                dataAccess.add_new_horoscope(period, zodiac_sign, text, date)
+                return text
+            except Exception:
+                app.logger.exception('Не удалось создать гороскоп %s %s %s',
+                                     period, date, zodiac_sign)
+                raise
+
+    def pending(self) -> int:
+        """
+        Возвращает количество гороскопов, ожидающих в очереди или
+        создаваемых в данный момент.
+        """
+        with self._lock:
+            return len(self._futures)
+
+    def running(self) -> int:
+        """
+        Возвращает количество гороскопов, создаваемых в данный момент.
+        """
+        with self._lock:
+            return self._running
+
+
+horoscope_refresher = HoroscopeRefresher(
+    app.config['HOROSCOPE_REFRESH_WORKERS'])
@@ -0,0 +1,249 @@
+"""
+Модуль метрик приложения в формате Prometheus.
+
+Каждый запрос к приложению измеряется без обращений к внешним сервисам:
+    starpower_request_duration_seconds - гистограмма времени обработки
+        запроса по методу и маршруту (endpoint);
+    starpower_requests_in_progress - количество обрабатываемых запросов по
+        методу и маршруту;
+    starpower_responses_total - количество ответов по методу, маршруту и
+        коду ответа;
+    starpower_stage_duration_seconds - гистограмма времени этапов обработки:
+        запросов к базе данных (db), расчётов эфемерид (ephemeris), запросов
+        к сервису геокодирования (geocode) и к языковой модели (llm).
+
+Метрики отдаются по адресу /metrics только при заданном METRICS_TOKEN:
+запрос должен содержать заголовок `Authorization: Bearer <METRICS_TOKEN>`.
+Без токена /metrics отвечает кодом 403.
+
+Время запроса измеряется один раз общими обработчиками запроса модуля
+ops_metrics, которые передают его в start_request и finish_request.
+
+Для нескольких процессов gunicorn перед запуском задаётся переменная
+окружения PROMETHEUS_MULTIPROC_DIR с пустым каталогом: каждый процесс
+пишет значения в свои файлы в этом каталоге, а /metrics складывает файлы
+всех процессов. Из хука child_exit конфигурации gunicorn вызывается
+mark_process_dead(worker.pid), чтобы счётчики обрабатываемых запросов
+завершившегося процесса не учитывались.
+
+Если пакет prometheus_client не установлен, измерения не выполняются, а
+/metrics отвечает кодом 503.
+
+Классы:
+    Metrics: Метрики приложения.
+
+Функции:
+    mark_process_dead(pid) -> None:
+        Удаляет значения завершившегося процесса.
+
+Атрибуты:
+    metrics (Metrics): Метрики приложения.
+"""
+
+import functools
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+# Границы интервалов гистограмм, сек
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+                 2.5, 5, 10, 30, 60)
+
+
+class Metrics:
+    """
+    Метрики приложения. Без пакета prometheus_client методы ничего не
+    измеряют.
+
+    Методы:
+        stage(self, name):
+            Контекстный менеджер, измеряющий этап обработки.
+
+        timed(self, name):
+            Декоратор, измеряющий вызов функции как этап обработки.
+
+        observe_stage(self, name, seconds) -> None:
+            Записывает время этапа обработки.
+
+        start_request(self) -> None:
+            Отмечает начало обработки текущего запроса.
+
+        finish_request(self, seconds) -> None:
+            Записывает время обработки текущего запроса.
+
+        render(self) -> tuple[bytes, str]:
+            Возвращает метрики всех процессов в текстовом формате.
+
+    Атрибуты:
+        enabled (bool): Установлен ли пакет prometheus_client.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = prometheus_client is not None
+        if not self.enabled:
+            return
+        self.request_latency = prometheus_client.Histogram(
+            'starpower_request_duration_seconds',
+            'Время обработки запроса', ('method', 'endpoint'),
+            buckets=REQUEST_BUCKETS)
+        self.in_progress = prometheus_client.Gauge(
+            'starpower_requests_in_progress',
+            'Количество обрабатываемых запросов', ('method', 'endpoint'),
+            multiprocess_mode='livesum')
+        self.responses = prometheus_client.Counter(
+            'starpower_responses',
+            'Количество ответов', ('method', 'endpoint', 'status'))
+        self.stage_latency = prometheus_client.Histogram(
+            'starpower_stage_duration_seconds',
+            'Время этапа обработки запроса', ('stage',),
+            buckets=STAGE_BUCKETS)
+
+    def observe_stage(self, name: str, seconds: float) -> None:
+        """
+        Записывает время этапа обработки.
+
+        Args:
+            name (str): Этап: db, ephemeris, geocode или llm.
+            seconds (float): Время в секундах.
+        """
+        if self.enabled:
+            self.stage_latency.labels(name).observe(seconds)
+
+    def start_request(self) -> None:
+        """
+        Отмечает начало обработки текущего запроса Flask.
+        """
+        if not self.enabled or request.endpoint == 'static':
+            return
+        g.metrics_labels = (request.method, request.endpoint or 'not_found')
+        self.in_progress.labels(*g.metrics_labels).inc()
+
+    def finish_request(self, seconds: float) -> None:
+        """
+        Записывает время обработки текущего запроса Flask.
+
+        Args:
+            seconds (float): Время в секундах.
+        """
+        labels = g.pop('metrics_labels', None)
+        if labels is None:
+            return
+        self.in_progress.labels(*labels).dec()
+        self.request_latency.labels(*labels).observe(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Измеряет этап обработки, в том числе завершившийся исключением.
+
+        Args:
+            name (str): Этап: db, ephemeris, geocode или llm.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - started)
+
+    def timed(self, name: str):
+        """
+        Декоратор, измеряющий каждый вызов функции как этап обработки.
+
+        Args:
+            name (str): Этап: db, ephemeris, geocode или llm.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> tuple:
+        """
+        Возвращает метрики в текстовом формате Prometheus. Если задан
+        PROMETHEUS_MULTIPROC_DIR, значения складываются по всем процессам.
+
+        Returns:
+            Кортеж (текст метрик, тип содержимого).
+        """
+        registry = prometheus_client.REGISTRY
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return (prometheus_client.generate_latest(registry),
+                prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Удаляет значения завершившегося процесса из каталога
+    PROMETHEUS_MULTIPROC_DIR. Вызывается из хука child_exit gunicorn.
+
+    Args:
+        pid (int): Идентификатор процесса.
+    """
+    if prometheus_client is not None and os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+metrics = Metrics()
+
+
+@app.after_request
+def _count_response(response):
+    labels = g.get('metrics_labels')
+    if labels:
+        metrics.responses.labels(*labels, str(response.status_code)).inc()
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    metrics.observe_stage(
+        'db', time.perf_counter() - conn.info['metrics_started'].pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _fail_query(context):
+    connection = context.connection
+    started = connection.info.get('metrics_started') if connection else None
+    if started:
+        metrics.observe_stage('db', time.perf_counter() - started.pop())
+
+
+@app.route('/metrics')
+def metrics_view() -> Response:
+    """
+    Отдаёт метрики всех процессов в текстовом формате Prometheus.
+    """
+    if not metrics.enabled:
+        return Response('prometheus_client не установлен', status=503,
+                        mimetype='text/plain')
+    token = app.config['METRICS_TOKEN']
+    if not token or not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -13,8 +13,18 @@
     User: Модель пользователя, содержащая информацию о пользователе, включая
     логин, электронную почту и пароль.
     UserNatalChart: Модель натальной карты пользователя.
+    UserTranzit: Модель прогноза транзитов пользователя на месяц.
+    UserSolarReturn: Модель прогноза пользователя на год по соляру.
+    UserTranzitAlert: Модель точного личного транзита пользователя.
+    UserNatalSnapshot: Модель рассчитанных данных натальной карты в
+    двоичном виде.
+    AstroEvent: Модель астрологического события (станции или ингрессии
+    планеты).
+    OpsSnapshot: Модель показателей процесса приложения за минуту.
     Horoscope: Модель гороскопа, содержащая информацию о прогнозах для
     различных периодов и знаков зодиака.
+    HoroscopeArchive: Модель гороскопа, перенесённого в архив по сроку
+    хранения.
     DataAccess: Класс для управления доступом к данным, включающий методы для
     работы с пользовательскими данными, гороскопами и натальными картами.
 
@@ -44,10 +54,21 @@ from datetime import datetime, timezone
 
 from flask import flash
 from flask_login import UserMixin, login_user
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import (load_only, make_transient_to_detached,
+                            query_expression)
 from zodiac_sign import get_zodiac_sign
 
 from app import app, db, manager
+from astro_calendar import STATION_DIRECT, STATION_RETROGRADE
+from business_logic import period_end
+from cache import TTLCache, horoscope_cache
+from compression import CompressedText
+from gazetteer import gazetteer
+from passwords import PasswordBusyError, password_hasher
 
 
 class BaseModel:
@@ -125,6 +146,10 @@ class User(db.Model, BaseModel, UserMixin):
         birth_time (datetime.time): Время рождения пользователя. Необяз.
         country (str): Страна проживания пользователя. Необязательный.
         city (str): Город проживания пользователя. Необязательный.
+        latitude (float): Широта города, выбранного из справочника.
+        Необязательный.
+        longitude (float): Долгота города, выбранного из справочника.
+        Необязательный.
         phone (str): Номер телефона пользователя. Необязательный.
         avatar (str): Путь к файлу аватара пользователя. Необязательный.
         sex (str): Пол пользователя. Необязательный.
@@ -132,15 +157,18 @@ class User(db.Model, BaseModel, UserMixin):
         False (не премиум).
         zodiac_sign (str): Знак зодиака пользователя, вычисляется на основе
         даты рождения. Необязательный.
-        natal_chart (relationship): Связь с моделью UserNatalChart для доступа
-        к натальной карте пользователя. Использует внешний ключ и ленивую
-        загрузку.
+        natal_chart (relationship): Связь один к одному с моделью
+        UserNatalChart для доступа к натальной карте пользователя. Использует
+        внешний ключ и ленивую загрузку.
 
     Использование:
         Для создания нового пользователя используйте метод create класса
         BaseModel.
     """
     __tablename__ = 'user_SP'
+    __table_args__ = (
+        db.Index('ix_user_created_at', 'created_at'),
+    )
 
     login = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -152,12 +180,25 @@ class User(db.Model, BaseModel, UserMixin):
     birth_time = db.Column(db.Time, nullable=True)
     country = db.Column(db.String(100), nullable=True)
     city = db.Column(db.String(100), nullable=True)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     avatar = db.Column(db.String(255), nullable=True)
     sex = db.Column(db.String(10), nullable=True)
     premium = db.Column(db.Boolean, default=False)
     zodiac_sign = db.Column(db.String(15), nullable=True)
-    natal_chart = db.relationship('UserNatalChart', backref='users', lazy=True)
+    natal_chart = db.relationship('UserNatalChart', backref='user',
+                                  uselist=False, lazy='select')
+
+    @property
+    def birth_place(self) -> dict | str:
+        """
+        Место рождения для астрологических расчётов: координаты, если город
+        выбран из справочника, иначе название города.
+        """
+        if self.latitude is not None and self.longitude is not None:
+            return {'latitude': self.latitude, 'longitude': self.longitude}
+        return self.city
 
     def __repr__(self) -> str:
         return (f'id: {self.id}\n'
@@ -165,6 +206,25 @@ class User(db.Model, BaseModel, UserMixin):
                 f'email: {self.email}\n')
 
 
+# Форматы логина (5-25 символов), электронной почты (домен верхнего уровня
+# от 2 до 4 символов) и пароля (5-36 символов) нового пользователя
+LOGIN_PATTERN = re.compile(r'^.{5,25}$')
+EMAIL_PATTERN = re.compile(r'^[-\w\.]+@([-\w]+\.)+[-\w]{2,4}$')
+PASSWORD_PATTERN = re.compile(r'^.{5,36}$')
+
+# Поля пользователя, загружаемые при каждом запросе (load_user)
+SESSION_COLUMNS = ('id', 'login', 'name', 'avatar', 'premium', 'zodiac_sign',
+                   'birthday', 'birth_time', 'city', 'latitude', 'longitude')
+
+user_cache = TTLCache('user', app.config['USER_CACHE_SIZE'],
+                      app.config['USER_CACHE_TTL'])
+
+# Таблицы, уникальные индексы которых проверены (has_unique_indexes), и
+# таблицы, об отсутствии индексов которых уже записано предупреждение
+_tables_with_unique_indexes = set()
+_tables_missing_unique_indexes = set()
+
+
 class UserNatalChart(db.Model, BaseModel):
     """
     Модель натальной карты пользователя.
@@ -176,6 +236,9 @@ class UserNatalChart(db.Model, BaseModel):
         natal_chart (str): Содержимое натальной карты в текстовом формате.
                            Хранит информацию о планетарных позициях, аспектах
                            и других астрологических данных пользователя.
+                           В базе данных хранится в сжатом виде.
+        preview (str): Начало текста натальной карты. Заполняется только
+                       запросом списка админ-панели (with_expression).
 
     Использование:
         Для добавления натальной карты пользователя, сначала необходимо
@@ -184,9 +247,14 @@ class UserNatalChart(db.Model, BaseModel):
         данных.
     """
     __tablename__ = "user_natal_chart_SP"
+    __table_args__ = (
+        db.Index('ix_user_natal_chart_user', 'user_id', unique=True),
+        db.Index('ix_user_natal_chart_created_at', 'created_at'),
+    )
 
     user_id = db.Column(db.Integer, db.ForeignKey("user_SP.id"))
-    natal_chart = db.Column(db.Text(), nullable=False)
+    natal_chart = db.Column(CompressedText, nullable=False)
+    preview = query_expression()
 
 
 class Horoscope(db.Model, BaseModel):
@@ -205,26 +273,242 @@ class Horoscope(db.Model, BaseModel):
         date (datetime.date): Дата, для которой актуален гороскоп. Помогает
         определить актуальность
                               прогноза.
+        preview (str): Начало текста гороскопа. Заполняется только запросом
+        списка админ-панели (with_expression).
 
     Использование:
         Для добавления нового гороскопа в базу данных, создайте экземпляр
         Horoscope с необходимыми атрибутами и используйте метод `create` для
-        сохранения в базу данных.
+        сохранения в базу данных. Сочетание (period, zodiac_sign, date)
+        уникально, поэтому гороскопы добавляются через
+        DataAccess.add_new_horoscope, который не создаёт дубликатов.
     """
     __tablename__ = "horoscope_SP"
+    __table_args__ = (
+        db.Index('ix_horoscope_lookup', 'period', 'zodiac_sign', 'date',
+                 unique=True),
+        db.Index('ix_horoscope_date', 'date'),
+        db.Index('ix_horoscope_created_at', 'created_at'),
+    )
 
     period = db.Column(db.String(15), nullable=True)
     zodiac_sign = db.Column(db.String(15), nullable=True)
-    horoscope = db.Column(db.Text, nullable=False)
+    horoscope = db.Column(CompressedText, nullable=False)
     date = db.Column(db.Date)
+    preview = query_expression()
+
+
+class HoroscopeArchive(db.Model, BaseModel):
+    """
+    Модель гороскопа, перенесённого в архив по сроку хранения.
+
+    Args:
+        period (str): Период прогноза.
+        zodiac_sign (str): Знак зодиака.
+        horoscope (str): Текст гороскопа.
+        date (datetime.date): Дата, для которой создан гороскоп.
+        archived_at (datetime): Дата и время переноса в архив.
+
+    Использование:
+        Записи переносятся из horoscope_SP командой
+        `flask horoscope-archive` (модуль retention) и возвращаются обратно,
+        когда гороскоп на ту же дату запрашивается снова. Поле created_at
+        сохраняет время создания гороскопа.
+    """
+    __tablename__ = "horoscope_archive_SP"
+    __table_args__ = (
+        db.Index('ix_horoscope_archive_lookup', 'period', 'zodiac_sign',
+                 'date', unique=True),
+    )
+
+    period = db.Column(db.String(15), nullable=True)
+    zodiac_sign = db.Column(db.String(15), nullable=True)
+    horoscope = db.Column(CompressedText, nullable=False)
+    date = db.Column(db.Date)
+    archived_at = db.Column(db.DateTime)
 
 
 class UserTranzit(db.Model, BaseModel):
+    """
+    Модель прогноза транзитов пользователя на месяц.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        period (str): Месяц прогноза в формате 'YYYY-MM'.
+        tranzit (str): Текст прогноза, в базе данных хранится в сжатом виде.
+
+    Использование:
+        Прогноз создаётся один раз на пользователя и месяц и удаляется при
+        изменении данных рождения.
+    """
     __tablename__ = 'user_tranzit_SP'
+    __table_args__ = (
+        db.Index('ix_user_tranzit_user_period', 'user_id', 'period',
+                 unique=True),
+    )
 
     user_id = db.Column(db.Integer, db.ForeignKey('user_SP.id'))
     period = db.Column(db.String(15), nullable=True)
-    tranzit = db.Column(db.Text(), nullable=False)
+    tranzit = db.Column(CompressedText, nullable=False)
+
+
+class UserSolarReturn(db.Model, BaseModel):
+    """
+    Модель прогноза пользователя на год по соляру и прогрессиям.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        year (int): Год соляра.
+        solar_return (str): Текст прогноза.
+
+    Использование:
+        Прогноз создаётся один раз на пользователя и год и удаляется при
+        изменении данных рождения.
+    """
+    __tablename__ = 'user_solar_return_SP'
+    __table_args__ = (
+        db.Index('ix_user_solar_return_user_year', 'user_id', 'year',
+                 unique=True),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user_SP.id'))
+    year = db.Column(db.Integer, nullable=False)
+    solar_return = db.Column(db.Text(), nullable=False)
+
+
+class UserTranzitAlert(db.Model, BaseModel):
+    """
+    Модель точного личного транзита пользователя.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        date (datetime.date): День точного аспекта (UTC).
+        moment (datetime): Момент точного аспекта (UTC).
+        natal_planet (str): Натальная планета пользователя.
+        tranzit_planet (str): Транзитная планета.
+        aspect (str): Аспект между транзитной и натальной планетами.
+
+    Использование:
+        Записи рассчитываются ночной командой `flask tranzit-alerts` и
+        выбираются по индексу (user_id, date).
+    """
+    __tablename__ = 'user_tranzit_alert_SP'
+    __table_args__ = (
+        db.Index('ix_user_tranzit_alert_user_date', 'user_id', 'date'),
+        db.Index('ix_user_tranzit_alert_date', 'date'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user_SP.id'))
+    date = db.Column(db.Date, nullable=False)
+    moment = db.Column(db.DateTime, nullable=False)
+    natal_planet = db.Column(db.String(15), nullable=False)
+    tranzit_planet = db.Column(db.String(15), nullable=False)
+    aspect = db.Column(db.String(15), nullable=False)
+
+
+class UserNatalSnapshot(db.Model, BaseModel):
+    """
+    Модель рассчитанных данных натальной карты пользователя в двоичном виде.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        snapshot (bytes): Запись фиксированного формата (см. natal_snapshot):
+                          положения и скорости планет, куспиды домов и
+                          битовая маска аспектов.
+
+    Использование:
+        Запись создаётся командой natal-snapshots или ночным расчётом
+        транзитов и пересчитывается при изменении данных рождения.
+    """
+    __tablename__ = 'user_natal_snapshot_SP'
+    __table_args__ = (
+        db.Index('ix_user_natal_snapshot_user', 'user_id', unique=True),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user_SP.id'))
+    snapshot = db.Column(db.LargeBinary, nullable=False)
+
+
+class AstroEvent(db.Model, BaseModel):
+    """
+    Модель астрологического события календаря.
+
+    Args:
+        planet (str): Название планеты.
+        event (str): Тип события: станция ретроградная, станция директная или
+                     ингрессия (см. модуль astro_calendar).
+        moment (datetime): Момент события в UTC.
+        sign (str): Знак зодиака, в котором находится планета после события.
+
+    Использование:
+        События заранее рассчитываются командой `flask calendar-build` и
+        выбираются по индексу на момент события.
+    """
+    __tablename__ = 'astro_event_SP'
+    __table_args__ = (
+        db.Index('ix_astro_event_moment', 'moment'),
+        db.Index('ix_astro_event_planet_moment', 'planet', 'moment'),
+    )
+
+    planet = db.Column(db.String(15), nullable=False)
+    event = db.Column(db.String(20), nullable=False)
+    moment = db.Column(db.DateTime, nullable=False)
+    sign = db.Column(db.String(15), nullable=False)
+
+
+class OpsSnapshot(db.Model, BaseModel):
+    """
+    Модель показателей процесса приложения за минуту для панели
+    эксплуатации.
+
+    Args:
+        minute (datetime): Начало минуты (UTC).
+        worker (str): Процесс: имя хоста и идентификатор процесса.
+        requests (int): Количество обработанных запросов.
+        request_errors (int): Количество запросов, завершившихся ошибкой.
+        request_p95 (float): 95-й перцентиль времени обработки запроса, сек.
+        slowest_route (str): Маршрут с наибольшим 95-м перцентилем времени.
+        slowest_p95 (float): 95-й перцентиль времени этого маршрута, сек.
+        llm_calls (int): Количество запросов к языковой модели.
+        llm_errors (int): Количество неудачных запросов к модели.
+        llm_p95 (float): 95-й перцентиль времени ответа модели, сек.
+        cache_hits (int): Попадания в кэш гороскопов (L1 и L2).
+        cache_misses (int): Промахи кэша гороскопов.
+        geocode_hits (int): Координаты из справочника или кэша.
+        geocode_misses (int): Запросы к внешнему сервису геокодирования.
+        pending_jobs (int): Гороскопы в очереди создания в конце минуты.
+        running_jobs (int): Создаваемые гороскопы в конце минуты.
+        pool_checked_out (int): Выданные соединения с базой данных в конце
+                                минуты.
+        pool_wait_p95 (float): 95-й перцентиль ожидания соединения, сек.
+
+    Использование:
+        Записи добавляются каждым процессом раз в OPS_FLUSH_SECONDS (модуль
+        ops_dashboard) и удаляются через OPS_HISTORY_HOURS часов.
+    """
+    __tablename__ = 'ops_snapshot_SP'
+    __table_args__ = (
+        db.Index('ix_ops_snapshot_minute', 'minute'),
+    )
+
+    minute = db.Column(db.DateTime, nullable=False)
+    worker = db.Column(db.String(64), nullable=False)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    request_errors = db.Column(db.Integer, nullable=False, default=0)
+    request_p95 = db.Column(db.Float, nullable=False, default=0)
+    slowest_route = db.Column(db.String(255), nullable=True)
+    slowest_p95 = db.Column(db.Float, nullable=False, default=0)
+    llm_calls = db.Column(db.Integer, nullable=False, default=0)
+    llm_errors = db.Column(db.Integer, nullable=False, default=0)
+    llm_p95 = db.Column(db.Float, nullable=False, default=0)
+    cache_hits = db.Column(db.Integer, nullable=False, default=0)
+    cache_misses = db.Column(db.Integer, nullable=False, default=0)
+    geocode_hits = db.Column(db.Integer, nullable=False, default=0)
+    geocode_misses = db.Column(db.Integer, nullable=False, default=0)
+    pending_jobs = db.Column(db.Integer, nullable=False, default=0)
+    running_jobs = db.Column(db.Integer, nullable=False, default=0)
+    pool_checked_out = db.Column(db.Integer, nullable=False, default=0)
+    pool_wait_p95 = db.Column(db.Float, nullable=False, default=0)
 
 
 class DataAccess:
@@ -237,9 +521,15 @@ class DataAccess:
             соответствие форматам. Возвращает True, если проверка пройдена
             успешно и регистрация возможна.
 
+        get_taken_logins(self, logins, emails):
+            Возвращает уже занятые логины и адреса электронной почты.
+
         add_user(self, forms):
             Создает нового пользователя с данными из формы регистрации.
 
+        add_users(self, rows):
+            Добавляет пачку пользователей, например при импорте.
+
         get_user(self, login: str, password: str) -> bool | None:
             Пытается аутентифицировать пользователя с заданными логином и
             паролем.
@@ -254,8 +544,68 @@ class DataAccess:
         get_horoscope(self, period, date, zodiac_sign):
             Возвращает гороскоп для заданного знака зодиака, периода и даты.
 
+        get_horoscope_text(self, period, date, zodiac_sign):
+            Возвращает текст гороскопа через кэш процесса.
+
+        get_previous_horoscope_text(self, period, date, zodiac_sign):
+            Возвращает текст гороскопа знака за предыдущий период.
+
+        invalidate_horoscope(self, period, date, zodiac_sign):
+            Удаляет гороскоп из кэша процесса и общего кэша.
+
         add_new_horoscope(self, period, zodiac_sign, text, date):
-            Создает новый гороскоп с заданными параметрами.
+            Создает новый гороскоп с заданными параметрами, не допуская
+            дубликатов.
+
+        remove_duplicate_horoscopes(self):
+            Удаляет дубликаты гороскопов и создает уникальный индекс.
+
+        add_missing_columns(self) -> list[str]:
+            Добавляет в существующие таблицы столбцы моделей, которых в них
+            нет.
+
+        create_missing_indexes(self) -> list[str]:
+            Создаёт индексы моделей, которых нет в существующих таблицах.
+
+        has_unique_indexes(model) -> bool:
+            Проверяет, что уникальные индексы модели есть в базе данных.
+
+        expired_horoscope_filter(cutoff):
+            Возвращает условие отбора гороскопов для проверки срока
+            хранения.
+
+        get_expired_horoscopes(self, cutoff, batch_size, after_id):
+            Возвращает пачку гороскопов для проверки срока хранения.
+
+        archive_horoscopes(self, ids):
+            Переносит гороскопы в архивную таблицу.
+
+        del_horoscopes(self, ids):
+            Удаляет гороскопы по идентификаторам.
+
+        restore_horoscope(self, period, date, zodiac_sign, text):
+            Возвращает гороскоп из архива в основную таблицу.
+
+        get_archived_horoscope_text(self, period, date, zodiac_sign):
+            Возвращает текст гороскопа из архивной таблицы.
+
+        binary_text_column(self, model, name):
+            Переводит столбец с текстом в двоичный тип для сжатых значений.
+
+        compress_texts(self, model, name, batch_size):
+            Сжимает тексты столбца пачками.
+
+        get_text_samples(self, model, name, limit):
+            Возвращает тексты столбца для обучения словаря сжатия.
+
+        stream_rows(self, statement, batch_size):
+            Выбирает строки запроса пачками через курсор на стороне сервера.
+
+        get_user_ids(self, logins):
+            Возвращает идентификаторы пользователей по логинам.
+
+        add_rows(self, model, rows):
+            Добавляет пачку строк, пропуская уже существующие.
 
         get_natal_chart(self, user_id):
             Возвращает натальную карту пользователя по его идентификатору.
@@ -265,6 +615,73 @@ class DataAccess:
 
         del_natal_chart(self, user_id):
         Удаляет натальную карту пользователя по его идентификатору.
+
+        get_user_by_login(self, login):
+            Возвращает пользователя по логину.
+
+        get_tranzit(self, user_id, period):
+            Возвращает прогноз транзитов пользователя на месяц.
+
+        add_tranzit(self, user_id, period, text):
+            Сохраняет прогноз транзитов пользователя на месяц.
+
+        del_tranzits(self, user_id):
+            Удаляет все прогнозы транзитов пользователя.
+
+        get_solar_return(self, user_id, year):
+            Возвращает прогноз пользователя на год по соляру.
+
+        add_solar_return(self, user_id, year, text):
+            Сохраняет прогноз пользователя на год по соляру.
+
+        del_solar_returns(self, user_id):
+            Удаляет все прогнозы пользователя по соляру.
+
+        get_tranzit_alerts(self, user_id, date):
+            Возвращает точные транзиты пользователя на день.
+
+        replace_tranzit_alerts(self, user_ids, start, end, rows):
+            Заменяет транзиты пользователей за период одной транзакцией.
+
+        del_user_tranzit_alerts(self, user_id):
+            Удаляет все транзиты пользователя.
+
+        invalidate_user(user_id):
+            Удаляет пользователя из кэша load_user.
+
+        load_profile(user):
+            Загружает все поля пользователя для страницы профиля.
+
+        get_natal_snapshot_rows(self, exclude_id):
+            Возвращает данные рождения и двоичные записи натальных карт.
+
+        add_natal_snapshots(self, rows):
+            Сохраняет пачку двоичных записей натальных карт.
+
+        del_natal_snapshot(self, user_id):
+            Удаляет двоичную запись натальной карты пользователя.
+
+        get_user_by_id(self, user_id):
+            Возвращает пользователя по идентификатору.
+
+        get_astro_events(self, start, end):
+            Возвращает астрологические события календаря за период.
+
+        get_retrograde_planets(self, moment):
+            Возвращает планеты, ретроградные в указанный момент, или None,
+            если момент вне рассчитанного календаря.
+
+        astro_events_cover(self, moment):
+            Проверяет, входит ли момент в рассчитанный календарь.
+
+        replace_astro_events(self, start, end, events):
+            Заменяет события календаря за период рассчитанными заново.
+
+        add_ops_snapshot(self, values, expire_before):
+            Сохраняет показатели процесса за минуту и удаляет устаревшие.
+
+        get_ops_history(self, since):
+            Возвращает показатели всех процессов по минутам.
     """
     _instance = None
 
@@ -307,14 +724,8 @@ class DataAccess:
             else:
                 # Обработка ошибок, пользователь не может быть зарегистрирован
         """
-        # длина 5-25 символов.
-        pattern_login = r'^.{5,25}$'
-        # Регулярное выражение для email: стандартный формат email с доменом
-        # верхнего уровня от 2 до 4 символов.
-        pattern_email = r'^[-\w\.]+@([-\w]+\.)+[-\w]{2,4}$'
-        # длина 5-36 символов.
-        pattern_password = r'^.{5,36}$'
-        if User.query.filter_by(login=login).first():
+        taken_logins, taken_emails = self.get_taken_logins([login], [email])
+        if taken_logins:
             flash(
                 {
                     "title": "Ошибка!",
@@ -323,7 +734,7 @@ class DataAccess:
                 category="error",
             )
             return False
-        elif User.query.filter_by(email=email).first():
+        elif taken_emails:
             flash(
                 {
                     "title": "Ошибка!",
@@ -332,7 +743,7 @@ class DataAccess:
                 category="error",
             )
             return False
-        elif re.match(pattern_login, login) is None:
+        elif LOGIN_PATTERN.match(login) is None:
             flash(
                 {
                     "title": "Ошибка!",
@@ -342,7 +753,7 @@ class DataAccess:
                 category="error",
             )
             return False
-        elif re.match(pattern_email, email) is None:
+        elif EMAIL_PATTERN.match(email) is None:
             flash(
                 {
                     "title": "Ошибка!",
@@ -351,7 +762,7 @@ class DataAccess:
                 category="error",
             )
             return False
-        elif re.match(pattern_password, password) is None:
+        elif PASSWORD_PATTERN.match(password) is None:
             flash(
                 {
                     "title": "Ошибка!",
@@ -370,6 +781,67 @@ class DataAccess:
         )
         return True
 
+    def get_taken_logins(self, logins, emails) -> tuple[set, set]:
+        """
+        Проверяет уникальность логинов и адресов электронной почты одним
+        запросом для любого количества пользователей.
+
+        Args:
+            logins: Проверяемые логины.
+            emails: Проверяемые адреса электронной почты.
+
+        Returns:
+            Кортеж из множеств уже занятых логинов и адресов, приведённых к
+            casefold: в MySQL сравнение строк не учитывает регистр, и
+            найденное значение может отличаться от проверяемого регистром.
+        """
+        logins, emails = set(logins), set(emails)
+        rows = db.session.execute(
+            db.select(User.login, User.email).where(
+                db.or_(User.login.in_(logins), User.email.in_(emails)))
+        ).all()
+        logins = {login.casefold() for login in logins}
+        emails = {email.casefold() for email in emails}
+        return ({login.casefold() for login, _ in rows
+                 if login.casefold() in logins},
+                {email.casefold() for _, email in rows
+                 if email.casefold() in emails})
+
+    def add_users(self, rows: list[dict]) -> list[tuple]:
+        """
+        Добавляет пачку пользователей одной транзакцией запросом executemany.
+        Если пачка нарушает уникальность (например, пользователь
+        зарегистрировался во время импорта) или значение не подходит для
+        столбца, пользователи пачки добавляются по одному.
+
+        Args:
+            rows (list[dict]): Значения столбцов пользователей с уже
+                               хешированными паролями.
+
+        Returns:
+            Список не добавленных пользователей: пары (значения столбцов,
+            причина отказа).
+        """
+        try:
+            db.session.execute(db.insert(User), rows)
+            db.session.commit()
+            return []
+        except (IntegrityError, DataError):
+            db.session.rollback()
+        rejected = []
+        for row in rows:
+            try:
+                db.session.execute(db.insert(User), [row])
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                rejected.append((row, 'логин или почта заняты во время '
+                                      'импорта'))
+            except DataError:
+                db.session.rollback()
+                rejected.append((row, 'значение не подходит для столбца'))
+        return rejected
+
     def add_user(self, forms: dict) -> None:
         """
         Создает нового пользователя, хешируя пароль для безопасности перед
@@ -378,7 +850,7 @@ class DataAccess:
         Args:
             forms (dict): Словарь с данными формы регистрации пользователя.
         """
-        forms["password"] = generate_password_hash(forms["password"])
+        forms["password"] = password_hasher.hash(forms["password"])
         User.create(**forms)
 
     def get_user(self, login: str, password: str, remeber) -> bool | None:
@@ -394,10 +866,24 @@ class DataAccess:
             True: Если аутентификация прошла успешно (пользователь найден и
                   пароль верный).
             None: Если пользователь не найден или пароль не верный.
+
+        Raises:
+            PasswordBusyError: Если очередь проверки паролей заполнена.
+
+        Пароль проверяется в пуле passwords.password_hasher. Если хеш пароля
+        создан с прежними параметрами хеширования, он заменяется новым. Если
+        очередь хеширования при этом заполнена, замена откладывается до
+        следующего входа, а пользователь всё равно входит в систему.
         """
         user = User.query.filter_by(login=login).first()
 
-        if user and check_password_hash(user.password, password):
+        if user and password_hasher.verify(user.password, password):
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except PasswordBusyError:
+                    pass
             login_user(user, remember=remeber)
             return True
 
@@ -417,6 +903,8 @@ class DataAccess:
               поле `birth_time`.
             - Вычисляет знак зодиака на основе новой даты рождения и обновляет
               поле `zodiac_sign`.
+            - Сохраняет координаты города, выбранного из справочника, либо
+              определяет их по названию города через офлайн-справочник.
             - Обновляет остальные поля пользователя данными из формы, если они
               предоставлены.
 
@@ -433,9 +921,35 @@ class DataAccess:
         if birth_time:
             user.birth_time = datetime.strptime(birth_time, "%H:%M").time()
         for key, value in forms.items():
-            if value:
+            if value and key not in ('birthday', 'birth_time',
+                                     'latitude', 'longitude'):
                 setattr(user, key, value)
+        if forms.get("city"):
+            coordinates = self.city_coordinates(forms)
+            user.latitude = coordinates and coordinates['latitude']
+            user.longitude = coordinates and coordinates['longitude']
         db.session.commit()
+        self.invalidate_user(user.id)
+
+    @staticmethod
+    def city_coordinates(forms: dict) -> dict | None:
+        """
+        Определяет координаты города из формы профиля без обращения к
+        внешним сервисам геокодирования.
+
+        Args:
+            forms (dict): Словарь с данными формы. Может содержать координаты
+                          города, выбранного в автодополнении.
+
+        Returns:
+            Словарь с ключами "latitude" и "longitude" или None, если город
+            не найден в справочнике.
+        """
+        try:
+            return {'latitude': float(forms["latitude"]),
+                    'longitude': float(forms["longitude"])}
+        except (KeyError, TypeError, ValueError):
+            return gazetteer.resolve(forms["city"])
 
     def add_avatar(self, current_user: User, file_path: str) -> None:
         """
@@ -454,6 +968,7 @@ class DataAccess:
         """
         current_user.avatar = file_path
         db.session.commit()
+        self.invalidate_user(current_user.id)
 
     def get_horoscope(self, period: str,
                       date: datetime.date,
@@ -472,10 +987,88 @@ class DataAccess:
             критериям. Возвращает None, если подходящий гороскоп не найден.
         """
         horoscope = Horoscope.query.filter_by(
-            period=period, date=date, zodiac_sign=zodiac_sign
+            period=period, date=self.as_date(date), zodiac_sign=zodiac_sign
         ).first()
         return horoscope
 
+    def get_horoscope_text(self, period: str, date: datetime.date,
+                           zodiac_sign: str) -> str | None:
+        """
+        Возвращает текст гороскопа, обращаясь к базе данных только при
+        отсутствии его в кэше процесса. Текст кэшируется до конца периода
+        гороскопа, так как до этого момента он одинаков для всех
+        пользователей знака.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (datetime.date): Дата начала периода.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            str | None: Текст гороскопа или None, если гороскоп ещё не создан.
+        """
+        def load() -> str | None:
+            horoscope = self.get_horoscope(period, date, zodiac_sign)
+            return horoscope.horoscope if horoscope else None
+
+        end = period_end(period, self.as_date(date))
+        return horoscope_cache.get_or_load(
+            self.horoscope_key(period, date, zodiac_sign),
+            load,
+            end.timestamp() if end else None,
+        )
+
+    def get_previous_horoscope_text(self, period: str, date: datetime.date,
+                                    zodiac_sign: str) -> str | None:
+        """
+        Возвращает текст последнего гороскопа знака за период, начавшийся
+        раньше указанной даты. Используется, пока гороскоп на текущий период
+        создаётся в фоне. Запрос выполняется по индексу ix_horoscope_lookup.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (datetime.date): Дата начала текущего периода.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            str | None: Текст предыдущего гороскопа или None, если его нет.
+        """
+        return db.session.execute(
+            db.select(Horoscope.horoscope)
+            .filter(Horoscope.period == period,
+                    Horoscope.zodiac_sign == zodiac_sign,
+                    Horoscope.date < self.as_date(date))
+            .order_by(Horoscope.date.desc())
+            .limit(1)
+        ).scalar()
+
+    def invalidate_horoscope(self, period: str, date: datetime.date,
+                             zodiac_sign: str) -> bool:
+        """
+        Удаляет гороскоп из кэша процесса и общего кэша, например после его
+        изменения администратором.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (datetime.date): Дата начала периода.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            bool: False, если гороскоп не удалось удалить из общего кэша.
+        """
+        return horoscope_cache.invalidate(
+            self.horoscope_key(period, date, zodiac_sign))
+
+    def horoscope_key(self, period: str, date: datetime.date,
+                      zodiac_sign: str) -> tuple:
+        """
+        Формирует ключ гороскопа в кэше.
+
+        Returns:
+            tuple: Кортеж (период, дата, знак зодиака).
+        """
+        return period, self.as_date(date), zodiac_sign
+
     def add_new_horoscope(self, period: str,
                           zodiac_sign: str,
                           text: str, date: datetime.date) -> None:
@@ -492,15 +1085,451 @@ class DataAccess:
 
         Returns:
             None. Метод не возвращает значение, но результатом его выполнения
-            является добавление новой записи в таблицу гороскопов.
+            является добавление новой записи в таблицу гороскопов. Если
+            гороскоп на этот период, знак и дату уже добавлен параллельным
+            запросом, новая запись не создаётся.
+        """
+        values = {
+            'period': period,
+            'zodiac_sign': zodiac_sign,
+            'horoscope': text,
+            'date': self.as_date(date),
+            'created_at': datetime.now(timezone.utc),
+        }
+        dialect = db.session.get_bind(Horoscope.__mapper__).dialect.name
+        if not self.has_unique_indexes(Horoscope):
+            if self.get_horoscope(period, date, zodiac_sign) is None:
+                try:
+                    db.session.execute(db.insert(Horoscope).values(**values))
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+            return
+        if dialect == 'mysql':
+            statement = mysql_insert(Horoscope).values(**values)
+            statement = statement.on_duplicate_key_update(id=Horoscope.id)
+        elif dialect in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+            statement = insert(Horoscope).values(**values)
+            statement = statement.on_conflict_do_nothing(
+                index_elements=['period', 'zodiac_sign', 'date'])
+        else:
+            try:
+                db.session.execute(db.insert(Horoscope).values(**values))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+            return
+        db.session.execute(statement)
+        db.session.commit()
+
+    @staticmethod
+    def as_date(date) -> datetime.date:
+        """
+        Приводит дату гороскопа к типу date: контроллеры передают её строкой
+        'YYYY-MM-DD' (date_horoscope) или объектом datetime.
+
+        Args:
+            date (str | datetime.date): Дата гороскопа.
+
+        Returns:
+            datetime.date: Дата без времени.
         """
-        new_horoscope = Horoscope(
-            period=period,
-            zodiac_sign=zodiac_sign,
-            horoscope=text,
-            date=date,
+        if isinstance(date, str):
+            return datetime.strptime(date, "%Y-%m-%d").date()
+        if isinstance(date, datetime):
+            return date.date()
+        return date
+
+    def remove_duplicate_horoscopes(self) -> int:
+        """
+        Удаляет дубликаты гороскопов, оставляя самую раннюю запись для
+        каждого сочетания периода, знака зодиака и даты, и создаёт
+        уникальный индекс ix_horoscope_lookup, если его ещё нет.
+
+        Returns:
+            int: Количество удалённых записей.
+        """
+        keep = db.select(db.func.min(Horoscope.id).label('id')).group_by(
+            Horoscope.period, Horoscope.zodiac_sign, Horoscope.date
+        ).subquery()
+        # Дополнительный подзапрос нужен MySQL, который не разрешает
+        # выбирать из таблицы, из которой удаляются строки
+        result = db.session.execute(
+            db.delete(Horoscope).where(
+                Horoscope.id.not_in(db.select(keep.c.id))
+            )
+        )
+        db.session.commit()
+        for index in Horoscope.__table__.indexes:
+            index.create(db.session.get_bind(Horoscope.__mapper__),
+                         checkfirst=True)
+        return result.rowcount
+
+    @staticmethod
+    def add_missing_columns() -> list:
+        """
+        Добавляет в существующие таблицы столбцы, появившиеся в моделях
+        после создания таблиц (например, координаты города пользователя):
+        db.create_all не изменяет существующие таблицы. Добавляются только
+        столбцы, допускающие NULL, поэтому существующие строки остаются
+        корректными. Повторный запуск ничего не меняет.
+
+        Returns:
+            list[str]: Названия добавленных столбцов (таблица.столбец).
+        """
+        added = []
+        with db.engine.begin() as connection:
+            inspector = db.inspect(connection)
+            preparer = connection.dialect.identifier_preparer
+            for table in db.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column['name']
+                            for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing or not column.nullable:
+                        continue
+                    column_type = column.type.compile(
+                        dialect=connection.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {preparer.format_table(table)} '
+                        f'ADD COLUMN {preparer.format_column(column)} '
+                        f'{column_type} NULL')
+                    added.append(f'{table.name}.{column.name}')
+        return added
+
+    @staticmethod
+    def create_missing_indexes() -> list:
+        """
+        Создаёт индексы моделей, которых нет в базе данных: db.create_all
+        создаёт индексы только вместе с новыми таблицами.
+
+        Returns:
+            list[str]: Названия созданных индексов.
+        """
+        created = []
+        with db.engine.begin() as connection:
+            inspector = db.inspect(connection)
+            for table in db.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {index['name']
+                            for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(connection)
+                        created.append(index.name)
+        return created
+
+    @staticmethod
+    def has_unique_indexes(model) -> bool:
+        """
+        Проверяет, что уникальные индексы модели есть в базе данных. Без них
+        вставка с пропуском дубликатов (ON CONFLICT / ON DUPLICATE KEY) не
+        находит конфликтов. Положительный результат запоминается на время
+        работы процесса.
+
+        Args:
+            model: Модель таблицы.
+
+        Returns:
+            bool: True, если все уникальные индексы модели созданы.
+        """
+        table = model.__table__
+        if table.name in _tables_with_unique_indexes:
+            return True
+        bind = db.session.get_bind(model.__mapper__)
+        existing = {index['name']
+                    for index in db.inspect(bind).get_indexes(table.name)}
+        missing = [index.name for index in table.indexes
+                   if index.unique and index.name not in existing]
+        if missing:
+            if table.name not in _tables_missing_unique_indexes:
+                _tables_missing_unique_indexes.add(table.name)
+                app.logger.warning(
+                    'Missing unique indexes %s, duplicates are checked row '
+                    'by row; run "flask horoscope-dedupe" and '
+                    '"flask db-indexes"', ', '.join(missing))
+            return False
+        _tables_with_unique_indexes.add(table.name)
+        return True
+
+    @staticmethod
+    def expired_horoscope_filter(cutoff: datetime.date):
+        """
+        Условие отбора гороскопов для проверки срока хранения: дата начала
+        периода гороскопа и время его создания (или возвращения из архива)
+        раньше cutoff. Окончание периода (например, года) может быть позже
+        cutoff, поэтому оно проверяется отдельно (retention).
+        """
+        created = datetime.combine(cutoff, datetime.min.time())
+        return db.and_(Horoscope.date < cutoff,
+                       db.or_(Horoscope.created_at.is_(None),
+                              Horoscope.created_at < created))
+
+    def get_expired_horoscopes(self, cutoff: datetime.date,
+                               batch_size: int = 1000,
+                               after_id: int = 0) -> list:
+        """
+        Возвращает пачку гороскопов, отобранных expired_horoscope_filter, в
+        порядке возрастания id. Возвращённый в основную таблицу гороскоп
+        хранится полный срок с момента возвращения.
+
+        Args:
+            cutoff (datetime.date): Граница срока хранения.
+            batch_size (int): Максимальное количество записей.
+            after_id (int): Идентификатор, после которого выбираются
+                            записи.
+
+        Returns:
+            Список строк (id, period, zodiac_sign, date, horoscope,
+            created_at).
+        """
+        return db.session.execute(
+            db.select(Horoscope.id, Horoscope.period, Horoscope.zodiac_sign,
+                      Horoscope.date, Horoscope.horoscope,
+                      Horoscope.created_at)
+            .where(self.expired_horoscope_filter(cutoff),
+                   Horoscope.id > after_id)
+            .order_by(Horoscope.id).limit(batch_size)
+        ).all()
+
+    def archive_horoscopes(self, ids: list[int]) -> None:
+        """
+        Переносит гороскопы в архивную таблицу одной транзакцией. Сжатые
+        тексты копируются запросом INSERT ... SELECT без распаковки. Если
+        гороскоп на ту же дату уже есть в архиве, архивная запись заменяется.
+
+        Args:
+            ids (list[int]): Идентификаторы гороскопов.
+        """
+        source = db.select(Horoscope.period, Horoscope.zodiac_sign,
+                           Horoscope.date).where(Horoscope.id.in_(ids))
+        db.session.execute(
+            db.delete(HoroscopeArchive).where(
+                db.tuple_(HoroscopeArchive.period, HoroscopeArchive.zodiac_sign,
+                          HoroscopeArchive.date).in_(source)
+            )
+        )
+        db.session.execute(
+            db.insert(HoroscopeArchive).from_select(
+                ['period', 'zodiac_sign', 'horoscope', 'date', 'created_at',
+                 'archived_at'],
+                db.select(Horoscope.period, Horoscope.zodiac_sign,
+                          Horoscope.horoscope, Horoscope.date,
+                          Horoscope.created_at,
+                          db.literal(datetime.now(timezone.utc), db.DateTime))
+                .where(Horoscope.id.in_(ids)).order_by(Horoscope.id)
+            )
         )
-        db.session.add(new_horoscope)
+        db.session.execute(db.delete(Horoscope).where(Horoscope.id.in_(ids)))
+        db.session.commit()
+
+    def del_horoscopes(self, ids: list[int]) -> None:
+        """
+        Удаляет гороскопы по идентификаторам, например после записи их в
+        архивные файлы.
+
+        Args:
+            ids (list[int]): Идентификаторы гороскопов.
+        """
+        db.session.execute(db.delete(Horoscope).where(Horoscope.id.in_(ids)))
+        db.session.commit()
+
+    def get_archived_horoscope_text(self, period: str, date: datetime.date,
+                                    zodiac_sign: str) -> str | None:
+        """
+        Возвращает текст гороскопа из архивной таблицы.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (datetime.date): Дата гороскопа.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            str | None: Текст гороскопа или None, если его нет в архиве.
+        """
+        return db.session.execute(
+            db.select(HoroscopeArchive.horoscope).filter_by(
+                period=period, date=self.as_date(date),
+                zodiac_sign=zodiac_sign)
+        ).scalar()
+
+    def restore_horoscope(self, period: str, date: datetime.date,
+                          zodiac_sign: str, text: str) -> None:
+        """
+        Возвращает гороскоп из архива в основную таблицу и удаляет его из
+        архивной таблицы одной транзакцией. Если гороскоп уже возвращён
+        параллельным запросом, изменения откатываются.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (datetime.date): Дата гороскопа.
+            zodiac_sign (str): Знак зодиака.
+            text (str): Текст гороскопа из архива.
+        """
+        date = self.as_date(date)
+        try:
+            db.session.execute(db.insert(Horoscope).values(
+                period=period, zodiac_sign=zodiac_sign, horoscope=text,
+                date=date, created_at=datetime.now(timezone.utc)))
+            db.session.execute(db.delete(HoroscopeArchive).filter_by(
+                period=period, date=date, zodiac_sign=zodiac_sign))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+
+    def binary_text_column(self, model, name: str) -> bool:
+        """
+        Переводит столбец с текстом в двоичный тип, необходимый для хранения
+        сжатых значений. Несжатые тексты при этом сохраняются как есть и
+        читаются без изменений. SQLite хранит двоичные значения в столбце
+        любого типа, поэтому для неё изменение не требуется.
+
+        Args:
+            model: Модель, которой принадлежит столбец.
+            name (str): Название столбца.
+
+        Returns:
+            bool: True, если тип столбца был изменён.
+        """
+        engine = db.session.get_bind(model.__mapper__)
+        table = model.__tablename__
+        column = next(column for column in db.inspect(engine).get_columns(table)
+                      if column['name'] == name)
+        if engine.dialect.name == 'sqlite':
+            return False
+        try:
+            if column['type'].python_type is bytes:
+                return False
+        except NotImplementedError:
+            pass
+        if engine.dialect.name == 'mysql':
+            statement = (f'ALTER TABLE `{table}` MODIFY `{name}` '
+                         f'MEDIUMBLOB NOT NULL')
+        elif engine.dialect.name == 'postgresql':
+            statement = (f'ALTER TABLE "{table}" ALTER COLUMN "{name}" '
+                         f'TYPE bytea USING convert_to("{name}", \'UTF8\')')
+        else:
+            raise NotImplementedError(engine.dialect.name)
+        db.session.execute(db.text(statement))
+        db.session.commit()
+        return True
+
+    def compress_texts(self, model, name: str, batch_size: int = 500):
+        """
+        Перезаписывает тексты столбца пачками по возрастанию id, сжимая их.
+        Уже сжатые значения распаковываются и сжимаются заново, поэтому
+        повторный запуск безопасен и применяет новый словарь сжатия.
+
+        Args:
+            model: Модель, которой принадлежит столбец.
+            name (str): Название столбца типа CompressedText.
+            batch_size (int): Количество записей в одной пачке.
+
+        Yields:
+            Кортеж (количество записей, размер текстов в байтах, размер
+            сжатых значений в байтах) для каждой пачки.
+        """
+        column = getattr(model, name)
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(model.id, column).where(model.id > last_id)
+                .order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            db.session.execute(db.update(model), [
+                {'id': row_id, name: text} for row_id, text in rows
+            ])
+            db.session.commit()
+            first_id, last_id = rows[0][0], rows[-1][0]
+            compressed = db.session.execute(
+                db.select(db.func.sum(db.func.length(column)))
+                .where(model.id.between(first_id, last_id))
+            ).scalar()
+            yield (len(rows),
+                   sum(len(text.encode('utf-8')) for _, text in rows),
+                   compressed or 0)
+
+    def get_text_samples(self, model, name: str, limit: int = 1000) -> list:
+        """
+        Возвращает последние тексты столбца для обучения словаря сжатия.
+
+        Args:
+            model: Модель, которой принадлежит столбец.
+            name (str): Название столбца.
+            limit (int): Максимальное количество текстов.
+
+        Returns:
+            Список текстов.
+        """
+        return db.session.execute(
+            db.select(getattr(model, name)).order_by(model.id.desc())
+            .limit(limit)
+        ).scalars().all()
+
+    def stream_rows(self, statement, batch_size: int = 1000):
+        """
+        Выполняет запрос с выборкой строк пачками через курсор на стороне
+        сервера, поэтому память не зависит от размера таблицы.
+
+        Args:
+            statement: Запрос SELECT.
+            batch_size (int): Количество строк в одной пачке.
+
+        Yields:
+            Список строк (словарей столбец: значение) очередной пачки.
+        """
+        result = db.session.execute(
+            statement.execution_options(yield_per=batch_size))
+        for rows in result.mappings().partitions():
+            yield rows
+
+    def get_user_ids(self, logins) -> dict:
+        """
+        Возвращает идентификаторы пользователей по логинам.
+
+        Args:
+            logins: Логины пользователей.
+
+        Returns:
+            Словарь {логин: идентификатор} для найденных пользователей.
+        """
+        return dict(db.session.execute(
+            db.select(User.login, User.id).where(User.login.in_(set(logins)))
+        ).all())
+
+    def add_rows(self, model, rows: list[dict]) -> None:
+        """
+        Добавляет пачку строк одним запросом executemany. Строки, нарушающие
+        уникальный индекс таблицы, пропускаются.
+
+        Args:
+            model: Модель таблицы.
+            rows (list[dict]): Значения столбцов.
+        """
+        table = model.__table__
+        dialect = db.session.get_bind(model.__mapper__).dialect.name
+        if not self.has_unique_indexes(model):
+            dialect = None
+        if dialect == 'mysql':
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update(id=table.c.id)
+        elif dialect in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+            statement = insert(table).on_conflict_do_nothing()
+        else:
+            for row in rows:
+                try:
+                    db.session.execute(db.insert(table).values(**row))
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+            return
+        db.session.execute(statement, rows)
         db.session.commit()
 
     def get_natal_chart(self, user_id: int) -> UserNatalChart:
@@ -538,7 +1567,11 @@ class DataAccess:
         """
         new_natal_cart = UserNatalChart(user_id=user_id, natal_chart=text)
         db.session.add(new_natal_cart)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Натальная карта уже сохранена параллельным запросом
+            db.session.rollback()
 
     def del_natal_chart(self, user_id: int) -> None:
         """
@@ -557,11 +1590,387 @@ class DataAccess:
             db.session.delete(natal_chart)
             db.session.commit()
 
+    def get_user_by_login(self, login: str) -> User:
+        """
+        Возвращает пользователя по логину.
+
+        Args:
+            login (str): Логин пользователя.
+
+        Returns:
+            User: Пользователь или None, если он не найден.
+        """
+        return User.query.filter_by(login=login).first()
+
+    def get_tranzit(self, user_id: int, period: str) -> UserTranzit:
+        """
+        Возвращает прогноз транзитов пользователя на месяц.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            period (str): Месяц прогноза в формате 'YYYY-MM'.
+
+        Returns:
+            UserTranzit: Прогноз или None, если он ещё не создан.
+        """
+        return UserTranzit.query.filter_by(
+            user_id=user_id, period=period).first()
+
+    def add_tranzit(self, user_id: int, period: str, text: str) -> None:
+        """
+        Сохраняет прогноз транзитов пользователя на месяц. Если прогноз на
+        этот месяц уже сохранён параллельным запросом, новая запись не
+        создаётся.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            period (str): Месяц прогноза в формате 'YYYY-MM'.
+            text (str): Текст прогноза.
+        """
+        tranzit = UserTranzit(user_id=user_id, period=period, tranzit=text)
+        db.session.add(tranzit)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+
+    def del_tranzits(self, user_id: int) -> None:
+        """
+        Удаляет все прогнозы транзитов пользователя, например после
+        изменения данных рождения.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+        """
+        UserTranzit.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    def get_solar_return(self, user_id: int, year: int) -> UserSolarReturn:
+        """
+        Возвращает прогноз пользователя на год по соляру.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            year (int): Год соляра.
+
+        Returns:
+            UserSolarReturn: Прогноз или None, если он ещё не создан.
+        """
+        return UserSolarReturn.query.filter_by(
+            user_id=user_id, year=year).first()
+
+    def add_solar_return(self, user_id: int, year: int, text: str) -> str:
+        """
+        Сохраняет прогноз пользователя на год по соляру. Если прогноз на
+        этот год уже сохранён параллельным запросом, новая запись не
+        создаётся.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            year (int): Год соляра.
+            text (str): Текст прогноза.
+
+        Returns:
+            Сохранённый текст прогноза: новый или сохранённый параллельным
+            запросом.
+        """
+        solar_return = UserSolarReturn(user_id=user_id, year=year,
+                                       solar_return=text)
+        db.session.add(solar_return)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            stored = self.get_solar_return(user_id, year)
+            if stored is not None:
+                return stored.solar_return
+        return text
+
+    def del_solar_returns(self, user_id: int) -> None:
+        """
+        Удаляет все прогнозы пользователя по соляру, например после
+        изменения данных рождения.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+        """
+        UserSolarReturn.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    def get_tranzit_alerts(self, user_id: int,
+                           date: datetime.date) -> list[UserTranzitAlert]:
+        """
+        Возвращает точные транзиты пользователя на день.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            date (datetime.date): День (UTC).
+
+        Returns:
+            Список транзитов, упорядоченный по моменту точного аспекта.
+        """
+        return UserTranzitAlert.query.filter_by(
+            user_id=user_id, date=date
+        ).order_by(UserTranzitAlert.moment).all()
+
+    def replace_tranzit_alerts(self, user_ids: list[int],
+                               start: datetime.date, end: datetime.date,
+                               rows: list[dict]) -> None:
+        """
+        Заменяет транзиты пачки пользователей за период: удаляет ранее
+        рассчитанные и сохраняет новые одним пакетным запросом в одной
+        транзакции, так что читатели видят либо старые, либо новые транзиты
+        пользователя.
+
+        Args:
+            user_ids (list[int]): Идентификаторы пользователей пачки.
+            start (datetime.date): Первый день периода.
+            end (datetime.date): День после последнего дня периода.
+            rows (list[dict]): Поля записей UserTranzitAlert.
+        """
+        db.session.execute(
+            db.delete(UserTranzitAlert).where(
+                UserTranzitAlert.user_id.in_(user_ids),
+                UserTranzitAlert.date >= start, UserTranzitAlert.date < end)
+        )
+        if rows:
+            now = datetime.now(timezone.utc)
+            db.session.execute(
+                db.insert(UserTranzitAlert),
+                [{**row, 'created_at': now} for row in rows],
+            )
+        db.session.commit()
+
+    def get_natal_snapshot_rows(self, exclude_id: int | None = None) -> list:
+        """
+        Возвращает данные рождения и двоичные записи натальных карт всех
+        пользователей с заполненными датой и временем рождения. Выбираются
+        только колонки, без создания объектов моделей. У пользователей, для
+        которых запись ещё не рассчитана, snapshot равен None.
+
+        Args:
+            exclude_id (int): Идентификатор пользователя, который не
+                              попадает в выборку.
+
+        Returns:
+            Список строк с полями id, login, name, birthday, birth_time,
+            city, latitude, longitude и snapshot.
+        """
+        query = db.session.query(
+            User.id, User.login, User.name, User.birthday, User.birth_time,
+            User.city, User.latitude, User.longitude,
+            UserNatalSnapshot.snapshot,
+        ).outerjoin(
+            UserNatalSnapshot, UserNatalSnapshot.user_id == User.id
+        ).filter(User.birthday.isnot(None), User.birth_time.isnot(None))
+        if exclude_id is not None:
+            query = query.filter(User.id != exclude_id)
+        return query.order_by(User.id).all()
+
+    def add_natal_snapshots(self, rows: list[dict]) -> None:
+        """
+        Сохраняет пачку двоичных записей натальных карт одним запросом.
+        Записи пользователей, для которых запись уже сохранена параллельным
+        расчётом, пропускаются.
+
+        Args:
+            rows (list[dict]): Словари с ключами user_id и snapshot.
+        """
+        if rows:
+            now = datetime.now(timezone.utc)
+            self.add_rows(UserNatalSnapshot,
+                          [{**row, 'created_at': now} for row in rows])
+
+    def del_natal_snapshot(self, user_id: int) -> None:
+        """
+        Удаляет двоичную запись натальной карты пользователя, например после
+        изменения данных рождения.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+        """
+        UserNatalSnapshot.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    def del_user_tranzit_alerts(self, user_id: int) -> None:
+        """
+        Удаляет все рассчитанные транзиты пользователя, например после
+        изменения данных рождения.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+        """
+        UserTranzitAlert.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    @staticmethod
+    def invalidate_user(user_id: int) -> None:
+        """
+        Удаляет пользователя из кэша load_user после изменения его данных.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+        """
+        user_cache.invalidate(user_id)
+
+    @staticmethod
+    def load_profile(user: User) -> None:
+        """
+        Загружает все поля пользователя одним запросом перед выводом
+        страницы профиля, так как load_user загружает только поля
+        SESSION_COLUMNS.
+
+        Args:
+            user (User): Пользователь.
+        """
+        db.session.refresh(user)
+
+    def get_user_by_id(self, user_id: int) -> User:
+        """
+        Возвращает пользователя по идентификатору.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            User: Пользователь или None, если он не найден.
+        """
+        return db.session.get(User, user_id)
+
+    def get_astro_events(self, start: datetime,
+                         end: datetime) -> list[AstroEvent]:
+        """
+        Возвращает астрологические события календаря за период.
+
+        Args:
+            start (datetime): Начало периода (UTC).
+            end (datetime): Конец периода (UTC).
+
+        Returns:
+            Список событий, упорядоченный по времени события.
+        """
+        return AstroEvent.query.filter(
+            AstroEvent.moment >= start, AstroEvent.moment < end
+        ).order_by(AstroEvent.moment).all()
+
+    def astro_events_cover(self, moment: datetime) -> bool:
+        """
+        Проверяет, входит ли момент в период рассчитанного календаря: между
+        первым и последним сохранённым событием.
+
+        Args:
+            moment (datetime): Момент времени (UTC).
+        """
+        first, last = db.session.query(
+            db.func.min(AstroEvent.moment), db.func.max(AstroEvent.moment)
+        ).one()
+        return first is not None and first <= moment <= last
+
+    def get_retrograde_planets(self, moment: datetime) -> list[str] | None:
+        """
+        Определяет планеты, ретроградные в указанный момент: последняя
+        станция такой планеты до этого момента - ретроградная.
+
+        Args:
+            moment (datetime): Момент времени (UTC).
+
+        Returns:
+            Список названий ретроградных планет или None, если момент вне
+            рассчитанного календаря и данных о станциях нет.
+        """
+        if not self.astro_events_cover(moment):
+            return None
+        stations = (STATION_RETROGRADE, STATION_DIRECT)
+        last_station = db.session.query(
+            AstroEvent.planet,
+            db.func.max(AstroEvent.moment).label('moment'),
+        ).filter(
+            AstroEvent.event.in_(stations), AstroEvent.moment <= moment
+        ).group_by(AstroEvent.planet).subquery()
+        rows = db.session.query(AstroEvent.planet).join(
+            last_station,
+            db.and_(AstroEvent.planet == last_station.c.planet,
+                    AstroEvent.moment == last_station.c.moment),
+        ).filter(AstroEvent.event == STATION_RETROGRADE)
+        return [row.planet for row in rows]
+
+    def replace_astro_events(self, start: datetime, end: datetime,
+                             events: list[dict]) -> None:
+        """
+        Заменяет события календаря за период рассчитанными заново.
+
+        Args:
+            start (datetime): Начало периода (UTC).
+            end (datetime): Конец периода (UTC).
+            events (list[dict]): События, рассчитанные EphemerisCalendar.
+        """
+        AstroEvent.query.filter(
+            AstroEvent.moment >= start, AstroEvent.moment < end
+        ).delete()
+        db.session.add_all(AstroEvent(**event) for event in events)
+        db.session.commit()
+
+    def add_ops_snapshot(self, values: dict, expire_before: datetime) -> None:
+        """
+        Сохраняет показатели процесса за минуту и удаляет показатели всех
+        процессов старше expire_before.
+
+        Args:
+            values (dict): Значения столбцов OpsSnapshot.
+            expire_before (datetime): Граница срока хранения (UTC).
+        """
+        db.session.add(OpsSnapshot(**values))
+        db.session.execute(
+            db.delete(OpsSnapshot).where(OpsSnapshot.minute < expire_before))
+        db.session.commit()
+
+    def get_ops_history(self, since: datetime) -> list:
+        """
+        Возвращает показатели всех процессов по минутам: количества
+        суммируются, перцентили берутся наибольшие по процессам.
+
+        Args:
+            since (datetime): Начало периода (UTC).
+
+        Returns:
+            Список строк по убыванию минуты.
+        """
+        func = db.func
+        return db.session.execute(
+            db.select(
+                OpsSnapshot.minute,
+                func.count().label('workers'),
+                func.sum(OpsSnapshot.requests).label('requests'),
+                func.sum(OpsSnapshot.request_errors).label('request_errors'),
+                func.max(OpsSnapshot.request_p95).label('request_p95'),
+                func.max(OpsSnapshot.slowest_p95).label('slowest_p95'),
+                func.sum(OpsSnapshot.llm_calls).label('llm_calls'),
+                func.sum(OpsSnapshot.llm_errors).label('llm_errors'),
+                func.max(OpsSnapshot.llm_p95).label('llm_p95'),
+                func.sum(OpsSnapshot.cache_hits).label('cache_hits'),
+                func.sum(OpsSnapshot.cache_misses).label('cache_misses'),
+                func.sum(OpsSnapshot.geocode_hits).label('geocode_hits'),
+                func.sum(OpsSnapshot.geocode_misses).label('geocode_misses'),
+                func.sum(OpsSnapshot.pending_jobs).label('pending_jobs'),
+                func.sum(OpsSnapshot.running_jobs).label('running_jobs'),
+                func.sum(OpsSnapshot.pool_checked_out)
+                .label('pool_checked_out'),
+                func.max(OpsSnapshot.pool_wait_p95).label('pool_wait_p95'),
+            )
+            .where(OpsSnapshot.minute >= since)
+            .group_by(OpsSnapshot.minute)
+            .order_by(OpsSnapshot.minute.desc())
+        ).all()
+
+
 @manager.user_loader
 def load_user(user_id: int) -> User:
     """
     Callback функция для Flask-Login, которая используется для загрузки
-    объекта пользователя.
+    объекта пользователя. Загружаются только поля SESSION_COLUMNS, нужные
+    на каждой странице, а их значения кэшируются в процессе на
+    USER_CACHE_TTL секунд, поэтому большинство запросов обходится без
+    обращения к базе данных. Остальные поля загружаются при обращении к ним.
 
     Args:
         user_id (str): Строковый идентификатор пользователя, используемый для
@@ -569,10 +1978,24 @@ def load_user(user_id: int) -> User:
 
     Returns:
         User: Объект пользователя, соответствующий идентификатору. Возвращает
-              None, если
-              пользователь не найден.
+              None, если пользователь не найден.
     """
-    return User.query.get(user_id)
+    user_id = int(user_id)
+    values = user_cache.get(user_id)
+    if values is None:
+        user = db.session.execute(
+            db.select(User).options(load_only(
+                *(getattr(User, column) for column in SESSION_COLUMNS)))
+            .filter_by(id=user_id)
+        ).scalar_one_or_none()
+        if user is not None:
+            user_cache.set(user_id, {column: getattr(user, column)
+                                     for column in SESSION_COLUMNS})
+        return user
+    # Пользователь восстанавливается из кэша без запроса к базе данных
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
 
 
 with app.app_context():
@@ -0,0 +1,227 @@
+"""
+Модуль двоичных записей натальных карт.
+
+Для каждого пользователя рассчитанные данные натальной карты хранятся в
+записи фиксированного формата: положения и скорости планет и куспиды домов
+в виде массивов float32 и аспекты между планетами в виде битовой маски.
+Записи читаются через np.frombuffer без копирования и без создания объектов
+моделей, поэтому пакетные расчёты (подбор совместимости, ночной расчёт
+транзитов) загружают тысячи карт одним запросом и одним массивом NumPy.
+
+Формат записи (little-endian, без выравнивания, SNAPSHOT_DTYPE):
+    version     uint8                  версия формата
+    positions   float32[len(PLANETS)]  долготы планет в порядке PLANETS
+    speeds      float32[len(PLANETS)]  скорости планет, градусов в сутки
+    houses      float32[12]            куспиды домов (NaN, если место
+                                       рождения неизвестно)
+    aspects     uint8[...]             биты аспектов: для пары планет
+                                       ASPECT_PAIRS[i] и аспекта ASPECTS[j]
+                                       бит i * len(ASPECTS) + j
+
+Функции:
+    compute(birthday, birth_time, coordinates) -> bytes:
+        Рассчитывает запись натальной карты.
+
+    read(data) -> np.void:
+        Читает одну запись без копирования.
+
+    read_many(records) -> np.ndarray:
+        Читает записи нескольких карт в один массив.
+
+    aspects(record) -> list[tuple]:
+        Расшифровывает битовую маску аспектов.
+
+    load_snapshots(exclude_id) -> tuple[list, np.ndarray]:
+        Загружает записи всех пользователей, рассчитывая и сохраняя
+        недостающие.
+
+    backfill_snapshots() -> int:
+        Рассчитывает и сохраняет недостающие записи.
+
+    rebuild_snapshot(user) -> None:
+        Пересчитывает запись натальной карты пользователя.
+"""
+
+from datetime import date, datetime, time
+from itertools import combinations
+
+import numpy as np
+import swisseph as swe
+
+from gazetteer import gazetteer
+from horoscope_logic import GetAstralData, GetJulianDate
+from horoscope_logic_pro import GetNatalChart2
+from metrics import metrics
+from models import DataAccess
+from synastry import PLANETS, Synastry
+
+VERSION = 1
+ASPECTS = list(Synastry.aspect_angles)
+ASPECT_PAIRS = list(combinations(range(len(PLANETS)), 2))
+ASPECT_BYTES = (len(ASPECT_PAIRS) * len(ASPECTS) + 7) // 8
+
+SNAPSHOT_DTYPE = np.dtype([
+    ('version', 'u1'),
+    ('positions', '<f4', (len(PLANETS),)),
+    ('speeds', '<f4', (len(PLANETS),)),
+    ('houses', '<f4', (12,)),
+    ('aspects', 'u1', (ASPECT_BYTES,)),
+])
+
+dataAccess = DataAccess()
+
+
+@metrics.timed('ephemeris')
+def compute(birthday: date, birth_time: time,
+            coordinates: dict | None = None) -> bytes:
+    """
+    Рассчитывает запись натальной карты.
+
+    Args:
+        birthday (date): Дата рождения.
+        birth_time (time): Время рождения.
+        coordinates (dict): Координаты места рождения с ключами "latitude"
+                            и "longitude" или None.
+
+    Returns:
+        Запись в формате SNAPSHOT_DTYPE.
+    """
+    jd = GetJulianDate(datetime.combine(birthday, birth_time)).jd
+    record = np.zeros(1, dtype=SNAPSHOT_DTYPE)[0]
+    record['version'] = VERSION
+    for index, (_, planet) in enumerate(GetAstralData.planets):
+        position = swe.calc_ut(jd, planet, swe.FLG_SWIEPH | swe.FLG_SPEED)[0]
+        record['positions'][index] = position[0]
+        record['speeds'][index] = position[3]
+    if coordinates:
+        record['houses'] = swe.houses(jd, coordinates['latitude'],
+                                      coordinates['longitude'], b'P')[0][:12]
+    else:
+        record['houses'] = np.nan
+    bits = np.zeros(ASPECT_BYTES * 8, dtype=np.uint8)
+    positions = record['positions'].astype(np.float64)
+    for pair, (first, second) in enumerate(ASPECT_PAIRS):
+        aspect = GetNatalChart2.calculate_aspect(
+            positions[first], positions[second], Synastry.orbis)
+        if aspect:
+            bits[pair * len(ASPECTS) + ASPECTS.index(aspect)] = 1
+    record['aspects'] = np.packbits(bits)
+    return record.tobytes()
+
+
+def read(data: bytes | memoryview) -> np.void:
+    """
+    Читает одну запись без копирования данных.
+
+    Args:
+        data: Запись в формате SNAPSHOT_DTYPE.
+
+    Returns:
+        Запись NumPy с полями SNAPSHOT_DTYPE (только для чтения).
+    """
+    return np.frombuffer(memoryview(data), dtype=SNAPSHOT_DTYPE, count=1)[0]
+
+
+def read_many(records: list) -> np.ndarray:
+    """
+    Читает записи нескольких карт в один структурированный массив.
+
+    Args:
+        records (list): Записи в формате SNAPSHOT_DTYPE.
+
+    Returns:
+        Массив размером len(records); например, поле positions - матрица
+        положений планет размером (len(records), len(PLANETS)).
+    """
+    return np.frombuffer(b''.join(records), dtype=SNAPSHOT_DTYPE)
+
+
+def aspects(record: np.void) -> list:
+    """
+    Расшифровывает битовую маску аспектов записи.
+
+    Args:
+        record (np.void): Запись, прочитанная read или read_many.
+
+    Returns:
+        Список кортежей (планета, планета, аспект).
+    """
+    bits = np.unpackbits(record['aspects'])
+    return [(PLANETS[ASPECT_PAIRS[index // len(ASPECTS)][0]],
+             PLANETS[ASPECT_PAIRS[index // len(ASPECTS)][1]],
+             ASPECTS[index % len(ASPECTS)])
+            for index in np.flatnonzero(bits)]
+
+
+def place_coordinates(user) -> dict | None:
+    """
+    Возвращает координаты места рождения без обращения к внешним сервисам:
+    сохранённые в профиле или из офлайн-справочника городов.
+    """
+    if user.latitude is not None and user.longitude is not None:
+        return {'latitude': user.latitude, 'longitude': user.longitude}
+    if user.city:
+        return gazetteer.resolve(user.city)
+    return None
+
+
+def load_snapshots(exclude_id: int | None = None) -> tuple:
+    """
+    Загружает записи натальных карт всех пользователей с заполненными
+    датой и временем рождения. Недостающие записи (новые пользователи и
+    пользователи, изменившие данные рождения) рассчитываются и сохраняются,
+    поэтому каждая запись рассчитывается один раз, а не при каждом запросе.
+
+    Args:
+        exclude_id (int): Идентификатор пользователя, который не попадает
+                          в выборку.
+
+    Returns:
+        Кортеж из списка строк пользователей (id, login, name, ...) и
+        массива записей SNAPSHOT_DTYPE в том же порядке.
+    """
+    rows = dataAccess.get_natal_snapshot_rows(exclude_id)
+    records, missing = _complete(rows)
+    dataAccess.add_natal_snapshots(missing)
+    return rows, read_many(records)
+
+
+def backfill_snapshots() -> int:
+    """
+    Рассчитывает и сохраняет записи натальных карт пользователей, для
+    которых их ещё нет. Запускается командой natal-snapshots.
+
+    Returns:
+        Количество сохранённых записей.
+    """
+    _, missing = _complete(dataAccess.get_natal_snapshot_rows())
+    dataAccess.add_natal_snapshots(missing)
+    return len(missing)
+
+
+def _complete(rows: list) -> tuple:
+    # Записи в порядке строк и рассчитанные недостающие записи
+    records, missing = [], []
+    for row in rows:
+        record = row.snapshot
+        if record is None:
+            record = compute(row.birthday, row.birth_time,
+                             place_coordinates(row))
+            missing.append({'user_id': row.id, 'snapshot': record})
+        records.append(record)
+    return records, missing
+
+
+def rebuild_snapshot(user) -> None:
+    """
+    Пересчитывает и сохраняет запись натальной карты пользователя.
+
+    Args:
+        user (User): Пользователь с заполненными датой и временем рождения.
+    """
+    dataAccess.del_natal_snapshot(user.id)
+    dataAccess.add_natal_snapshots([{
+        'user_id': user.id,
+        'snapshot': compute(user.birthday, user.birth_time,
+                            place_coordinates(user)),
+    }])
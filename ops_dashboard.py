@@ -0,0 +1,224 @@
+"""
+Модуль данных панели эксплуатации на главной странице админ-панели.
+
+Панель показывает состояние горячих путей приложения без внешнего
+мониторинга:
+    - долю попаданий в кэши процесса и общий кэш;
+    - гороскопы в очереди и в процессе создания;
+    - перцентили времени ответа языковой модели;
+    - попадания и промахи поиска координат городов;
+    - использование пулов соединений с базой данных и очереди проверки
+      паролей;
+    - самые медленные маршруты за скользящее окно OPS_WINDOW_SECONDS.
+
+Текущие показатели берутся из кольцевых буферов процесса, обработавшего
+запрос страницы (модуль ops_metrics). Чтобы видеть все процессы, каждый
+процесс раз в OPS_FLUSH_SECONDS сохраняет итоги прошедшего периода в
+таблицу ops_snapshot_SP, и панель показывает историю по минутам, сложенную
+по процессам. Поток сохранения запускается при первом запросе в каждом
+процессе, в том числе после fork воркеров gunicorn.
+
+Классы:
+    OpsSnapshotWriter: Периодическое сохранение показателей процесса.
+
+Функции:
+    dashboard(history_minutes=60) -> dict:
+        Собирает данные панели эксплуатации.
+
+Атрибуты:
+    ops_writer (OpsSnapshotWriter): Поток сохранения показателей процесса.
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from app import app, db
+from cache import (geocode_cache, horoscope_cache, moon_cache,
+                   natal_section_cache)
+from db_engines import pool_stats
+from horoscope_refresh import horoscope_refresher
+from models import DataAccess, user_cache
+from ops_metrics import LatencyBuffer, ops_metrics
+from passwords import password_hasher
+
+dataAccess = DataAccess()
+
+
+def worker_name() -> str:
+    """
+    Возвращает название процесса: имя хоста и идентификатор процесса.
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def cache_counters() -> tuple:
+    """
+    Возвращает попадания и промахи кэша гороскопов с запуска процесса.
+    Промах в памяти процесса, найденный в общем кэше, считается попаданием.
+    """
+    hits = horoscope_cache.hits + horoscope_cache.l2_hits
+    return hits, horoscope_cache.misses - horoscope_cache.l2_hits
+
+
+def geocode_counters() -> tuple:
+    """
+    Возвращает попадания (справочник и кэш) и промахи (внешний сервис)
+    поиска координат с запуска процесса.
+    """
+    counts = ops_metrics.geocode
+    return (counts['gazetteer'] + counts['cache'],
+            counts['service'] + counts['error'])
+
+
+class OpsSnapshotWriter:
+    """
+    Периодическое сохранение показателей процесса в таблицу
+    ops_snapshot_SP.
+
+    Args:
+        interval (float): Период сохранения, сек.
+        history_hours (int): Срок хранения показателей, ч.
+
+    Методы:
+        start(self) -> None:
+            Запускает поток сохранения в текущем процессе.
+
+        flush(self, now=None) -> dict:
+            Сохраняет показатели с прошлого сохранения.
+    """
+
+    def __init__(self, interval: float = 60, history_hours: int = 24) -> None:
+        self.interval = interval
+        self.history_hours = history_hours
+        self._pid = None
+        self._since = time.time()
+        self._counters = (0, 0, 0, 0)
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Запускает поток сохранения, если он ещё не запущен в текущем
+        процессе. Потоки не переживают fork, поэтому процесс определяется
+        по идентификатору.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._since = time.time()
+            self._counters = cache_counters() + geocode_counters()
+            threading.Thread(target=self._loop, name='ops-snapshot',
+                             daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception:
+                app.logger.exception('Не удалось сохранить показатели '
+                                     'процесса')
+
+    def flush(self, now: float | None = None) -> dict:
+        """
+        Сохраняет показатели процесса с прошлого сохранения и удаляет
+        устаревшие. Вызывается в контексте приложения.
+
+        Args:
+            now (float): Конец периода (Unix time), по умолчанию текущий
+                         момент.
+
+        Returns:
+            Сохранённые значения столбцов OpsSnapshot.
+        """
+        now = now or time.time()
+        since, self._since = self._since, now
+        counters = cache_counters() + geocode_counters()
+        hits, misses, geocode_hits, geocode_misses = (
+            current - previous
+            for current, previous in zip(counters, self._counters))
+        self._counters = counters
+        requests = LatencyBuffer.summary(
+            ops_metrics.routes.samples(since, now))
+        llm = LatencyBuffer.summary(ops_metrics.llm.samples(since, now))
+        slowest = ops_metrics.slowest_routes(since, now, limit=1)
+        pools = pool_stats(db)
+        started = datetime.fromtimestamp(since, timezone.utc)
+        values = {
+            'minute': started.replace(second=0, microsecond=0, tzinfo=None),
+            'worker': worker_name(),
+            'requests': requests['count'],
+            'request_errors': requests['errors'],
+            'request_p95': requests['p95'],
+            'slowest_route': slowest[0]['route'][:255] if slowest else None,
+            'slowest_p95': slowest[0]['p95'] if slowest else 0.0,
+            'llm_calls': llm['count'],
+            'llm_errors': llm['errors'],
+            'llm_p95': llm['p95'],
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'geocode_hits': geocode_hits,
+            'geocode_misses': geocode_misses,
+            'pending_jobs': horoscope_refresher.pending(),
+            'running_jobs': horoscope_refresher.running(),
+            'pool_checked_out': sum(pool['checked_out'] for pool in pools),
+            'pool_wait_p95': max((pool['wait_p95'] for pool in pools),
+                                 default=0.0),
+        }
+        expire_before = (started - timedelta(hours=self.history_hours)
+                         ).replace(tzinfo=None)
+        dataAccess.add_ops_snapshot(values, expire_before)
+        return values
+
+
+def dashboard(history_minutes: int = 60) -> dict:
+    """
+    Собирает данные панели эксплуатации: текущие показатели процесса за
+    скользящее окно и историю всех процессов по минутам.
+
+    Args:
+        history_minutes (int): Длительность истории в минутах.
+
+    Returns:
+        Словарь с ключами worker, window, caches, jobs, llm, geocode,
+        pools, passwords, routes и history.
+    """
+    window = app.config['OPS_WINDOW_SECONDS']
+    since = time.time() - window
+    geocode_hits, geocode_misses = geocode_counters()
+    history_since = (datetime.now(timezone.utc).replace(tzinfo=None)
+                     - timedelta(minutes=history_minutes))
+    pending = horoscope_refresher.pending()
+    running = horoscope_refresher.running()
+    return {
+        'worker': worker_name(),
+        'window': window,
+        'caches': [cache.stats() for cache in (
+            horoscope_cache, natal_section_cache, geocode_cache, moon_cache,
+            user_cache)],
+        'jobs': {'queued': pending - running, 'running': running},
+        'llm': LatencyBuffer.summary(ops_metrics.llm.samples(since)),
+        'geocode': dict(
+            ops_metrics.geocode,
+            hit_rate=(geocode_hits / (geocode_hits + geocode_misses)
+                      if geocode_hits + geocode_misses else 0.0)),
+        'pools': pool_stats(db),
+        'passwords': password_hasher.timings.stats(),
+        'routes': ops_metrics.slowest_routes(since),
+        'history': dataAccess.get_ops_history(history_since),
+    }
+
+
+ops_writer = OpsSnapshotWriter(app.config['OPS_FLUSH_SECONDS'],
+                               app.config['OPS_HISTORY_HOURS'])
+
+
+@app.before_request
+def _start_writer():
+    ops_writer.start()
@@ -0,0 +1,211 @@
+"""
+Модуль замеров производительности процесса для панели эксплуатации.
+
+Каждый процесс приложения хранит последние замеры в кольцевых буферах в
+памяти: время обработки запросов по маршрутам, время ответов языковой
+модели и результаты поиска координат городов. Запись замера не обращается
+к базе данных и не блокирует запрос дольше захвата блокировки. Панель
+эксплуатации (модуль ops_dashboard) показывает по буферам текущие
+показатели процесса за скользящее окно OPS_WINDOW_SECONDS и раз в
+OPS_FLUSH_SECONDS сохраняет итоги минуты в базу данных, откуда они
+объединяются по всем процессам.
+
+Время обработки запроса измеряется один раз и записывается и в буфер
+маршрутов, и в метрики Prometheus (модуль metrics).
+
+Классы:
+    LatencyBuffer: Кольцевой буфер замеров времени с метками.
+    OpsMetrics: Замеры процесса для панели эксплуатации.
+
+Атрибуты:
+    ops_metrics (OpsMetrics): Замеры текущего процесса.
+"""
+
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+from flask import g, request
+
+from app import app
+from metrics import metrics
+from passwords import percentile
+
+# Источники координат города: офлайн-справочник, общий кэш, внешний сервис
+# и ошибка внешнего сервиса
+GEOCODE_SOURCES = ('gazetteer', 'cache', 'service', 'error')
+
+
+class LatencyBuffer:
+    """
+    Кольцевой буфер последних замеров времени. Каждый замер хранится с
+    моментом записи и меткой (например, маршрутом запроса).
+
+    Args:
+        size (int): Количество хранимых замеров.
+
+    Методы:
+        record(self, seconds, label=None, failed=False) -> None:
+            Записывает замер.
+
+        samples(self, since, until=None) -> list[tuple]:
+            Возвращает замеры за период.
+
+        summary(samples) -> dict:
+            Возвращает количество, ошибки и перцентили замеров.
+    """
+
+    def __init__(self, size: int = 10000) -> None:
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, label: str | None = None,
+               failed: bool = False) -> None:
+        """
+        Записывает замер.
+
+        Args:
+            seconds (float): Длительность в секундах.
+            label (str): Метка замера.
+            failed (bool): Операция завершилась ошибкой.
+        """
+        with self._lock:
+            self._samples.append((time.time(), seconds, label, failed))
+
+    def samples(self, since: float, until: float | None = None) -> list:
+        """
+        Возвращает замеры (момент, длительность, метка, ошибка), записанные
+        с момента since до момента until (Unix time).
+        """
+        with self._lock:
+            samples = list(self._samples)
+        return [sample for sample in samples if sample[0] >= since
+                and (until is None or sample[0] < until)]
+
+    @staticmethod
+    def summary(samples: list) -> dict:
+        """
+        Возвращает количество замеров и ошибок, 50-й и 95-й перцентили и
+        максимум длительности в секундах.
+        """
+        durations = sorted(sample[1] for sample in samples)
+        return {
+            'count': len(durations),
+            'errors': sum(1 for sample in samples if sample[3]),
+            'p50': percentile(durations, 0.5),
+            'p95': percentile(durations, 0.95),
+            'max': durations[-1] if durations else 0.0,
+        }
+
+
+class OpsMetrics:
+    """
+    Замеры процесса для панели эксплуатации.
+
+    Args:
+        size (int): Количество хранимых замеров каждого вида.
+
+    Методы:
+        record_route(self, route, seconds, failed=False) -> None:
+            Записывает время обработки запроса.
+
+        llm_call(self):
+            Контекстный менеджер, замеряющий запрос к языковой модели.
+
+        record_geocode(self, source) -> None:
+            Записывает источник координат города.
+
+        slowest_routes(self, since, until=None, limit=10) -> list[dict]:
+            Возвращает маршруты с наибольшим 95-м перцентилем времени.
+
+    Атрибуты:
+        routes (LatencyBuffer): Время обработки запросов по маршрутам.
+        llm (LatencyBuffer): Время ответов языковой модели.
+        geocode (Counter): Количество поисков координат по источникам с
+                           запуска процесса.
+    """
+
+    def __init__(self, size: int = 10000) -> None:
+        self.routes = LatencyBuffer(size)
+        self.llm = LatencyBuffer(size)
+        self.geocode = Counter({source: 0 for source in GEOCODE_SOURCES})
+        self._lock = threading.Lock()
+
+    def record_route(self, route: str, seconds: float,
+                     failed: bool = False) -> None:
+        """
+        Записывает время обработки запроса.
+
+        Args:
+            route (str): Метод и шаблон адреса маршрута.
+            seconds (float): Время обработки в секундах.
+            failed (bool): Запрос завершился ошибкой сервера.
+        """
+        self.routes.record(seconds, route, failed)
+
+    @contextmanager
+    def llm_call(self):
+        """
+        Замеряет запрос к языковой модели. Исключение записывается как
+        ошибка и передаётся дальше.
+        """
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.llm.record(time.perf_counter() - started, failed=failed)
+
+    def record_geocode(self, source: str) -> None:
+        """
+        Записывает источник координат города (GEOCODE_SOURCES).
+        """
+        with self._lock:
+            self.geocode[source] += 1
+
+    def slowest_routes(self, since: float, until: float | None = None,
+                       limit: int = 10) -> list:
+        """
+        Возвращает маршруты с наибольшим 95-м перцентилем времени обработки
+        за период.
+
+        Args:
+            since (float): Начало периода (Unix time).
+            until (float): Конец периода или None.
+            limit (int): Количество маршрутов.
+
+        Returns:
+            Список словарей LatencyBuffer.summary с ключом route.
+        """
+        by_route = defaultdict(list)
+        for sample in self.routes.samples(since, until):
+            by_route[sample[2]].append(sample)
+        routes = [dict(LatencyBuffer.summary(samples), route=route)
+                  for route, samples in by_route.items()]
+        routes.sort(key=lambda route: route['p95'], reverse=True)
+        return routes[:limit]
+
+
+ops_metrics = OpsMetrics(app.config['OPS_BUFFER_SIZE'])
+
+
+@app.before_request
+def _start_timer():
+    g.ops_started = time.perf_counter()
+    metrics.start_request()
+
+
+@app.teardown_request
+def _record_route(error=None):
+    started = g.pop('ops_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    metrics.finish_request(seconds)
+    if request.endpoint == 'static':
+        return
+    rule = request.url_rule.rule if request.url_rule else 'не найден'
+    ops_metrics.record_route(f'{request.method} {rule}', seconds,
+                             failed=error is not None)
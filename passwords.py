@@ -0,0 +1,226 @@
+"""
+Модуль хеширования и проверки паролей.
+
+Хеширование scrypt или pbkdf2 занимает ядро процессора на десятки и сотни
+миллисекунд. Чтобы в часы пик входы пользователей не занимали все потоки
+обработки запросов, пароли хешируются и проверяются в ограниченном пуле
+потоков (hashlib освобождает GIL на время вычисления): одновременно
+выполняется не более PASSWORD_WORKERS вычислений, а в очереди ждут не более
+PASSWORD_QUEUE_SIZE запросов. Если очередь заполнена дольше
+PASSWORD_QUEUE_TIMEOUT секунд, вход отклоняется с просьбой повторить попытку.
+
+Способ и параметры хеширования задаются PASSWORD_HASH_METHOD в формате
+werkzeug.security, например 'scrypt:32768:8:1' или 'pbkdf2:sha256:600000'.
+Хеш пароля, созданный с другими параметрами, заменяется новым при
+следующем успешном входе пользователя.
+
+Время ожидания в очереди и время проверки пароля записываются в статистику,
+по которой подбирается стоимость хеширования.
+
+Классы:
+    PasswordBusyError: Очередь проверки паролей заполнена.
+    HashTimings: Статистика времени хеширования и проверки паролей.
+    PasswordHasher: Хеширование и проверка паролей в ограниченном пуле.
+
+Атрибуты:
+    password_hasher (PasswordHasher): Настроенный по конфигурации
+    приложения пул проверки паролей.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import app
+
+
+class PasswordBusyError(Exception):
+    """
+    Очередь проверки паролей заполнена, вход нужно повторить позже.
+    """
+
+
+class HashTimings:
+    """
+    Статистика времени хеширования и проверки паролей.
+
+    Args:
+        window (int): Количество последних операций для расчёта
+                      перцентилей.
+
+    Методы:
+        record(self, wait, work) -> None:
+            Записывает время ожидания в очереди и время вычисления.
+
+        record_rejected(self) -> None:
+            Записывает отклонённую из-за заполненной очереди операцию.
+
+        stats(self) -> dict:
+            Возвращает статистику операций.
+    """
+
+    def __init__(self, window: int = 1024) -> None:
+        self.count = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=window)
+        self._works = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, work: float) -> None:
+        """
+        Записывает время ожидания в очереди и время вычисления в секундах.
+        """
+        with self._lock:
+            self.count += 1
+            self._waits.append(wait)
+            self._works.append(work)
+
+    def record_rejected(self) -> None:
+        """
+        Записывает отклонённую из-за заполненной очереди операцию.
+        """
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self) -> dict:
+        """
+        Возвращает статистику операций.
+
+        Returns:
+            Словарь с количеством выполненных и отклонённых операций, 50-м и
+            95-м перцентилями времени ожидания и вычисления в секундах.
+        """
+        with self._lock:
+            waits, works = sorted(self._waits), sorted(self._works)
+            return {
+                'count': self.count,
+                'rejected': self.rejected,
+                'wait_p50': percentile(waits, 0.5),
+                'wait_p95': percentile(waits, 0.95),
+                'work_p50': percentile(works, 0.5),
+                'work_p95': percentile(works, 0.95),
+            }
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Возвращает перцентиль отсортированного списка или 0, если он пуст.
+    """
+    return values[int(len(values) * fraction)] if values else 0.0
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей в ограниченном пуле потоков.
+
+    Args:
+        method (str): Способ и параметры хеширования в формате
+                      werkzeug.security.
+        workers (int): Количество одновременно выполняемых вычислений.
+        queue_size (int): Количество запросов, ожидающих в очереди.
+        queue_timeout (float): Время ожидания места в очереди, сек.
+
+    Методы:
+        hash(self, password) -> str:
+            Хеширует пароль.
+
+        verify(self, password_hash, password) -> bool:
+            Проверяет пароль.
+
+        needs_rehash(self, password_hash) -> bool:
+            Проверяет, создан ли хеш с текущими параметрами.
+
+    Атрибуты:
+        timings (HashTimings): Статистика хеширования и проверки паролей.
+    """
+
+    def __init__(self, method: str = 'scrypt', workers: int = 2,
+                 queue_size: int = 32, queue_timeout: float = 5) -> None:
+        self.method = method
+        self.queue_timeout = queue_timeout
+        self.timings = HashTimings()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='password')
+
+    @cached_property
+    def method_prefix(self) -> str:
+        """
+        Способ и параметры хеширования так, как они записываются в начале
+        хеша: werkzeug дополняет краткую запись параметрами по умолчанию.
+        """
+        return generate_password_hash('', self.method).split('$', 1)[0]
+
+    def hash(self, password: str) -> str:
+        """
+        Хеширует пароль с текущими параметрами.
+
+        Args:
+            password (str): Пароль.
+
+        Returns:
+            str: Хеш пароля.
+
+        Raises:
+            PasswordBusyError: Если очередь заполнена.
+        """
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """
+        Проверяет пароль. Время ожидания и проверки записывается в timings.
+
+        Args:
+            password_hash (str): Сохранённый хеш пароля.
+            password (str): Введённый пароль.
+
+        Returns:
+            bool: True, если пароль верный.
+
+        Raises:
+            PasswordBusyError: Если очередь заполнена.
+        """
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """
+        Проверяет, отличаются ли параметры хеша от текущих.
+
+        Args:
+            password_hash (str): Сохранённый хеш пароля.
+
+        Returns:
+            bool: True, если хеш нужно пересоздать.
+        """
+        return password_hash.split('$', 1)[0] != self.method_prefix
+
+    def _run(self, function, *args):
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.timings.record_rejected()
+            raise PasswordBusyError('Очередь проверки паролей заполнена')
+        try:
+            started = []
+
+            def task():
+                started.append(time.perf_counter())
+                return function(*args)
+
+            result = self._executor.submit(task).result()
+        finally:
+            self._slots.release()
+        finished = time.perf_counter()
+        self.timings.record(started[0] - queued, finished - started[0])
+        return result
+
+
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'],
+    app.config['PASSWORD_WORKERS'],
+    app.config['PASSWORD_QUEUE_SIZE'],
+    app.config['PASSWORD_QUEUE_TIMEOUT'],
+)
@@ -0,0 +1,392 @@
+"""
+Модуль профилирования запросов в рабочем окружении.
+
+Профилирование включается администратором без перезапуска процессов и без
+панели отладки двумя способами:
+    - выборочный профилировщик на следующие N запросов к маршруту: страница
+      «Профилирование» админ-панели записывает маршрут и количество
+      запросов в файл PROFILE_PATH/armed.json, общий для всех процессов.
+      Для запроса, занявшего место, отдельный поток каждые
+      PROFILE_INTERVAL секунд снимает стек потока запроса; накладные
+      расходы не зависят от глубины вызовов в самом запросе;
+    - cProfile для одного запроса: запрос администратора с заголовком
+      PROFILE_HEADER (по умолчанию X-Profile) профилируется полностью.
+
+Стеки выборочного профилировщика сохраняются в формате collapsed stacks
+(строка «функция;функция;... количество»), который читают flamegraph.pl и
+speedscope, а результаты cProfile - в формате pstats. Файлы хранятся в
+PROFILE_PATH (не более PROFILE_KEEP последних) и просматриваются на
+странице «Профилирование» админ-панели: стеки - в виде flame graph,
+cProfile - таблицей самых долгих функций.
+
+Классы:
+    StackSampler: Выборочный профилировщик потока.
+    RequestProfiler: Профилирование запросов и хранение результатов.
+
+Функции:
+    flame_tree(stacks, min_share=0.005) -> dict:
+        Строит дерево flame graph из свёрнутых стеков.
+
+Атрибуты:
+    request_profiler (RequestProfiler): Профилировщик запросов
+    приложения.
+"""
+
+import cProfile
+import fcntl
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+from flask_login import current_user
+from werkzeug.utils import secure_filename
+
+from app import app
+
+# Расширения файлов результатов по видам профилирования
+COLLAPSED_SUFFIX = '.collapsed'
+PSTATS_SUFFIX = '.prof'
+
+
+class StackSampler:
+    """
+    Выборочный профилировщик: фоновый поток через равные промежутки
+    времени снимает стек заданного потока и считает одинаковые стеки.
+
+    Args:
+        thread_id (int): Идентификатор профилируемого потока.
+        interval (float): Промежуток между снимками стека, сек.
+
+    Методы:
+        start(self) -> None:
+            Запускает снятие стеков.
+
+        stop(self) -> Counter:
+            Останавливает снятие стеков и возвращает их количество.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='stack-sampler')
+
+    def start(self) -> None:
+        """
+        Запускает снятие стеков.
+        """
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """
+        Останавливает снятие стеков.
+
+        Returns:
+            Количество снимков по свёрнутым стекам (от внешнего вызова к
+            внутреннему через «;»).
+        """
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({os.path.basename(code.co_filename)}:'
+                             f'{code.co_firstlineno})'.replace(';', ','))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    """
+    Профилирование запросов и хранение результатов.
+
+    Args:
+        path (str): Каталог результатов и файла с заданием профилирования.
+        interval (float): Промежуток между снимками стека, сек.
+        header (str): Заголовок запроса, включающий cProfile.
+        keep (int): Количество хранимых результатов.
+
+    Методы:
+        arm(self, route, count) -> None:
+            Включает выборочный профилировщик для следующих запросов.
+
+        disarm(self) -> None:
+            Выключает выборочный профилировщик.
+
+        armed(self) -> dict | None:
+            Возвращает задание профилирования.
+
+        profiles(self) -> list[dict]:
+            Возвращает сохранённые результаты от новых к старым.
+
+        read_stacks(self, name) -> Counter:
+            Читает свёрнутые стеки из файла результата.
+
+        read_stats(self, name, limit=60) -> str:
+            Возвращает таблицу самых долгих функций результата cProfile.
+
+        result_path(self, name) -> str | None:
+            Возвращает путь к файлу результата.
+    """
+
+    # Как часто процесс перечитывает задание профилирования, сек
+    ARM_CHECK_SECONDS = 1.0
+
+    def __init__(self, path: str, interval: float = 0.005,
+                 header: str = 'X-Profile', keep: int = 200) -> None:
+        self.path = path
+        self.interval = interval
+        self.header = header
+        self.keep = keep
+        self._armed = None
+        self._checked = 0.0
+
+    @property
+    def arm_path(self) -> str:
+        """
+        Путь к файлу с заданием профилирования.
+        """
+        return os.path.join(self.path, 'armed.json')
+
+    def arm(self, route: str, count: int) -> None:
+        """
+        Включает выборочный профилировщик для следующих запросов к маршруту
+        во всех процессах.
+
+        Args:
+            route (str): Шаблон адреса маршрута (например, /natal_chart)
+                         или название обработчика.
+            count (int): Количество запросов.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self._locked_arm() as file:
+            file.truncate()
+            json.dump({'route': route, 'remaining': count}, file)
+        self._checked = 0.0
+
+    def disarm(self) -> None:
+        """
+        Выключает выборочный профилировщик во всех процессах.
+        """
+        if os.path.exists(self.arm_path):
+            os.remove(self.arm_path)
+        self._armed = None
+
+    def armed(self) -> dict | None:
+        """
+        Возвращает задание профилирования: маршрут и количество оставшихся
+        запросов. Процесс перечитывает файл задания не чаще раза в
+        ARM_CHECK_SECONDS секунд.
+        """
+        now = time.monotonic()
+        if now - self._checked >= self.ARM_CHECK_SECONDS:
+            self._checked = now
+            try:
+                with open(self.arm_path, encoding='utf-8') as file:
+                    self._armed = json.load(file)
+            except (OSError, ValueError):
+                self._armed = None
+        return self._armed
+
+    def _take(self) -> bool:
+        # Место в задании занимается под блокировкой файла, чтобы процессы
+        # вместе не профилировали больше запросов, чем задано
+        if not os.path.exists(self.arm_path):
+            self._armed = None
+            return False
+        try:
+            with self._locked_arm() as file:
+                armed = json.load(file)
+                if armed['remaining'] <= 0:
+                    return False
+                armed['remaining'] -= 1
+                file.seek(0)
+                file.truncate()
+                json.dump(armed, file)
+        except (OSError, ValueError, KeyError):
+            return False
+        self._armed = armed
+        if armed['remaining'] == 0:
+            self.disarm()
+        return True
+
+    def _locked_arm(self):
+        file = open(self.arm_path, 'a+', encoding='utf-8')
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        return file
+
+    def start(self) -> None:
+        """
+        Начинает профилирование текущего запроса, если оно запрошено
+        заголовком администратора или заданием профилирования.
+        """
+        if request.headers.get(self.header):
+            if current_user.is_authenticated and \
+                    current_user.login == 'Admin':
+                g.profile = cProfile.Profile()
+                g.profile.enable()
+            return
+        armed = self.armed()
+        if armed is None or request.url_rule is None:
+            return
+        if armed['route'] not in (request.url_rule.rule, request.endpoint):
+            return
+        if self._take():
+            g.sampler = StackSampler(threading.get_ident(), self.interval)
+            g.sampler.start()
+
+    def finish(self) -> None:
+        """
+        Завершает профилирование текущего запроса и сохраняет результат.
+        """
+        profile = g.pop('profile', None)
+        sampler = g.pop('sampler', None)
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(self._new_path(PSTATS_SUFFIX))
+        elif sampler is not None:
+            stacks = sampler.stop()
+            with open(self._new_path(COLLAPSED_SUFFIX), 'w',
+                      encoding='utf-8') as file:
+                for stack, count in stacks.most_common():
+                    file.write(f'{stack} {count}\n')
+        else:
+            return
+        self._prune()
+
+    def _new_path(self, suffix: str) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        name = secure_filename(
+            f'{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint}-'
+            f'{os.getpid()}{suffix}')
+        return os.path.join(self.path, name)
+
+    def _prune(self) -> None:
+        for profile in self.profiles()[self.keep:]:
+            os.remove(os.path.join(self.path, profile['name']))
+
+    def profiles(self) -> list:
+        """
+        Возвращает сохранённые результаты от новых к старым.
+
+        Returns:
+            Список словарей с названием файла, видом ('stacks' или
+            'cprofile'), размером и временем изменения.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        result = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith((COLLAPSED_SUFFIX, PSTATS_SUFFIX)):
+                stat = entry.stat()
+                result.append({
+                    'name': entry.name,
+                    'kind': ('stacks' if entry.name.endswith(COLLAPSED_SUFFIX)
+                             else 'cprofile'),
+                    'size': stat.st_size,
+                    'modified': datetime.fromtimestamp(stat.st_mtime),
+                })
+        result.sort(key=lambda profile: profile['name'], reverse=True)
+        return result
+
+    def result_path(self, name: str) -> str | None:
+        """
+        Возвращает путь к файлу результата или None, если такого
+        результата нет.
+        """
+        if name != secure_filename(name) or \
+                not name.endswith((COLLAPSED_SUFFIX, PSTATS_SUFFIX)):
+            return None
+        path = os.path.join(self.path, name)
+        return path if os.path.isfile(path) else None
+
+    def read_stacks(self, name: str) -> Counter:
+        """
+        Читает свёрнутые стеки из файла результата выборочного
+        профилировщика.
+        """
+        stacks = Counter()
+        with open(self.result_path(name), encoding='utf-8') as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                stacks[stack] += int(count)
+        return stacks
+
+    def read_stats(self, name: str, limit: int = 60) -> str:
+        """
+        Возвращает таблицу самых долгих по общему времени функций
+        результата cProfile.
+        """
+        output = io.StringIO()
+        stats = pstats.Stats(self.result_path(name), stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+def flame_tree(stacks: Counter, min_share: float = 0.005) -> dict:
+    """
+    Строит дерево flame graph из свёрнутых стеков.
+
+    Args:
+        stacks (Counter): Количество снимков по свёрнутым стекам.
+        min_share (float): Доля снимков, ниже которой узлы не выводятся.
+
+    Returns:
+        Корневой узел: словарь с ключами name, value (количество снимков),
+        share (доля от всех снимков) и children (дочерние узлы по убыванию
+        value).
+    """
+    root = {'name': 'все', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(
+                name, {'name': name, 'value': 0, 'children': {}})
+            node['value'] += count
+    total = root['value'] or 1
+
+    def finish(node):
+        node['share'] = node['value'] / total
+        node['children'] = sorted(
+            (finish(child) for child in node['children'].values()
+             if child['value'] / total >= min_share),
+            key=lambda child: child['value'], reverse=True)
+        return node
+
+    return finish(root)
+
+
+request_profiler = RequestProfiler(
+    app.config['PROFILE_PATH'],
+    app.config['PROFILE_INTERVAL'],
+    app.config['PROFILE_HEADER'],
+    app.config['PROFILE_KEEP'],
+)
+
+
+@app.before_request
+def _start_profile():
+    request_profiler.start()
+
+
+@app.teardown_request
+def _finish_profile(error=None):
+    request_profiler.finish()
@@ -0,0 +1,207 @@
+"""
+Модуль срока хранения гороскопов.
+
+Таблица horoscope_SP каждый день пополняется гороскопами на сегодня для
+всех знаков и гороскопами на произвольные даты, выбранные пользователями на
+странице особого гороскопа. Чтобы основная таблица и её индекс оставались
+небольшими, гороскопы, период которых закончился больше
+HOROSCOPE_RETENTION_DAYS дней назад (по дате UTC), переносятся пачками в
+архив командой `flask --app controller horoscope-archive`. Архив хранится
+в таблице horoscope_archive_SP или в сжатых файлах JSON Lines
+(HOROSCOPE_ARCHIVE = 'table' или 'jsonl').
+
+Когда особый гороскоп на архивную дату запрашивается снова, он возвращается
+из архива в основную таблицу вместо повторного запроса к модели и хранится
+там полный срок с момента возвращения.
+
+Файлы архива раскладываются по месяцам даты гороскопа:
+    HOROSCOPE_ARCHIVE_PATH/YYYY-MM/
+        horoscope-<первый id>-<последний id>.jsonl.gz
+Каждая строка файла - объект с полями period, zodiac_sign, date, created_at
+и horoscope.
+
+Классы:
+    HoroscopeRetention: Перенос гороскопов в архив и возвращение из архива.
+
+Атрибуты:
+    horoscope_retention (HoroscopeRetention): Настроенный по конфигурации
+    приложения архив гороскопов.
+"""
+
+import glob
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from app import app
+from business_logic import period_end
+from models import DataAccess
+
+dataAccess = DataAccess()
+
+
+class HoroscopeRetention:
+    """
+    Перенос гороскопов с истёкшим сроком хранения в архив и возвращение их
+    по запросу.
+
+    Args:
+        days (int): Срок хранения гороскопов в основной таблице в днях.
+        backend (str): Хранилище архива: 'table' или 'jsonl'.
+        path (str): Каталог файлов архива для хранилища 'jsonl'.
+
+    Методы:
+        cutoff(self, today=None) -> date:
+            Возвращает дату, гороскопы раньше которой переносятся в архив.
+
+        expired(period, date, cutoff) -> bool:
+            Проверяет, истёк ли срок хранения гороскопа.
+
+        archive(self, batch_size=1000, today=None):
+            Переносит гороскопы с истёкшим сроком хранения в архив пачками.
+
+        restore(self, period, date, zodiac_sign) -> str | None:
+            Возвращает гороскоп из архива в основную таблицу.
+    """
+
+    def __init__(self, days: int = 90, backend: str = 'table',
+                 path: str | None = None) -> None:
+        if backend not in ('table', 'jsonl'):
+            raise ValueError(f'Неизвестное хранилище архива: {backend}')
+        self.days = days
+        self.backend = backend
+        self.path = path
+
+    def cutoff(self, today: date | None = None) -> date:
+        """
+        Возвращает дату, гороскопы раньше которой переносятся в архив.
+        Время создания гороскопов хранится в UTC, поэтому и текущая дата
+        берётся по UTC.
+
+        Args:
+            today (date): Текущая дата (по умолчанию сегодня по UTC).
+        """
+        today = today or datetime.now(timezone.utc).date()
+        return today - timedelta(days=self.days)
+
+    @staticmethod
+    def expired(period: str, date: date, cutoff: date) -> bool:
+        """
+        Проверяет, истёк ли срок хранения гороскопа: период гороскопа
+        закончился раньше cutoff. Гороскоп без границы периода (особый
+        гороскоп на дату) истекает по своей дате.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (date): Дата начала периода.
+            cutoff (date): Граница срока хранения.
+        """
+        end = period_end(period, date)
+        return (end.date() if end else date) < cutoff
+
+    def archive(self, batch_size: int = 1000, today: date | None = None):
+        """
+        Переносит гороскопы с истёкшим сроком хранения в архив пачками.
+        Каждая пачка удаляется из основной таблицы только после того, как
+        записана в архив, поэтому прерванный перенос можно запустить снова.
+
+        Args:
+            batch_size (int): Количество гороскопов в одной пачке.
+            today (date): Текущая дата (по умолчанию сегодня).
+
+        Yields:
+            Количество гороскопов в перенесённой пачке.
+        """
+        cutoff = self.cutoff(today)
+        last_id = 0
+        while True:
+            rows = dataAccess.get_expired_horoscopes(cutoff, batch_size,
+                                                     last_id)
+            if not rows:
+                return
+            last_id = rows[-1].id
+            rows = [row for row in rows
+                    if self.expired(row.period, row.date, cutoff)]
+            if not rows:
+                continue
+            ids = [row.id for row in rows]
+            if self.backend == 'table':
+                dataAccess.archive_horoscopes(ids)
+            else:
+                self._write_files(rows)
+                dataAccess.del_horoscopes(ids)
+            yield len(rows)
+
+    def restore(self, period: str, date, zodiac_sign: str) -> str | None:
+        """
+        Ищет гороскоп в архиве и возвращает его в основную таблицу.
+
+        Args:
+            period (str): Период времени гороскопа.
+            date (date | datetime | str): Дата гороскопа.
+            zodiac_sign (str): Знак зодиака.
+
+        Returns:
+            str | None: Текст гороскопа или None, если его нет в архиве.
+        """
+        date = dataAccess.as_date(date)
+        if not self.expired(period, date, self.cutoff()):
+            return None
+        if self.backend == 'table':
+            text = dataAccess.get_archived_horoscope_text(period, date,
+                                                          zodiac_sign)
+        else:
+            text = self._find_in_files(period, date, zodiac_sign)
+        if text is not None:
+            dataAccess.restore_horoscope(period, date, zodiac_sign, text)
+        return text
+
+    def _write_files(self, rows: list) -> None:
+        # Файл записывается под временным именем и переименовывается после
+        # закрытия, чтобы при сбое не остался недописанный архив
+        months = defaultdict(list)
+        for row in rows:
+            month = row.date.strftime('%Y-%m') if row.date else 'none'
+            months[month].append(row)
+        for month, month_rows in months.items():
+            directory = os.path.join(self.path, month)
+            os.makedirs(directory, exist_ok=True)
+            name = os.path.join(
+                directory,
+                f'horoscope-{month_rows[0].id:010d}-{month_rows[-1].id:010d}'
+                '.jsonl.gz')
+            with gzip.open(name + '.tmp', 'wt', encoding='utf-8') as file:
+                for row in month_rows:
+                    file.write(json.dumps({
+                        'period': row.period,
+                        'zodiac_sign': row.zodiac_sign,
+                        'date': row.date.isoformat() if row.date else None,
+                        'created_at': (row.created_at.isoformat()
+                                       if row.created_at else None),
+                        'horoscope': row.horoscope,
+                    }, ensure_ascii=False) + '\n')
+            os.replace(name + '.tmp', name)
+
+    def _find_in_files(self, period: str, date: date,
+                       zodiac_sign: str) -> str | None:
+        pattern = os.path.join(self.path, date.strftime('%Y-%m'),
+                               'horoscope-*.jsonl.gz')
+        key = date.isoformat()
+        # Более поздние файлы содержат более поздние версии гороскопа
+        for name in sorted(glob.glob(pattern), reverse=True):
+            with gzip.open(name, 'rt', encoding='utf-8') as file:
+                for line in file:
+                    row = json.loads(line)
+                    if (row['date'] == key and row['period'] == period
+                            and row['zodiac_sign'] == zodiac_sign):
+                        return row['horoscope']
+        return None
+
+
+horoscope_retention = HoroscopeRetention(
+    app.config['HOROSCOPE_RETENTION_DAYS'],
+    app.config['HOROSCOPE_ARCHIVE'],
+    app.config['HOROSCOPE_ARCHIVE_PATH'],
+)
@@ -0,0 +1,348 @@
+"""
+Модуль полнотекстового поиска по гороскопам и натальным картам.
+
+Тексты хранятся в сжатом виде (модуль compression), поэтому база данных не
+может искать по ним сама. Для каждого вида текстов ведётся отдельная
+таблица поиска с несжатым текстом и полнотекстовым индексом, ключ которой
+совпадает с идентификатором исходной записи:
+    SQLite - виртуальная таблица FTS5 (ключ - rowid), ранжирование bm25;
+    MySQL  - таблица InnoDB с индексом FULLTEXT, ранжирование по
+             релевантности MATCH ... AGAINST.
+Для других СУБД поиск недоступен.
+
+Таблицы поиска обновляются в той же транзакции, что и исходные таблицы:
+изменения объектов моделей - событиями after_insert, after_update и
+after_delete, запросы INSERT и DELETE, выполняемые через сессию без
+объектов (add_new_horoscope, перенос в архив, импорт текстов), - событием
+сессии do_orm_execute. Существующие тексты индексируются командой
+`flask --app controller search-rebuild`.
+
+Классы:
+    SearchIndex: Полнотекстовый индекс текстов.
+
+Атрибуты:
+    SEARCH_SOURCES (dict): Индексируемые тексты по видам: модель и столбец.
+    search_index (SearchIndex): Индекс текстов приложения.
+"""
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, event
+from sqlalchemy.dialects.mysql import match as mysql_match
+
+from app import app, db
+from models import Horoscope, UserNatalChart
+
+SEARCH_SOURCES = {
+    'horoscope': (Horoscope, 'horoscope'),
+    'natal_chart': (UserNatalChart, 'natal_chart'),
+}
+
+# Новые записи индексируются по идентификаторам после последнего
+# проиндексированного с запасом на параллельные транзакции
+CATCH_UP_WINDOW = 1000
+
+# Длина фрагмента текста вокруг найденной фразы в результатах поиска
+SNIPPET_LENGTH = 240
+
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс текстов в таблицах <вид>_search_SP.
+
+    Методы:
+        create(self, connection, drop=False, kinds=SEARCH_SOURCES) -> None:
+            Создаёт таблицы поиска, если их нет.
+
+        catch_up(self, session, kind) -> None:
+            Индексирует записи, добавленные без объектов моделей.
+
+        rebuild(self, kind, batch_size=1000):
+            Пересоздаёт таблицу поиска и индексирует все тексты вида.
+
+        search(self, query, kind=None, limit=50) -> list[dict]:
+            Ищет фразу в текстах и возвращает результаты по релевантности.
+
+        preview(self, kind, length):
+            Возвращает выражение начала текста записи для запроса списка.
+
+        index(self, connection, kind, rows) -> None:
+            Добавляет или заменяет тексты в индексе.
+
+        remove(self, connection, kind, ids) -> None:
+            Удаляет тексты из индекса.
+    """
+
+    def __init__(self) -> None:
+        self._tables = {}
+
+    @staticmethod
+    def supported(dialect: str) -> bool:
+        """
+        Проверяет, поддерживается ли полнотекстовый поиск для СУБД.
+        """
+        return dialect in ('sqlite', 'mysql')
+
+    def table(self, kind: str, dialect: str) -> Table:
+        """
+        Возвращает таблицу поиска вида текстов. Ключ таблицы FTS5 в SQLite
+        называется rowid, в MySQL - id.
+        """
+        if (kind, dialect) not in self._tables:
+            key = 'rowid' if dialect == 'sqlite' else 'id'
+            self._tables[kind, dialect] = Table(
+                f'{kind}_search_SP', MetaData(),
+                Column(key, Integer, primary_key=True),
+                Column('content', Text),
+            )
+        return self._tables[kind, dialect]
+
+    @staticmethod
+    def key(table: Table):
+        """
+        Возвращает ключевой столбец таблицы поиска.
+        """
+        return table.primary_key.columns.values()[0]
+
+    def create(self, connection, drop: bool = False,
+               kinds=SEARCH_SOURCES) -> None:
+        """
+        Создаёт таблицы поиска, если их нет.
+
+        Args:
+            connection: Соединение с базой данных.
+            drop (bool): Удалить существующие таблицы перед созданием.
+            kinds: Виды текстов.
+        """
+        dialect = connection.dialect.name
+        if not self.supported(dialect):
+            return
+        for kind in kinds:
+            name = self.table(kind, dialect).name
+            if drop:
+                connection.exec_driver_sql(f'DROP TABLE IF EXISTS {name}')
+            if dialect == 'sqlite':
+                connection.exec_driver_sql(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING '
+                    f"fts5(content, tokenize='unicode61 remove_diacritics 2')")
+            else:
+                connection.exec_driver_sql(
+                    f'CREATE TABLE IF NOT EXISTS {name} ('
+                    f'id INT PRIMARY KEY, content MEDIUMTEXT NOT NULL, '
+                    f'FULLTEXT KEY ft_{name} (content)'
+                    f') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4')
+
+    def index(self, connection, kind: str, rows: list) -> None:
+        """
+        Добавляет или заменяет тексты в индексе.
+
+        Args:
+            connection: Соединение или сессия.
+            kind (str): Вид текстов.
+            rows (list): Пары (идентификатор записи, текст).
+        """
+        if not rows:
+            return
+        table = self.table(kind, self.dialect(connection))
+        key = self.key(table)
+        self.remove(connection, kind, [row_id for row_id, _ in rows])
+        connection.execute(table.insert(), [
+            {key.name: row_id, 'content': text} for row_id, text in rows])
+
+    def remove(self, connection, kind: str, ids) -> None:
+        """
+        Удаляет тексты из индекса.
+
+        Args:
+            connection: Соединение или сессия.
+            kind (str): Вид текстов.
+            ids: Идентификаторы записей или подзапрос, выбирающий их.
+        """
+        table = self.table(kind, self.dialect(connection))
+        connection.execute(table.delete().where(self.key(table).in_(ids)))
+
+    def catch_up(self, session, kind: str) -> None:
+        """
+        Индексирует добавленные в обход объектов моделей записи: записи с
+        идентификаторами после последнего проиндексированного (с запасом
+        CATCH_UP_WINDOW), которых ещё нет в индексе.
+        """
+        model, name = SEARCH_SOURCES[kind]
+        table = self.table(kind, self.dialect(session))
+        key = self.key(table)
+        last = session.execute(db.select(db.func.max(key))).scalar() or 0
+        rows = session.execute(
+            db.select(model.id, getattr(model, name))
+            .outerjoin(table, key == model.id)
+            .where(model.id > last - CATCH_UP_WINDOW, key.is_(None))
+        ).all()
+        self.index(session, kind, rows)
+
+    def rebuild(self, kind: str, batch_size: int = 1000):
+        """
+        Пересоздаёт таблицу поиска и индексирует все тексты вида пачками по
+        возрастанию id.
+
+        Args:
+            kind (str): Вид текстов.
+            batch_size (int): Количество текстов в одной пачке.
+
+        Yields:
+            Количество проиндексированных текстов в пачке.
+        """
+        model, name = SEARCH_SOURCES[kind]
+        self.create(db.session.connection(), drop=True, kinds=[kind])
+        db.session.commit()
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(model.id, getattr(model, name))
+                .where(model.id > last_id).order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            self.index(db.session, kind, rows)
+            db.session.commit()
+            last_id = rows[-1][0]
+            yield len(rows)
+
+    def search(self, query: str, kind: str | None = None,
+               limit: int = 50) -> list:
+        """
+        Ищет фразу в текстах.
+
+        Args:
+            query (str): Искомая фраза.
+            kind (str): Вид текстов или None для поиска по всем видам.
+            limit (int): Максимальное количество результатов.
+
+        Returns:
+            Список словарей с ключами kind, id, score и snippet по убыванию
+            релевантности.
+        """
+        dialect = self.dialect(db.session)
+        if not self.supported(dialect) or not query.strip():
+            return []
+        phrase = '"{}"'.format(query.replace('"', ' ').strip())
+        results = []
+        for name in ([kind] if kind else SEARCH_SOURCES):
+            table = self.table(name, dialect)
+            key = self.key(table)
+            if dialect == 'sqlite':
+                # bm25 возвращает отрицательную оценку: чем меньше, тем лучше
+                score = -db.func.bm25(db.literal_column(table.name))
+                condition = db.literal_column(table.name).op('MATCH')(phrase)
+            else:
+                score = mysql_match(table.c.content,
+                                    against=phrase).in_boolean_mode()
+                condition = score > 0
+            rows = db.session.execute(
+                db.select(key, table.c.content, score.label('score'))
+                .select_from(table).where(condition)
+                .order_by(db.desc('score')).limit(limit)
+            ).all()
+            results += [{'kind': name, 'id': row_id, 'score': float(rank),
+                         'snippet': snippet(content, query)}
+                        for row_id, content, rank in rows]
+        results.sort(key=lambda result: result['score'], reverse=True)
+        return results[:limit]
+
+    def preview(self, kind: str, length: int):
+        """
+        Возвращает выражение начала текста записи из таблицы поиска, чтобы
+        список записей не загружал и не распаковывал тексты целиком.
+
+        Args:
+            kind (str): Вид текстов.
+            length (int): Длина начала текста в символах.
+
+        Returns:
+            Коррелированный подзапрос или NULL, если поиск недоступен.
+        """
+        dialect = self.dialect(db.session)
+        if not self.supported(dialect):
+            return db.null()
+        model = SEARCH_SOURCES[kind][0]
+        table = self.table(kind, dialect)
+        return (db.select(db.func.substr(table.c.content, 1, length))
+                .where(self.key(table) == model.id).scalar_subquery())
+
+    @staticmethod
+    def dialect(connection) -> str:
+        """
+        Возвращает название СУБД соединения или сессии.
+        """
+        if hasattr(connection, 'dialect'):
+            return connection.dialect.name
+        return connection.get_bind(Horoscope.__mapper__).dialect.name
+
+
+def snippet(content: str, query: str) -> str:
+    """
+    Возвращает фрагмент текста вокруг первого вхождения фразы.
+    """
+    position = max(content.lower().find(query.strip().lower()), 0)
+    start = max(position - SNIPPET_LENGTH // 3, 0)
+    text = content[start:start + SNIPPET_LENGTH]
+    return ('…' if start else '') + text + (
+        '…' if start + SNIPPET_LENGTH < len(content) else '')
+
+
+search_index = SearchIndex()
+
+
+def _index_object(kind: str, name: str):
+    def after_insert(mapper, connection, target):
+        if search_index.supported(connection.dialect.name):
+            search_index.index(connection, kind,
+                               [(target.id, getattr(target, name))])
+
+    def after_update(mapper, connection, target):
+        if search_index.supported(connection.dialect.name) and \
+                db.inspect(target).attrs[name].history.has_changes():
+            search_index.index(connection, kind,
+                               [(target.id, getattr(target, name))])
+
+    def after_delete(mapper, connection, target):
+        if search_index.supported(connection.dialect.name):
+            search_index.remove(connection, kind, [target.id])
+
+    return after_insert, after_update, after_delete
+
+
+for _kind, (_model, _name) in SEARCH_SOURCES.items():
+    for _event, _listener in zip(('after_insert', 'after_update',
+                                  'after_delete'),
+                                 _index_object(_kind, _name)):
+        event.listen(_model, _event, _listener)
+
+_KINDS_BY_TABLE = {model.__table__.name: kind
+                   for kind, (model, _) in SEARCH_SOURCES.items()}
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _sync_statement(state):
+    """
+    Обновляет индекс при запросах INSERT и DELETE к исходным таблицам,
+    выполняемых без объектов моделей.
+    """
+    if not (state.is_insert or state.is_delete):
+        return None
+    kind = _KINDS_BY_TABLE.get(getattr(state.statement.table, 'name', None))
+    if kind is None or not search_index.supported(
+            search_index.dialect(state.session)):
+        return None
+    model = SEARCH_SOURCES[kind][0]
+    if state.is_delete:
+        ids = db.select(model.id)
+        if state.statement.whereclause is not None:
+            ids = ids.where(state.statement.whereclause)
+        search_index.remove(state.session, kind, ids)
+        return None
+    result = state.invoke_statement()
+    search_index.catch_up(state.session, kind)
+    return result
+
+
+with app.app_context():
+    with db.engine.begin() as _connection:
+        search_index.create(_connection)
@@ -0,0 +1,40 @@
+document.addEventListener('DOMContentLoaded', function() {
+  var cityInput = document.getElementById('city');
+  var cityOptions = document.getElementById('cityOptions');
+  var latitudeInput = document.getElementById('latitude');
+  var longitudeInput = document.getElementById('longitude');
+  // Последние найденные города по отображаемому названию
+  var found = {};
+
+  function cityLabel(city) {
+    return city.name + ', ' + city.country;
+  }
+
+  cityInput.addEventListener('input', function() {
+    var city = found[cityInput.value];
+    if (city) {
+      // Пользователь выбрал город из списка: сохраняем его координаты
+      cityInput.value = city.name;
+      latitudeInput.value = city.latitude;
+      longitudeInput.value = city.longitude;
+      return;
+    }
+    latitudeInput.value = '';
+    longitudeInput.value = '';
+    if (cityInput.value.length < 2) {
+      return;
+    }
+    fetch(cityInput.dataset.url + '?q=' + encodeURIComponent(cityInput.value))
+      .then(function(response) { return response.json(); })
+      .then(function(data) {
+        found = {};
+        cityOptions.innerHTML = '';
+        data.cities.forEach(function(city) {
+          var option = document.createElement('option');
+          option.value = cityLabel(city);
+          found[option.value] = city;
+          cityOptions.appendChild(option);
+        });
+      });
+  });
+});
@@ -0,0 +1,195 @@
+"""
+Модуль синастрии - расчёта астрологической совместимости пользователей.
+
+Совместимость оценивается по аспектам между планетами двух натальных карт.
+Аспекты определяются по тем же правилам орбиса, что и в натальной карте
+(GetNatalChart2.calculate_aspect), а итоговая оценка складывается из весов
+аспектов: гармоничные аспекты повышают её, напряжённые - понижают.
+
+Для подбора пар реализован пакетный режим на NumPy: один пользователь
+сравнивается со всеми кандидатами за одну векторную операцию.
+
+Классы:
+    Synastry: Синастрия двух натальных карт и пакетная оценка совместимости.
+
+Функции:
+    natal_positions(birthday, birth_time) -> tuple[float, ...]:
+        Рассчитывает положения планет на момент рождения.
+"""
+
+import math
+from datetime import date, datetime, time
+from functools import lru_cache
+
+import numpy as np
+import swisseph as swe
+
+from horoscope_logic import GetAstralData, GetJulianDate
+from horoscope_logic_pro import GetNatalChart2
+from metrics import metrics
+
+# Названия планет в порядке колонок матрицы положений
+PLANETS = [planet[0] for planet in GetAstralData.planets]
+
+
+@lru_cache(maxsize=65536)
+@metrics.timed('ephemeris')
+def natal_positions(birthday: date, birth_time: time) -> tuple:
+    """
+    Рассчитывает положения планет на момент рождения. Место рождения не
+    требуется, так как долготы планет от него не зависят.
+
+    Args:
+        birthday (date): Дата рождения.
+        birth_time (time): Время рождения.
+
+    Returns:
+        Кортеж долгот планет в порядке PLANETS.
+    """
+    jd = GetJulianDate(datetime.combine(birthday, birth_time)).jd
+    return tuple(swe.calc_ut(jd, planet[1])[0][0]
+                 for planet in GetAstralData.planets)
+
+
+class Synastry:
+    """
+    Синастрия двух натальных карт.
+
+    Args:
+        orbis: Орбис аспектов в градусах.
+        aspect_angles: Углы аспектов.
+        aspect_weights: Вклад аспекта в оценку совместимости.
+        personal_weight: Множитель для аспектов между личными планетами.
+        scale: Масштаб перевода суммы весов в оценку от 0 до 100.
+
+    Методы
+    __init__(self, first: dict, second: dict) -> None
+    Инициализирует синастрию по положениям планет двух карт.
+
+    matrix(self) -> dict
+    Возвращает матрицу аспектов между планетами двух карт.
+
+    score(self) -> int
+    Возвращает оценку совместимости от 0 до 100.
+
+    score_many(positions, candidates) -> np.ndarray
+    Оценивает совместимость одной карты с множеством карт за один проход.
+    """
+
+    orbis = 8
+    aspect_angles = {
+        'соединение': 0,
+        'секстиль': 60,
+        'квадрат': 90,
+        'тригон': 120,
+        'оппозиция': 180,
+    }
+    aspect_weights = {
+        'соединение': 1,
+        'секстиль': 2,
+        'квадрат': -2,
+        'тригон': 3,
+        'оппозиция': -1,
+    }
+    personal_weight = 2
+    scale = 20
+
+    def __init__(self, first: dict, second: dict) -> None:
+        """
+        Инициализирует синастрию.
+
+        Args:
+            first (dict): Положения планет первой карты.
+            second (dict): Положения планет второй карты.
+        """
+        self.first = first
+        self.second = second
+
+    @staticmethod
+    def pair_weight(first_planet: str, second_planet: str) -> int:
+        """
+        Возвращает множитель пары планет: аспекты между личными планетами
+        важнее остальных.
+        """
+        personal = GetNatalChart2.personal_planets
+        if first_planet in personal and second_planet in personal:
+            return Synastry.personal_weight
+        return 1
+
+    @classmethod
+    def to_percent(cls, raw: float | np.ndarray) -> int | np.ndarray:
+        """
+        Переводит сумму весов аспектов в оценку от 0 до 100.
+        """
+        if isinstance(raw, np.ndarray):
+            return np.rint(100 / (1 + np.exp(-raw / cls.scale))).astype(int)
+        return round(100 / (1 + math.exp(-raw / cls.scale)))
+
+    def matrix(self) -> dict:
+        """
+        Рассчитывает аспекты между каждой планетой первой карты и каждой
+        планетой второй карты.
+
+        Returns:
+            Словарь {(планета первой карты, планета второй карты): аспект}
+            только для пар, между которыми есть аспект.
+        """
+        result = {}
+        for first_planet, first_position in self.first.items():
+            for second_planet, second_position in self.second.items():
+                aspect = GetNatalChart2.calculate_aspect(
+                    first_position, second_position, self.orbis)
+                if aspect:
+                    result[(first_planet, second_planet)] = aspect
+        return result
+
+    def score(self) -> int:
+        """
+        Оценивает совместимость по сумме весов аспектов. Оценка
+        рассчитывается через score_many, поэтому совпадает с оценкой в
+        подборе пар.
+
+        Returns:
+            Оценка совместимости от 0 до 100.
+        """
+        first = [self.first[planet] for planet in PLANETS]
+        second = [self.second[planet] for planet in PLANETS]
+        return int(self.score_many(first, [second])[0])
+
+    @classmethod
+    def weights(cls) -> np.ndarray:
+        """
+        Возвращает матрицу множителей пар планет в порядке PLANETS.
+        """
+        return np.array([[cls.pair_weight(first, second) for second in PLANETS]
+                         for first in PLANETS], dtype=np.float64)
+
+    @classmethod
+    def score_many(cls, positions, candidates) -> np.ndarray:
+        """
+        Оценивает совместимость одной карты с множеством карт за один
+        векторный проход. Положения сравниваются с точностью float32, с
+        которой они хранятся в двоичных записях натальных карт, поэтому
+        оценка не зависит от того, рассчитаны положения заново или
+        прочитаны из записи.
+
+        Args:
+            positions: Положения планет карты (в порядке PLANETS).
+            candidates: Матрица положений планет кандидатов размером
+                        (количество кандидатов, len(PLANETS)).
+
+        Returns:
+            Массив оценок совместимости от 0 до 100 для каждого кандидата.
+        """
+        positions = np.asarray(positions, dtype=np.float32).astype(np.float64)
+        candidates = np.asarray(candidates,
+                                dtype=np.float32).astype(np.float64)
+        difference = np.abs(
+            positions[None, :, None] - candidates[:, None, :]) % 360
+        difference = np.where(difference > 180, 360 - difference, difference)
+        raw = np.zeros(difference.shape, dtype=np.float64)
+        for aspect, angle in cls.aspect_angles.items():
+            hit = np.abs(difference - angle) <= cls.orbis
+            raw += hit * cls.aspect_weights[aspect]
+        raw = (raw * cls.weights()).sum(axis=(1, 2))
+        return cls.to_percent(raw)
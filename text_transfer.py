@@ -0,0 +1,138 @@
+"""
+Модуль переноса созданных текстов между окружениями.
+
+Гороскопы, натальные карты и прогнозы транзитов выгружаются в файлы JSON
+Lines, сжатые gzip, и загружаются из них командами
+`flask --app controller texts-export` и `flask --app controller
+texts-import`, например чтобы наполнить тестовое окружение текстами с
+рабочего. Строки читаются пачками через курсор на стороне сервера и
+добавляются пачками одним запросом executemany, поэтому потребление памяти
+не зависит от размера таблицы.
+
+Идентификаторы пользователей в окружениях различаются, поэтому тексты
+пользователей выгружаются с логином пользователя, а при загрузке
+привязываются к пользователю с тем же логином. Тексты пользователей, которых
+нет в окружении, и тексты, которые уже есть в таблице, пропускаются. Тексты
+выгружаются несжатыми и сжимаются при загрузке словарём окружения.
+
+Функции:
+    export_texts(table, path, batch_size):
+        Выгружает таблицу в файл.
+
+    import_texts(table, path, batch_size):
+        Загружает таблицу из файла.
+
+Атрибуты:
+    TRANSFER_TABLES (dict): Переносимые таблицы по названиям.
+"""
+
+import gzip
+import json
+from datetime import date, datetime
+
+from app import db
+from models import DataAccess, Horoscope, User, UserNatalChart, UserTranzit
+
+TRANSFER_TABLES = {
+    'horoscope': Horoscope,
+    'natal_chart': UserNatalChart,
+    'tranzit': UserTranzit,
+}
+
+# Столбцы, значения которых не переносятся между окружениями
+SKIPPED_COLUMNS = ('id', 'user_id')
+
+dataAccess = DataAccess()
+
+
+def transfer_columns(model) -> list:
+    """
+    Возвращает переносимые столбцы таблицы.
+    """
+    return [column for column in model.__table__.columns
+            if column.name not in SKIPPED_COLUMNS]
+
+
+def export_texts(table: str, path: str, batch_size: int = 1000):
+    """
+    Выгружает строки таблицы в файл JSON Lines, сжатый gzip.
+
+    Args:
+        table (str): Название таблицы из TRANSFER_TABLES.
+        path (str): Путь к файлу.
+        batch_size (int): Количество строк в одной пачке.
+
+    Yields:
+        Количество строк в выгруженной пачке.
+    """
+    model = TRANSFER_TABLES[table]
+    columns = transfer_columns(model)
+    statement = db.select(*columns).order_by(model.id)
+    if 'user_id' in model.__table__.columns:
+        statement = statement.add_columns(User.login).join(
+            User, User.id == model.user_id)
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        for rows in dataAccess.stream_rows(statement, batch_size):
+            for row in rows:
+                file.write(json.dumps(dict(row), ensure_ascii=False,
+                                      default=_isoformat) + '\n')
+            yield len(rows)
+
+
+def import_texts(table: str, path: str, batch_size: int = 1000):
+    """
+    Загружает строки таблицы из файла JSON Lines, сжатого gzip.
+
+    Args:
+        table (str): Название таблицы из TRANSFER_TABLES.
+        path (str): Путь к файлу.
+        batch_size (int): Количество строк в одной пачке.
+
+    Yields:
+        Кортеж (количество прочитанных строк, количество строк, пропущенных
+        из-за отсутствия пользователя) для каждой пачки.
+    """
+    model = TRANSFER_TABLES[table]
+    parsers = {column.name: _parser(column)
+               for column in transfer_columns(model)}
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        batch = []
+        for line in file:
+            batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                yield _import_batch(model, parsers, batch)
+                batch = []
+        if batch:
+            yield _import_batch(model, parsers, batch)
+
+
+def _import_batch(model, parsers: dict, batch: list) -> tuple:
+    rows = [{name: parse(record.get(name)) for name, parse in parsers.items()}
+            for record in batch]
+    skipped = 0
+    if 'user_id' in model.__table__.columns:
+        user_ids = dataAccess.get_user_ids(record['login'] for record in batch)
+        linked = []
+        for row, record in zip(rows, batch):
+            if record['login'] in user_ids:
+                row['user_id'] = user_ids[record['login']]
+                linked.append(row)
+        skipped = len(rows) - len(linked)
+        rows = linked
+    if rows:
+        dataAccess.add_rows(model, rows)
+    return len(batch), skipped
+
+
+def _isoformat(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def _parser(column):
+    if isinstance(column.type, db.DateTime):
+        return lambda value: value and datetime.fromisoformat(value)
+    if isinstance(column.type, db.Date):
+        return lambda value: value and date.fromisoformat(value)
+    return lambda value: value
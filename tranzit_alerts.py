@@ -0,0 +1,207 @@
+"""
+Модуль ночного расчёта точных личных транзитов пользователей.
+
+Положения транзитных планет рассчитываются один раз на весь период, а
+натальные положения загружаются из двоичных записей карт (natal_snapshot),
+после чего для каждого пользователя с заполненными датой и временем рождения
+находятся моменты точных аспектов транзитных планет к его личным планетам.
+Пользователи обрабатываются пачками в нескольких процессах, а результаты
+сохраняются в таблицу с индексом по (user_id, date), так что список
+транзитов на сегодня выбирается одним запросом. Транзиты каждой пачки
+пользователей заменяются одной транзакцией: во время расчёта пользователи
+видят прежние транзиты, а не пустой список.
+
+Запуск (например, из cron каждую ночь):
+    flask --app controller tranzit-alerts --days 31
+
+Функции:
+    transit_ephemeris(start, days) -> np.ndarray:
+        Рассчитывает положения транзитных планет на каждый день периода.
+
+    exact_transits(natal, ephemeris, start) -> list[tuple]:
+        Находит точные аспекты транзитных планет к натальным планетам.
+
+    chunk_transits(users, ephemeris, start) -> list[dict]:
+        Рассчитывает транзиты для пачки пользователей.
+
+    build_tranzit_alerts(start, days, chunk_size, workers) -> int:
+        Рассчитывает и сохраняет транзиты всех пользователей.
+
+    build_user_tranzit_alerts(user, start, days) -> int:
+        Пересчитывает транзиты одного пользователя.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+
+import numpy as np
+import swisseph as swe
+
+from horoscope_logic import GetAstralData
+from horoscope_logic_pro import TranzitMonth
+from metrics import metrics
+from models import DataAccess
+from natal_snapshot import load_snapshots
+from synastry import PLANETS, natal_positions
+
+# Транзитные и натальные планеты, как в месячном прогнозе транзитов
+TRANZIT_PLANETS = [planet for planet, _ in TranzitMonth.tranzit_planets]
+NATAL_PLANETS = TranzitMonth.personal_planets
+NATAL_INDEXES = [PLANETS.index(planet) for planet in NATAL_PLANETS]
+
+# Точные аспекты: угол со знаком (транзитная планета до или после натальной)
+ASPECTS = {
+    0: 'соединение',
+    60: 'секстиль', -60: 'секстиль',
+    90: 'квадрат', -90: 'квадрат',
+    120: 'тригон', -120: 'тригон',
+    180: 'оппозиция',
+}
+
+dataAccess = DataAccess()
+
+
+@metrics.timed('ephemeris')
+def transit_ephemeris(start: date, days: int) -> np.ndarray:
+    """
+    Рассчитывает положения транзитных планет в полночь UTC каждого дня
+    периода (включая день после последнего), так что расчёт покрывает
+    период целиком: от начала первого дня до конца последнего.
+
+    Args:
+        start (date): Первый день периода.
+        days (int): Количество дней.
+
+    Returns:
+        Массив долгот размером (days + 1, len(TRANZIT_PLANETS)).
+    """
+    identifiers = dict(GetAstralData.planets)
+    first = swe.julday(start.year, start.month, start.day, 0.0)
+    return np.array([
+        [swe.calc_ut(first + day, identifiers[planet])[0][0]
+         for planet in TRANZIT_PLANETS]
+        for day in range(days + 1)
+    ])
+
+
+def exact_transits(natal: np.ndarray, ephemeris: np.ndarray,
+                   start: date) -> list:
+    """
+    Находит точные аспекты транзитных планет к натальным планетам.
+    Для каждого угла аспекта отклонение от точного аспекта меняет знак
+    между соседними днями, а момент точного аспекта уточняется линейной
+    интерполяцией внутри суток.
+
+    Args:
+        natal (np.ndarray): Долготы натальных планет (NATAL_PLANETS).
+        ephemeris (np.ndarray): Результат transit_ephemeris.
+        start (date): Первый день периода.
+
+    Returns:
+        Список кортежей (момент, натальная планета, транзитная планета,
+        аспект).
+    """
+    angles = np.array(list(ASPECTS), dtype=np.float64)
+    # Отклонение от точного аспекта: (дни, транзитные, натальные, аспекты)
+    separation = ephemeris[:, :, None, None] - natal[None, None, :, None]
+    deviation = (separation - angles + 180) % 360 - 180
+    before, after = deviation[:-1], deviation[1:]
+    crossing = ((np.signbit(before) != np.signbit(after))
+                & (np.abs(before) < 90) & (np.abs(after) < 90))
+    result = []
+    midnight = datetime.combine(start, datetime.min.time())
+    for day, tranzit, planet, aspect in zip(*np.nonzero(crossing)):
+        first = before[day, tranzit, planet, aspect]
+        fraction = first / (first - after[day, tranzit, planet, aspect])
+        moment = midnight + timedelta(days=float(day + fraction))
+        result.append((moment.replace(microsecond=0),
+                       NATAL_PLANETS[planet],
+                       TRANZIT_PLANETS[tranzit],
+                       ASPECTS[int(angles[aspect])]))
+    return result
+
+
+def chunk_transits(users: list, ephemeris: np.ndarray, start: date) -> list:
+    """
+    Рассчитывает транзиты для пачки пользователей. Выполняется в отдельном
+    процессе и не обращается к базе данных.
+
+    Args:
+        users (list): Кортежи (id, долготы натальных планет NATAL_PLANETS).
+        ephemeris (np.ndarray): Результат transit_ephemeris.
+        start (date): Первый день периода.
+
+    Returns:
+        Список словарей с полями записи UserTranzitAlert.
+    """
+    rows = []
+    for user_id, natal in users:
+        for moment, natal_planet, tranzit_planet, aspect in exact_transits(
+                natal, ephemeris, start):
+            rows.append({
+                'user_id': user_id,
+                'date': moment.date(),
+                'moment': moment,
+                'natal_planet': natal_planet,
+                'tranzit_planet': tranzit_planet,
+                'aspect': aspect,
+            })
+    return rows
+
+
+def build_tranzit_alerts(start: date, days: int = 31, chunk_size: int = 500,
+                         workers: int | None = None) -> int:
+    """
+    Рассчитывает точные транзиты всех пользователей с заполненными данными
+    рождения и заменяет ими ранее сохранённые транзиты периода.
+
+    Args:
+        start (date): Первый день периода.
+        days (int): Количество дней.
+        chunk_size (int): Количество пользователей в одной пачке.
+        workers (int): Количество процессов, по умолчанию по числу ядер.
+
+    Returns:
+        Количество сохранённых транзитов.
+    """
+    ephemeris = transit_ephemeris(start, days)
+    # Натальные положения берутся из двоичных записей карт одним массивом
+    rows, snapshots = load_snapshots()
+    natal = snapshots['positions'][:, NATAL_INDEXES].astype(np.float64)
+    users = list(zip((row.id for row in rows), natal))
+    chunks = [users[i:i + chunk_size]
+              for i in range(0, len(users), chunk_size)]
+    end = start + timedelta(days=days)
+    total = 0
+    worker = partial(chunk_transits, ephemeris=ephemeris, start=start)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for chunk, rows in zip(chunks, pool.map(worker, chunks)):
+            rows = [row for row in rows if row['date'] < end]
+            dataAccess.replace_tranzit_alerts(
+                [user_id for user_id, _ in chunk], start, end, rows)
+            total += len(rows)
+    return total
+
+
+def build_user_tranzit_alerts(user, start: date, days: int = 31) -> int:
+    """
+    Пересчитывает транзиты одного пользователя, например после изменения
+    его данных рождения, не дожидаясь ночного расчёта.
+
+    Args:
+        user (User): Пользователь с заполненными датой и временем рождения.
+        start (date): Первый день периода.
+        days (int): Количество дней.
+
+    Returns:
+        Количество сохранённых транзитов.
+    """
+    end = start + timedelta(days=days)
+    natal = np.array(natal_positions(user.birthday, user.birth_time))
+    rows = chunk_transits([(user.id, natal[NATAL_INDEXES])],
+                          transit_ephemeris(start, days), start)
+    rows = [row for row in rows if row['date'] < end]
+    dataAccess.replace_tranzit_alerts([user.id], start, end, rows)
+    return len(rows)
@@ -0,0 +1,229 @@
+"""
+Модуль массового импорта пользователей.
+
+Пользователи загружаются из файла CSV командой
+`flask --app controller users-import`, например при переносе базы
+пользователей партнёра. Файл читается пачками, и для каждой пачки:
+    - форматы логина, электронной почты и пароля проверяются теми же
+      регулярными выражениями, что и при регистрации, а длина полей - по
+      длине столбцов таблицы пользователей;
+    - уникальность логинов и адресов проверяется одним запросом на всю
+      пачку, а повторы внутри файла - по уже прочитанным строкам;
+    - пароли хешируются параллельно в пуле процессов с параметрами
+      PASSWORD_HASH_METHOD;
+    - пользователи добавляются одной транзакцией.
+
+Строки, не прошедшие проверку, не прерывают импорт, а записываются в отчёт
+CSV с номером строки и причиной отказа.
+
+Первая строка файла содержит названия столбцов. Обязательные столбцы:
+login, email, password; необязательные - остальные поля профиля из
+IMPORTED_FIELDS. Дата рождения указывается в формате YYYY-MM-DD, время
+рождения - HH:MM.
+
+Классы:
+    UserImport: Импорт пользователей из файла CSV.
+
+Функции:
+    user_values(row, password_hash) -> dict:
+        Преобразует строку файла в значения столбцов пользователя.
+
+Атрибуты:
+    IMPORTED_FIELDS (tuple): Поля пользователя, загружаемые из файла.
+"""
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from werkzeug.security import generate_password_hash
+from zodiac_sign import get_zodiac_sign
+
+from models import (EMAIL_PATTERN, LOGIN_PATTERN, PASSWORD_PATTERN, DataAccess,
+                    User)
+from passwords import password_hasher
+
+REQUIRED_FIELDS = ('login', 'email', 'password')
+IMPORTED_FIELDS = REQUIRED_FIELDS + (
+    'name', 'surname', 'patronymic', 'birthday', 'birth_time', 'country',
+    'city', 'phone', 'sex',
+)
+REJECT_FIELDS = ('line', 'login', 'email', 'reason')
+
+# Максимальная длина строковых полей по столбцам таблицы пользователей.
+# Пароль сохраняется в виде хеша, поэтому его длина не ограничивается.
+FIELD_LENGTHS = {
+    field: User.__table__.c[field].type.length
+    for field in IMPORTED_FIELDS
+    if field != 'password'
+    and getattr(User.__table__.c[field].type, 'length', None)
+}
+
+dataAccess = DataAccess()
+
+
+class UserImport:
+    """
+    Импорт пользователей из файла CSV.
+
+    Args:
+        batch_size (int): Количество пользователей в одной пачке.
+        workers (int): Количество процессов хеширования паролей, по
+                       умолчанию по числу ядер.
+
+    Методы:
+        run(self, path, rejects_path):
+            Импортирует пользователей из файла.
+
+        validate(self, row) -> str | None:
+            Проверяет формат полей пользователя.
+    """
+
+    def __init__(self, batch_size: int = 1000,
+                 workers: int | None = None) -> None:
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count()
+        self._seen_logins = set()
+        self._seen_emails = set()
+
+    def run(self, path: str, rejects_path: str):
+        """
+        Импортирует пользователей из файла.
+
+        Args:
+            path (str): Путь к файлу CSV.
+            rejects_path (str): Путь к файлу отчёта об отклонённых строках.
+
+        Yields:
+            Кортеж (количество прочитанных строк, количество добавленных
+            пользователей) для каждой пачки.
+
+        Raises:
+            ValueError: Если в файле нет обязательных столбцов.
+        """
+        with open(path, newline='', encoding='utf-8-sig') as source, \
+                open(rejects_path, 'w', newline='',
+                     encoding='utf-8') as rejects_file, \
+                ProcessPoolExecutor(max_workers=self.workers) as pool:
+            reader = csv.DictReader(source)
+            missing = set(REQUIRED_FIELDS) - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(
+                    f'В файле нет столбцов: {", ".join(sorted(missing))}')
+            rejects = csv.DictWriter(rejects_file, REJECT_FIELDS)
+            rejects.writeheader()
+            batch = []
+            # Номер строки файла с учётом строки заголовка
+            for line, row in enumerate(reader, start=2):
+                batch.append((line, row))
+                if len(batch) == self.batch_size:
+                    yield self._import_batch(batch, pool, rejects)
+                    batch = []
+            if batch:
+                yield self._import_batch(batch, pool, rejects)
+
+    def validate(self, row: dict) -> str | None:
+        """
+        Проверяет формат полей пользователя.
+
+        Args:
+            row (dict): Строка файла.
+
+        Returns:
+            str | None: Причина отказа или None, если строка корректна.
+        """
+        if not LOGIN_PATTERN.match(row['login']):
+            return 'неверный формат логина'
+        if not EMAIL_PATTERN.match(row['email']):
+            return 'неверный формат почты'
+        if not PASSWORD_PATTERN.match(row['password']):
+            return 'неверный формат пароля'
+        for field, length in FIELD_LENGTHS.items():
+            if len(row.get(field) or '') > length:
+                return f'поле {field} длиннее {length} символов'
+        try:
+            if row.get('birthday'):
+                datetime.strptime(row['birthday'], '%Y-%m-%d')
+            if row.get('birth_time'):
+                datetime.strptime(row['birth_time'], '%H:%M')
+        except ValueError:
+            return 'неверный формат даты или времени рождения'
+        return None
+
+    def _import_batch(self, batch: list, pool: ProcessPoolExecutor,
+                      rejects: csv.DictWriter) -> tuple:
+        def reject(line, row, reason):
+            rejects.writerow({'line': line, 'login': row.get('login'),
+                              'email': row.get('email'), 'reason': reason})
+
+        valid = []
+        for line, row in batch:
+            row = {field: (row.get(field) or '').strip()
+                   for field in IMPORTED_FIELDS}
+            reason = self.validate(row)
+            # Уникальность в MySQL проверяется без учёта регистра
+            login, email = row['login'].casefold(), row['email'].casefold()
+            if reason is None and login in self._seen_logins:
+                reason = 'логин повторяется в файле'
+            elif reason is None and email in self._seen_emails:
+                reason = 'почта повторяется в файле'
+            if reason:
+                reject(line, row, reason)
+                continue
+            self._seen_logins.add(login)
+            self._seen_emails.add(email)
+            valid.append((line, row))
+
+        taken_logins, taken_emails = dataAccess.get_taken_logins(
+            (row['login'] for _, row in valid),
+            (row['email'] for _, row in valid))
+        unique = []
+        for line, row in valid:
+            if row['login'].casefold() in taken_logins:
+                reject(line, row, 'такой пользователь уже существует')
+            elif row['email'].casefold() in taken_emails:
+                reject(line, row, 'пользователь с таким E-mail уже есть')
+            else:
+                unique.append((line, row))
+
+        hashes = pool.map(partial(generate_password_hash,
+                                  method=password_hasher.method),
+                          (row['password'] for _, row in unique),
+                          chunksize=max(1, len(unique) // self.workers))
+        users = [user_values(row, password_hash)
+                 for (_, row), password_hash in zip(unique, hashes)]
+        lines = {user['login']: line
+                 for (line, _), user in zip(unique, users)}
+        rejected = dataAccess.add_users(users) if users else []
+        for user, reason in rejected:
+            reject(lines[user['login']], user, reason)
+        return len(batch), len(users) - len(rejected)
+
+
+def user_values(row: dict, password_hash: str) -> dict:
+    """
+    Преобразует проверенную строку файла в значения столбцов пользователя.
+
+    Args:
+        row (dict): Строка файла.
+        password_hash (str): Хеш пароля.
+
+    Returns:
+        Словарь значений столбцов пользователя.
+    """
+    values = {field: value or None for field, value in row.items()}
+    values['password'] = password_hash
+    if values['birthday']:
+        values['birthday'] = datetime.strptime(values['birthday'],
+                                               '%Y-%m-%d').date()
+        values['zodiac_sign'] = get_zodiac_sign(values['birthday'])
+    if values['birth_time']:
+        values['birth_time'] = datetime.strptime(values['birth_time'],
+                                                 '%H:%M').time()
+    if values['city']:
+        coordinates = dataAccess.city_coordinates({'city': values['city']})
+        values['latitude'] = coordinates and coordinates['latitude']
+        values['longitude'] = coordinates and coordinates['longitude']
+    return values